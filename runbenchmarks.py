@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Benchmarks of AP comparison and XML rendering hot paths.
+
+Every case runs on synthetic data generated by wlcmanager.simulator in a
+forked process so peak memory of one case does not hide another. Time
+is the best of --repeat runs, memory is growth of the peak resident set
+size (kB) and queries is the number of DB queries of a single run.
+
+    python runbenchmarks.py --save baseline.json
+    python runbenchmarks.py --compare baseline.json
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+try:
+    from django.conf import settings
+
+    import django
+
+    settings.configure(
+        DEBUG=False,
+        USE_TZ=True,
+        DATABASES={
+            "default": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": ":memory:",
+            }
+        },
+        INSTALLED_APPS=[
+            "django.contrib.auth",
+            "django.contrib.contenttypes",
+            "django.contrib.sites",
+            "wlcmanager",
+        ],
+        TEMPLATES=[{
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "APP_DIRS": True,
+        }],
+        SITE_ID=1,
+        MIDDLEWARE_CLASSES=(),
+        WLCMANAGER_CONNECTION_FACTORY="wlcmanager.simulator.connect",
+        # Measure the RPC path, not the cache
+        WLCMANAGER_RPC_CACHE_TTL=0,
+    )
+
+    try:
+        setup = django.setup
+    except AttributeError:
+        pass
+    else:
+        setup()
+except ImportError:
+    import traceback
+    traceback.print_exc()
+    raise ImportError("To fix this error, run: pip install -r "
+                      "requirements-test.txt")
+
+from django.core.management import call_command  # noqa
+from django.db import connection  # noqa
+from django.test.utils import CaptureQueriesContext  # noqa
+
+from wlcmanager import cache as rpc_cache  # noqa
+from wlcmanager import simulator  # noqa
+from wlcmanager.connections import pool as connection_pool  # noqa
+from wlcmanager.models import (AccessPoint, RadioProfile, WLC,  # noqa
+                               ap_config_digest)
+from wlcmanager.utils import DEFAULT_MATCH_KEYS, ppxml, xml_compare  # noqa
+
+SIZES = [100, 1000, 10000, 50000]
+
+# Every MISMATCH_EVERY-th AP differs between DB and WLC
+MISMATCH_EVERY = 10
+
+CACHED_TTL = 3600
+
+
+class Fixture(object):
+    """Synthetic fleet of size APs, in DB and on a simulated WLC"""
+
+    def __init__(self, size):
+        self.size = size
+        RadioProfile.objects.get_or_create(name='default')
+        AccessPoint.objects.all().delete()
+        aps = list(simulator.generate_access_points(size))
+        for ap in aps[::MISMATCH_EVERY]:
+            ap.name += '-db'
+            ap.config_digest = ap_config_digest(ap)
+        AccessPoint.objects.bulk_create(aps)
+
+        self.wlc, created = WLC.objects.get_or_create(
+            name='BENCH', defaults=dict(ip_address='10.0.0.1',
+                                        username='bench',
+                                        password='bench'))
+        simulator.register(self.wlc.ip_address,
+                           simulator.FakeWLC(daps=size))
+        connection_pool.invalidate(self.wlc.pk)
+        self.wlc.sync_inventory()
+        # Warm cache for the cached case, others bypass it (TTL 0)
+        rpc_cache.cached_call(self.wlc.pk, 'get_dap',
+                              lambda: self.wlc.connection.rpc.get_dap(),
+                              ttl=CACHED_TTL)
+        self.daps = self.wlc.get_aps()
+        self.daps_other = self.wlc.get_aps()
+        self.db_aps = WLC.load_db_aps()
+        self.pairs = [(self.db_aps[int(dap.attrib['apnum'])], dap)
+                      for dap in self.daps]
+        # check_aps() compares DapRecords
+        self.record_pairs = [(self.db_aps[dap.number], dap)
+                             for dap in self.wlc.get_aps(records=True)]
+
+
+def bench_compare(fx):
+    for ap, dap in fx.record_pairs:
+        ap.compare(dap)
+
+
+def bench_render_xml(fx):
+    for ap, dap in fx.pairs:
+        ap.render_xml()
+
+
+def bench_build_xml(fx):
+    for ap, dap in fx.pairs:
+        ap.build_xml()
+
+
+def bench_xml_compare(fx):
+    xml_compare(fx.daps, fx.daps_other, keys=DEFAULT_MATCH_KEYS)
+
+
+def bench_ppxml(fx):
+    ppxml(fx.daps)
+
+
+def bench_check_aps(fx):
+    fx.wlc.check_aps()
+
+
+def bench_check_aps_cached(fx):
+    # Cases run in forked children, this does not leak to other cases
+    rpc_cache.RPC_CACHE_TTL = CACHED_TTL
+    fx.wlc.check_aps()
+
+
+def bench_check_aps_inventory(fx):
+    fx.wlc.check_aps(inventory=True)
+
+
+CASES = [
+    ('AccessPoint.compare', bench_compare),
+    ('AccessPoint.render_xml', bench_render_xml),
+    ('AccessPoint.build_xml', bench_build_xml),
+    ('utils.xml_compare', bench_xml_compare),
+    ('utils.ppxml', bench_ppxml),
+    ('WLC.check_aps', bench_check_aps),
+    ('WLC.check_aps cached', bench_check_aps_cached),
+    ('WLC.check_aps inventory', bench_check_aps_inventory),
+]
+
+
+def measure(func, fixture, repeat):
+    """Run func in a forked child, return its measurements"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 0
+        try:
+            rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            times = []
+            with CaptureQueriesContext(connection) as queries:
+                start = time.time()
+                func(fixture)
+                times.append(time.time() - start)
+            for i in range(repeat - 1):
+                start = time.time()
+                func(fixture)
+                times.append(time.time() - start)
+            rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            result = dict(time=min(times), mean=sum(times) / len(times),
+                          memory=rss_peak - rss_start,
+                          queries=len(queries))
+        except Exception as e:
+            result = dict(error='{}: {}'.format(type(e).__name__, e))
+            status = 1
+        with io.open(write_fd, 'wb') as f:
+            f.write(json.dumps(result).encode('utf-8'))
+        os._exit(status)
+
+    os.close(write_fd)
+    with io.open(read_fd, 'rb') as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data.decode('utf-8'))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, cases, repeat):
+    results = []
+    for size in sizes:
+        fixture = Fixture(size)
+        for name, func in CASES:
+            if cases and name not in cases:
+                continue
+            res = measure(func, fixture, repeat)
+            res.update(case=name, size=size)
+            results.append(res)
+            print_result(res)
+    return results
+
+
+def print_result(res, baseline=None):
+    if 'error' in res:
+        print('{case:<24} {size:>6}  ERROR {error}'.format(**res))
+        return
+    line = ('{case:<24} {size:>6} {time:>10.4f}s {memory:>9}kB '
+            '{queries:>5}q'.format(**res))
+    if baseline and 'time' in baseline:
+        line += '  x{:.2f}'.format(res['time'] / max(baseline['time'],
+                                                     1e-9))
+    print(line)
+
+
+def compare(results, baseline, threshold):
+    """Print results against baseline, return list of regressions"""
+    by_key = {(b['case'], b['size']): b for b in baseline['results']}
+    regressions = []
+    print('\nCompared with {} ({}):'.format(baseline.get('revision'),
+                                            baseline.get('created')))
+    for res in results:
+        base = by_key.get((res['case'], res['size']))
+        print_result(res, base)
+        if not base or 'time' not in base or 'time' not in res:
+            continue
+        if (res['time'] > base['time'] * threshold or
+                res['queries'] > base['queries']):
+            regressions.append(res)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--case', action='append', dest='cases',
+                        choices=[name for name, func in CASES],
+                        help='Run only given case (repeatable)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='FILE',
+                        help='Write results as JSON baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Compare results with JSON baseline, exit '
+                             'with 1 on regression')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Slowdown ratio reported as regression')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0, interactive=False)
+    print('{:<24} {:>6} {:>11} {:>11} {:>6}'.format(
+        'case', 'APs', 'time', 'memory', 'DB'))
+    results = run(args.sizes, args.cases, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            f.write(json.dumps(dict(
+                revision=git_revision(),
+                created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                python=platform.python_version(),
+                django=django.get_version(),
+                results=results,
+            ), indent=2, sort_keys=True))
+
+    if args.compare:
+        with io.open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n{} regression(s)'.format(len(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,13 +20,27 @@ try:
                 "ENGINE": "django.db.backends.sqlite3",
             }
         },
-        ROOT_URLCONF="wlcmanager.urls",
+        ROOT_URLCONF="wlcmanager.tests.urls",
         INSTALLED_APPS=[
+            "django.contrib.admin",
             "django.contrib.auth",
             "django.contrib.contenttypes",
+            "django.contrib.messages",
+            "django.contrib.sessions",
             "django.contrib.sites",
             "wlcmanager",
         ],
+        TEMPLATES=[{
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "APP_DIRS": True,
+            "OPTIONS": {
+                "context_processors": [
+                    "django.contrib.auth.context_processors.auth",
+                    "django.template.context_processors.request",
+                ],
+            },
+        }],
+        STATIC_URL="/static/",
         SITE_ID=1,
         NOSE_ARGS=['-s'],
         MIDDLEWARE_CLASSES=(),
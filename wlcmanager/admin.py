@@ -1,17 +1,93 @@
 # coding: utf-8
 
+import collections
+
+from django.conf import settings
 from django.conf.urls import url
 from django.contrib import admin
 from django.contrib import messages
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.http import (HttpResponseRedirect, HttpResponseNotAllowed,
-                         HttpResponseBadRequest)
+                         HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.template import loader
 from django.template.response import TemplateResponse
-
-
-from .models import WLC, AutoAccessPoint, AccessPoint, RadioProfile
-from .utils import compare_config, get_free_from_sequence, run_each_context
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+
+from .metrics import metrics
+from .models import (WLC, AutoAccessPoint, AccessPoint, RadioProfile,
+                     CheckRun, CheckResult, WLCInventory, RPC_TIMEOUT,
+                     SYNC_BATCH_SIZE)
+from .utils import chunks, compare_config, fan_out, run_each_context
+
+try:
+    REFRESH_WORKERS = settings.WLCMANAGER_REFRESH_WORKERS
+except AttributeError:
+    REFRESH_WORKERS = 8
+
+try:
+    COMPARE_WORKERS = settings.WLCMANAGER_COMPARE_WORKERS
+except AttributeError:
+    COMPARE_WORKERS = 6
+
+try:
+    SAVE_CHUNK_SIZE = settings.WLCMANAGER_SAVE_CHUNK_SIZE
+except AttributeError:
+    SAVE_CHUNK_SIZE = 50
+
+try:
+    CHECK_PAGE_SIZE = settings.WLCMANAGER_CHECK_PAGE_SIZE
+except AttributeError:
+    CHECK_PAGE_SIZE = 100
+
+try:
+    FLEET_CHECK_WORKERS = settings.WLCMANAGER_FLEET_CHECK_WORKERS
+except AttributeError:
+    FLEET_CHECK_WORKERS = 8
+
+# Placeholders splitting streamed check_aps page around the AP rows
+ROWS_MARKER = mark_safe('<!-- wlcmanager:rows -->')
+FORMS_MARKER = mark_safe('<!-- wlcmanager:forms -->')
+
+
+def check_filters(request):
+    """Parse result, q and sort parameters of check_aps views.
+
+    Returns:
+        Tuple (results, search, sort), results is None for all results.
+    """
+    results = [r for r in request.GET.getlist('result')
+               if r in CheckResult.RESULTS] or None
+    search = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort', 'number')
+    if sort.lstrip('-') not in CheckResult.SORT_FIELDS:
+        sort = 'number'
+    return results, search, sort
+
+
+def query_without(request, *names):
+    query = request.GET.copy()
+    for name in names:
+        query.pop(name, None)
+    return query.urlencode()
+
+
+def fleet_row_json(row):
+    """JSON serializable summary and problems of one fleet_check row"""
+    aps = []
+    for apnum, res in row['problems'].items():
+        cmp_res = res.get('cmp_res') or {}
+        aps.append(dict(
+            number=apnum, result=res['result'], name=res['name'],
+            serial_number=res['serial_number'],
+            diff={k: {'wlc': v['e_val'], 'db': v['o_val']}
+                  for k, v in cmp_res.items() if not v['equal']}))
+    return dict(id=row['wlc'].pk, name=row['wlc'].name,
+                error=row['error'], aps=aps, **row['counts'])
 
 
 class WLCAdmin(admin.ModelAdmin):
@@ -39,6 +115,18 @@ class WLCAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.compare_config_view)),
             url(r'check_aps/(?P<wlc_id>[0-9]+)',
                 self.admin_site.admin_view(self.check_aps_view)),
+            url(r'^rpc_metrics/$',
+                self.admin_site.admin_view(self.rpc_metrics_view),
+                name='wlcmanager-rpc-metrics'),
+            url(r'^fleet_check/$',
+                self.admin_site.admin_view(self.fleet_check_view),
+                name='wlcmanager-fleet-check'),
+            url(r'rerun_check/(?P<wlc_id>[0-9]+)',
+                self.admin_site.admin_view(self.rerun_check_view),
+                name='wlcmanager-rerun-check'),
+            url(r'sync_inventory/(?P<wlc_id>[0-9]+)',
+                self.admin_site.admin_view(self.sync_inventory_view),
+                name='wlcmanager-sync-inventory'),
             url(r'delete_ap/(?P<wlc_id>[0-9]+)',
                 self.admin_site.admin_view(self.delete_ap_view),
                 name='wlcmanager-delete-ap'),
@@ -58,7 +146,11 @@ class WLCAdmin(admin.ModelAdmin):
         master_wlc = None
         try:
             master_wlc = WLC.objects.get(master__exact=True)
-            res = compare_config(wlc, master_wlc)
+            if 'refresh' in request.GET:
+                wlc.invalidate_rpc_cache()
+                master_wlc.invalidate_rpc_cache()
+            res = compare_config(wlc, master_wlc, workers=COMPARE_WORKERS,
+                                 timeout=RPC_TIMEOUT)
         except RuntimeError as e:
             msg = "Error while fetching data: {}"
             self.message_user(request, msg.format(e),
@@ -86,8 +178,41 @@ class WLCAdmin(admin.ModelAdmin):
 
     def check_aps_view(self, request, wlc_id):
         wlc = get_object_or_404(WLC, pk=wlc_id)
-
-        results = wlc.check_aps()
+        if 'stream' in request.GET:
+            return self.check_aps_stream(request, wlc)
+
+        # Checks are executed by wlc_run_checks command, show the latest
+        # finished run and the progress of the pending one.
+        CheckRun.fail_stale(wlc)
+        runs = wlc.checkrun_set.all()
+        run = runs.exclude(status__in=(CheckRun.QUEUED,
+                                       CheckRun.RUNNING)).first()
+        pending = runs.filter(status__in=(CheckRun.QUEUED,
+                                          CheckRun.RUNNING)).first()
+        if run is None and pending is None:
+            pending = CheckRun.enqueue(wlc)
+
+        result_filter, search, sort = check_filters(request)
+        qs = CheckResult.objects.none()
+        counts = {}
+        if run is not None:
+            qs = run.filter_results(result_filter, search, sort)
+            counts = run.result_counts()
+        paginator = Paginator(qs, CHECK_PAGE_SIZE)
+        try:
+            page = paginator.page(request.GET.get('page', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        results = collections.OrderedDict(
+            (r.number, r.as_dict()) for r in page.object_list)
+
+        def numbers(result):
+            if run is None:
+                return []
+            return list(run.results.filter(result=result).values_list(
+                'number', flat=True).order_by('number'))
 
         context = dict(
             # Include common variables for rendering the admin template.
@@ -96,7 +221,21 @@ class WLCAdmin(admin.ModelAdmin):
             key=wlc_id,
             opts=self.model._meta,
             wlc=wlc,
+            run=run,
+            pending=pending,
+            inventory=WLCInventory.objects.filter(wlc=wlc).first(),
             results=results,
+            page=page,
+            result_counts=[(r, counts.get(r, 0))
+                           for r in CheckResult.RESULTS],
+            result_filter=result_filter or [],
+            search=search,
+            sort=sort,
+            page_query=query_without(request, 'page'),
+            sort_query=query_without(request, 'page', 'sort'),
+            # Save forms act on the whole run, not the current page
+            mismatch_numbers=numbers('mismatch'),
+            missing_numbers=numbers('missing'),
             media=self.media,
         )
 
@@ -104,6 +243,190 @@ class WLCAdmin(admin.ModelAdmin):
                                 "wlcmanager/admin/check_aps.html",
                                 context)
 
+    def check_aps_stream(self, request, wlc):
+        """Check APs now, sending every table row as soon as it is ready.
+
+        Rows are rendered one by one while iterating WLC.iter_check_aps()
+        so nothing but the AP numbers for the "Save many" forms is kept.
+        Results are filtered but always ordered by AP number. DAPs may
+        come from the RPC cache, its age is shown below the table and
+        ?refresh=1 skips it.
+        """
+        result_filter, search, sort = check_filters(request)
+        if 'refresh' in request.GET:
+            wlc.invalidate_rpc_cache('get_dap')
+        inventory = None
+        if 'inventory' in request.GET:
+            inventory = WLCInventory.objects.filter(wlc=wlc).first()
+            if inventory is None:
+                msg = "Inventory of {} was not synced yet."
+                self.message_user(request, msg.format(wlc),
+                                  level=messages.ERROR)
+                return HttpResponseRedirect('?' + query_without(
+                    request, 'stream', 'inventory', 'refresh'))
+        context = dict(
+            run_each_context(self.admin_site, request),
+            key=wlc.pk,
+            opts=self.model._meta,
+            wlc=wlc,
+            inventory=inventory,
+            stream=True,
+            result_counts=[(r, None) for r in CheckResult.RESULTS],
+            result_filter=result_filter or [],
+            search=search,
+            stored_query=query_without(request, 'stream', 'inventory',
+                                       'refresh'),
+            rows_marker=ROWS_MARKER,
+            forms_marker=FORMS_MARKER,
+            media=self.media,
+        )
+        page = loader.render_to_string(
+            "wlcmanager/admin/check_aps_stream.html", context,
+            request=request)
+        head, rest = page.split(ROWS_MARKER, 1)
+        middle, tail = rest.split(FORMS_MARKER, 1)
+        row_template = loader.get_template(
+            "wlcmanager/admin/check_aps_row.html")
+        forms_template = loader.get_template(
+            "wlcmanager/admin/check_aps_save_forms.html")
+
+        def error_row(msg, *args):
+            return format_html('<tr><td colspan="6" class="errornote">' +
+                               msg + '</td></tr>', *args)
+
+        def generate():
+            yield head
+            numbers = dict(mismatch=[], missing=[])
+            try:
+                for apnum, res in wlc.iter_check_aps(
+                        results=result_filter, search=search,
+                        inventory=inventory is not None):
+                    if res['result'] in numbers:
+                        numbers[res['result']].append(apnum)
+                    yield row_template.render(dict(k=apnum, v=res, wlc=wlc),
+                                              request=request)
+            except RuntimeError as e:
+                yield error_row('Error while fetching data: {}', e)
+            except Exception as e:
+                # Headers are already sent, finish the page with the error
+                yield error_row('Error while checking APs: {}: {}',
+                                type(e).__name__, e)
+            yield middle
+            age = wlc.rpc_ages.get('get_dap')
+            if age:
+                yield format_html(
+                    '<p>DAPs were cached {} s ago. '
+                    '<a href="?{}&amp;refresh=1">Refresh now</a></p>',
+                    int(age), query_without(request, 'refresh'))
+            yield forms_template.render(
+                dict(wlc=wlc, mismatch_numbers=numbers['mismatch'],
+                     missing_numbers=numbers['missing']), request=request)
+            yield tail
+
+        response = StreamingHttpResponse(generate(),
+                                         content_type='text/html')
+        # Ask proxies (nginx) not to buffer the response
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def fleet_check_view(self, request):
+        """Check APs of all enabled WLCs at once.
+
+        Shows result counts of every WLC and its APs which are not ok.
+        ?inventory=1 checks against inventory mirrors, ?refresh=1 skips
+        the RPC cache and ?format=json returns the same data as JSON.
+        """
+        inventory = 'inventory' in request.GET
+        wlcs = list(WLC.objects.filter(enabled__exact=True))
+        if 'refresh' in request.GET:
+            for wlc in wlcs:
+                wlc.invalidate_rpc_cache('get_dap')
+
+        rows = []
+        for wlc, checked, error in WLC.iter_check_fleet(
+                wlcs, workers=FLEET_CHECK_WORKERS, timeout=RPC_TIMEOUT,
+                inventory=inventory):
+            counts = dict.fromkeys(CheckResult.RESULTS, 0)
+            problems = collections.OrderedDict()
+            try:
+                for apnum, res in checked or ():
+                    counts[res['result']] += 1
+                    if res['result'] != 'ok':
+                        problems[apnum] = res
+            except Exception as e:
+                # Results are compared lazily, a bad DAP or inventory row
+                # fails only its WLC
+                error = e
+            rows.append(dict(
+                wlc=wlc, counts=counts, problems=problems,
+                result_counts=[(r, counts[r]) for r in CheckResult.RESULTS],
+                error='{}: {}'.format(type(error).__name__, error)
+                      if error is not None else None))
+        rows.sort(key=lambda row: row['wlc'].name)
+
+        if request.GET.get('format') == 'json':
+            return JsonResponse(dict(
+                inventory=inventory,
+                wlcs=[fleet_row_json(row) for row in rows]))
+
+        context = dict(
+            run_each_context(self.admin_site, request),
+            opts=self.model._meta,
+            rows=rows,
+            inventory=inventory,
+            results=CheckResult.RESULTS,
+            totals=[(r, sum(row['counts'][r] for row in rows))
+                    for r in CheckResult.RESULTS],
+            media=self.media,
+        )
+        return TemplateResponse(request,
+                                "wlcmanager/admin/fleet_check.html",
+                                context)
+
+    def rpc_metrics_view(self, request):
+        rows = metrics.snapshot()
+        for row in rows:
+            for k in ('mean', 'p50', 'p90', 'p99', 'max'):
+                if row[k] is not None:
+                    row[k + '_ms'] = row[k] * 1000
+        context = dict(
+            run_each_context(self.admin_site, request),
+            opts=self.model._meta,
+            rows=rows,
+            media=self.media,
+        )
+        return TemplateResponse(request,
+                                "wlcmanager/admin/rpc_metrics.html",
+                                context)
+
+    def rerun_check_view(self, request, wlc_id):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(('POST',))
+
+        wlc = get_object_or_404(WLC, pk=wlc_id)
+        CheckRun.enqueue(wlc)
+        msg = "Check of {} queued"
+        self.message_user(request, msg.format(wlc), level=messages.INFO)
+        return HttpResponseRedirect(request.META["HTTP_REFERER"])
+
+    def sync_inventory_view(self, request, wlc_id):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(('POST',))
+
+        wlc = get_object_or_404(WLC, pk=wlc_id)
+        try:
+            counts = wlc.sync_inventory()
+        except RuntimeError as e:
+            msg = "Error while syncing inventory of {}: {}"
+            self.message_user(request, msg.format(wlc, e),
+                              level=messages.ERROR)
+        else:
+            msg = ("Inventory of {} synced: {created} created, {updated} "
+                   "updated, {deleted} deleted, {unchanged} unchanged")
+            self.message_user(request, msg.format(wlc, **counts),
+                              level=messages.INFO)
+        return HttpResponseRedirect(request.META["HTTP_REFERER"])
+
     def delete_ap_view(self, request, wlc_id):
         if request.method != 'POST':
             return HttpResponseNotAllowed(('POST',))
@@ -176,19 +499,39 @@ class WLCAdmin(admin.ModelAdmin):
             msg = "AP list is empty"
             self.message_user(request, msg, level=messages.ERROR)
             ap_numbers=[]
-
+        # Keep the first occurrence, every AP is saved once
+        ap_numbers = list(collections.OrderedDict.fromkeys(ap_numbers))
+
+        aps = {}
+        for chunk in chunks([n for n in ap_numbers if n.isdigit()],
+                            SYNC_BATCH_SIZE):
+            aps.update((str(ap.number), ap) for ap in
+                       AccessPoint.objects.select_related(
+                           'radio_1_profile', 'radio_2_profile').filter(
+                           number__in=chunk))
+
+        found = []
         for ap_number in ap_numbers:
-            try:
-                ap = AccessPoint.objects.get(number__exact=ap_number)
-                wlc.save_ap(ap)
-            except AccessPoint.DoesNotExist:
+            if ap_number in aps:
+                found.append(aps[ap_number])
+            else:
                 msg = "AP {} not found"
                 self.message_user(request, msg.format(ap_number),
                                   level=messages.ERROR)
-            except RuntimeError as e:
+
+        results = wlc.save_aps(found, chunk_size=SAVE_CHUNK_SIZE)
+        for ap in found:
+            error = results[ap.number]
+            if error is not None:
                 msg = "Error while saving AP {}@{}: {}"
-                self.message_user(request, msg.format(ap_number, wlc, e),
+                self.message_user(request, msg.format(ap.number, wlc, error),
                                   level=messages.ERROR)
+        saved = [ap.number for ap in found if results[ap.number] is None]
+        if saved:
+            msg = "Saved {} APs @{}: {}"
+            self.message_user(request, msg.format(
+                len(saved), wlc, ", ".join(str(n) for n in saved)),
+                level=messages.SUCCESS)
         return HttpResponseRedirect(request.META["HTTP_REFERER"])
 
     class Media(object):
@@ -199,9 +542,32 @@ class WLCAdmin(admin.ModelAdmin):
 admin.site.register(WLC, WLCAdmin)
 
 
+class DefinedListFilter(admin.SimpleListFilter):
+    title = 'defined AP'
+    parameter_name = 'defined'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', 'Defined'),
+            ('no', 'Undefined'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter_defined(True)
+        if self.value() == 'no':
+            return queryset.filter_defined(False)
+        return queryset
+
+
 class AutoAccessPointAdmin(admin.ModelAdmin):
     list_display = ['serial_number', 'wlc', 'number', 'model', 'ip_address',
-                    'create_ap_url']
+                    'last_seen', 'create_ap_url']
+    list_filter = [DefinedListFilter]
+
+    def get_queryset(self, request):
+        qs = super(AutoAccessPointAdmin, self).get_queryset(request)
+        return qs.with_defined()
 
     def get_urls(self):
         urls = super(AutoAccessPointAdmin, self).get_urls()
@@ -221,21 +587,26 @@ class AutoAccessPointAdmin(admin.ModelAdmin):
     create_ap_url.short_description = 'Create AP'
 
     def refresh_autoaps(self, request):
-        for wlc in WLC.objects.filter(enabled__exact=True):
+        # Only the RPCs run in worker threads, database is updated here
+        # one WLC (and one transaction) at a time.
+        fetched = fan_out(lambda wlc: wlc.fetch_autoaps(),
+                          WLC.objects.filter(enabled__exact=True),
+                          workers=REFRESH_WORKERS, timeout=RPC_TIMEOUT)
+        for wlc, auto_aps, error in fetched:
             try:
-                wlc.refresh_autoaps()
+                if error is not None:
+                    raise error
+                wlc.store_autoaps(auto_aps)
             except RuntimeError as e:
                 msg = "Error while fetching AP data from {}: {}"
                 self.message_user(request, msg.format(wlc, e),
                                   level=messages.ERROR)
-                # base-mac-addr
-                # primary-ip
         return HttpResponseRedirect(request.META["HTTP_REFERER"])
 admin.site.register(AutoAccessPoint, AutoAccessPointAdmin)
 
 
 class RadioProfileAdmin(admin.ModelAdmin):
-    list_display = ['name']
+    list_display = ['name', 'stale']
 
     def get_urls(self):
         urls = super(RadioProfileAdmin, self).get_urls()
@@ -248,7 +619,11 @@ class RadioProfileAdmin(admin.ModelAdmin):
     def refresh_profiles(self, request):
         try:
             wlc = WLC.objects.get(master__exact=True)
-            wlc.refresh_radio_profiles()
+            counts = wlc.refresh_radio_profiles()
+            msg = ("Radio profiles refreshed: {added} added, {kept} kept, "
+                   "{removed} removed, {stale} stale")
+            self.message_user(request, msg.format(**counts),
+                              level=messages.SUCCESS)
         except WLC.DoesNotExist as e:
             msg = "There is no master WLC defined."
             self.message_user(request, msg, level=messages.ERROR)
@@ -287,19 +662,22 @@ class AccessPointAdmin(admin.ModelAdmin):
     )
 
     def add_view(self, request, form_url='', extra_context=None):
+        # The submitted form keeps the query string but carries its own
+        # number, reserving another one would only leak it.
+        if request.method == 'POST':
+            return super(AccessPointAdmin, self).add_view(
+                request, form_url=form_url, extra_context=extra_context)
         try:
             auto_ap_sn = request.GET['auto_sn']
 
             auto_ap = AutoAccessPoint.objects.get(
                 serial_number__exact=auto_ap_sn)
 
-            used_numbers = AccessPoint.objects.values_list('number', flat=True)
-
             g = request.GET.copy()
             g.update({
                 'serial_number': auto_ap.serial_number,
                 'fingerprint': auto_ap.fingerprint,
-                'number': get_free_from_sequence(used_numbers),
+                'number': AccessPoint.reserve_numbers()[0],
                 'model': auto_ap.model,
             })
             request.GET = g
@@ -0,0 +1,93 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from lxml import etree
+
+try:
+    RPC_CACHE_TTL = settings.WLCMANAGER_RPC_CACHE_TTL
+except AttributeError:
+    RPC_CACHE_TTL = 30
+
+try:
+    RPC_CACHE_STALE = settings.WLCMANAGER_RPC_CACHE_STALE
+except AttributeError:
+    RPC_CACHE_STALE = 60
+
+CACHED_RPCS = ('get_dap', 'get_radio_profile', 'get_service_profile',
+               'get_auto_aps')
+
+# lxml elements can not be pickled, they are cached serialized
+XML_CODEC = (etree.tostring, etree.fromstring)
+PLAIN_CODEC = (lambda value: value, lambda value: value)
+
+
+def cache_key(wlc_pk, name):
+    return 'wlcmanager:rpc:{}:{}'.format(wlc_pk, name)
+
+
+def _spawn(func):
+    thread = threading.Thread(target=func)
+    thread.daemon = True
+    thread.start()
+
+
+def _store(key, value, dumps, ttl, stale):
+    cache.set(key, (time.time(), dumps(value)), ttl + stale)
+
+
+def _revalidate(key, fetch, dumps, ttl, stale):
+    # Only one refresh per key at a time
+    lock_key = key + ':refreshing'
+    if not cache.add(lock_key, True, ttl or 1):
+        return
+
+    def refresh():
+        try:
+            _store(key, fetch(), dumps, ttl, stale)
+        except Exception:
+            # Keep serving the stale value, next request tries again
+            pass
+        finally:
+            cache.delete(lock_key)
+    _spawn(refresh)
+
+
+def cached_call(wlc_pk, name, fetch, codec=XML_CODEC, ttl=None, stale=None):
+    """Return result of fetch() cached for WLC wlc_pk under name.
+
+    Fresh values are served for ttl seconds. For further stale seconds
+    the old value is served while a background thread fetches a new one.
+
+    Returns:
+        Tuple (value, age in seconds), age is 0 for a live value.
+    """
+    ttl = RPC_CACHE_TTL if ttl is None else ttl
+    stale = RPC_CACHE_STALE if stale is None else stale
+    if ttl <= 0:
+        return fetch(), 0
+
+    dumps, loads = codec
+    key = cache_key(wlc_pk, name)
+    entry = cache.get(key)
+    if entry is not None:
+        fetched_at, payload = entry
+        age = time.time() - fetched_at
+        if age <= ttl + stale:
+            if age > ttl:
+                _revalidate(key, fetch, dumps, ttl, stale)
+            return loads(payload), age
+
+    value = fetch()
+    _store(key, value, dumps, ttl, stale)
+    return value, 0
+
+
+def invalidate(wlc_pk, names=CACHED_RPCS):
+    cache.delete_many([cache_key(wlc_pk, name) for name in names])
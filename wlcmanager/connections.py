@@ -0,0 +1,292 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import contextlib
+import threading
+import time
+
+from django.conf import settings
+
+from .utils import RpcMakerProxy, RpcProxy
+
+try:
+    POOL_SIZE = settings.WLCMANAGER_CONNECTIONS_PER_WLC
+except AttributeError:
+    POOL_SIZE = 4
+
+try:
+    ACQUIRE_TIMEOUT = settings.WLCMANAGER_CONNECTION_ACQUIRE_TIMEOUT
+except AttributeError:
+    ACQUIRE_TIMEOUT = 30
+
+try:
+    IDLE_TIMEOUT = settings.WLCMANAGER_CONNECTION_IDLE_TIMEOUT
+except AttributeError:
+    IDLE_TIMEOUT = 300
+
+try:
+    MAX_AGE = settings.WLCMANAGER_CONNECTION_MAX_AGE
+except AttributeError:
+    MAX_AGE = 3600
+
+PRUNE_INTERVAL = 60
+
+
+def default_health_check(connection):
+    """Cheap liveness test, does not talk to the controller.
+
+    Dead sessions are found by their RPCs, a transport error evicts the
+    connection (see PooledConnection).
+    """
+    return connection is not None and getattr(connection, 'connected', True)
+
+
+def close_connection(connection):
+    close = getattr(connection, 'close', None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        pass
+
+
+class ConnectionPoolTimeout(RuntimeError):
+    pass
+
+
+class PooledConnection(object):
+    """Connections to one WLC, every RPC checks out one for itself.
+
+    The jnpr client is not known to be thread safe, so a connection runs
+    one RPC at a time. Threads of the process (fan-out workers,
+    concurrent requests) share up to ConnectionPool.size connections per
+    WLC. A connection whose RPC failed on transport (socket errors,
+    timeouts) is closed, the next caller opens a new one.
+    """
+
+    def __init__(self, pool, key, factory):
+        self.rpc = RpcProxy(self.call_rpc)
+        self._pool = pool
+        self._key = key
+        self._factory = factory
+
+    def RpcMaker(self, *args, **kwargs):
+        return RpcMakerProxy(self.call_maker, *args, **kwargs)
+
+    def call_rpc(self, name, args, kwargs):
+        with self.checkout() as connection:
+            return getattr(connection.rpc, name)(*args, **kwargs)
+
+    def call_maker(self, proxy, args, kwargs):
+        with self.checkout() as connection:
+            return proxy.make(connection)(*args, **kwargs)
+
+    @contextlib.contextmanager
+    def checkout(self):
+        """Borrow a connection for exclusive use"""
+        entry = self._pool.acquire(self._key, self._factory)
+        broken = False
+        try:
+            yield entry.connection
+        except EnvironmentError:
+            broken = True
+            raise
+        finally:
+            self._pool.release(self._key, entry, broken)
+
+
+class _PoolEntry(object):
+    __slots__ = ('connection', 'created', 'last_used', 'generation')
+
+    def __init__(self, connection, now, generation):
+        self.connection = connection
+        self.created = now
+        self.last_used = now
+        self.generation = generation
+
+
+class ConnectionPool(object):
+    """Process-wide registry of opened WLC connections.
+
+    Connections are keyed by WLC primary key and credentials so editing
+    a WLC row never hands out a connection opened with the old ones. Up
+    to ``size`` connections are opened per key, a caller finding all of
+    them busy waits ``acquire_timeout`` seconds at most. Connections
+    which are idle or too old are closed from get() every
+    ``prune_interval`` seconds.
+    """
+
+    def __init__(self, size=POOL_SIZE, acquire_timeout=ACQUIRE_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT, max_age=MAX_AGE,
+                 health_check=default_health_check, clock=time.time,
+                 prune_interval=PRUNE_INTERVAL):
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.health_check = health_check
+        self.clock = clock
+        self.prune_interval = prune_interval
+        self._cond = threading.Condition()
+        self._handles = {}
+        # Idle connections by key, the most recently used last
+        self._idle = {}
+        # Number of opened connections by key, idle and checked out
+        self._opened = {}
+        # Bumped by invalidate(), older connections are closed on release
+        self._generations = {}
+        self._pruned = clock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(wlc):
+        return (wlc.pk, wlc.ip_address, wlc.username, wlc.password)
+
+    def _is_usable(self, entry, now):
+        if self.idle_timeout and now - entry.last_used > self.idle_timeout:
+            return False
+        if self.max_age and now - entry.created > self.max_age:
+            return False
+        return self.health_check(entry.connection)
+
+    def _closed(self, key, count, evicted=True):
+        # Caller holds the lock
+        opened = self._opened.get(key, 0) - count
+        if opened > 0:
+            self._opened[key] = opened
+        else:
+            self._opened.pop(key, None)
+            self._generations.pop(key, None)
+        if evicted:
+            self.evictions += count
+
+    def get(self, key, factory):
+        """Return PooledConnection for key, opening connections with factory"""
+        if self.clock() - self._pruned >= self.prune_interval:
+            self.prune()
+        with self._cond:
+            handle = self._handles.get(key)
+            if handle is None:
+                handle = self._handles[key] = PooledConnection(self, key,
+                                                               factory)
+            return handle
+
+    def acquire(self, key, factory):
+        """Check out an idle connection for key or open a new one.
+
+        Raises:
+            ConnectionPoolTimeout: All connections for key stayed busy
+                for acquire_timeout seconds.
+        """
+        deadline = time.time() + self.acquire_timeout
+        stale = []
+        try:
+            with self._cond:
+                while True:
+                    now = self.clock()
+                    idle = self._idle.get(key)
+                    while idle:
+                        entry = idle.pop()
+                        if self._is_usable(entry, now):
+                            entry.last_used = now
+                            self.hits += 1
+                            return entry
+                        stale.append(entry)
+                        self._closed(key, 1)
+                    if self._opened.get(key, 0) < self.size:
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise ConnectionPoolTimeout(
+                            'No connection to WLC became free in {} seconds'
+                            .format(self.acquire_timeout))
+                    self._cond.wait(remaining)
+                self._opened[key] = self._opened.get(key, 0) + 1
+                self.misses += 1
+                generation = self._generations.get(key, 0)
+        finally:
+            for entry in stale:
+                close_connection(entry.connection)
+
+        # Opening a connection means a login round trip, do not hold the
+        # lock while waiting for the controller.
+        try:
+            connection = factory()
+        except Exception:
+            with self._cond:
+                self._closed(key, 1, evicted=False)
+                self._cond.notify()
+            raise
+        return _PoolEntry(connection, self.clock(), generation)
+
+    def release(self, key, entry, broken=False):
+        """Give back a checked out connection, broken ones are closed"""
+        with self._cond:
+            keep = (not broken and
+                    entry.generation == self._generations.get(key, 0))
+            if keep:
+                entry.last_used = self.clock()
+                self._idle.setdefault(key, []).append(entry)
+            else:
+                self._closed(key, 1)
+            self._cond.notify()
+        if not keep:
+            close_connection(entry.connection)
+
+    def _drop(self, keys):
+        # Caller holds the lock. Checked out connections of dropped keys
+        # are closed when they are released.
+        entries = []
+        for key in keys:
+            self._handles.pop(key, None)
+            idle = self._idle.pop(key, [])
+            entries += idle
+            self._closed(key, len(idle))
+            if key in self._opened:
+                self._generations[key] = self._generations.get(key, 0) + 1
+        return entries
+
+    def invalidate(self, pk):
+        """Drop all connections opened for WLC with given primary key"""
+        with self._cond:
+            keys = set(self._handles) | set(self._opened)
+            entries = self._drop([k for k in keys if k[0] == pk])
+        for entry in entries:
+            close_connection(entry.connection)
+
+    def prune(self):
+        """Close connections which are idle or too old"""
+        entries = []
+        with self._cond:
+            now = self._pruned = self.clock()
+            for key, idle in list(self._idle.items()):
+                stale = [e for e in idle if not self._is_usable(e, now)]
+                if not stale:
+                    continue
+                self._idle[key] = [e for e in idle if e not in stale]
+                self._closed(key, len(stale))
+                entries += stale
+        for entry in entries:
+            close_connection(entry.connection)
+
+    def clear(self):
+        with self._cond:
+            entries = self._drop(set(self._handles) | set(self._opened))
+            self.hits = self.misses = self.evictions = 0
+        for entry in entries:
+            close_connection(entry.connection)
+
+    def stats(self):
+        with self._cond:
+            return dict(size=sum(self._opened.values()),
+                        idle=sum(len(i) for i in self._idle.values()),
+                        hits=self.hits, misses=self.misses,
+                        evictions=self.evictions)
+
+
+pool = ConnectionPool()
@@ -0,0 +1,192 @@
+# coding: utf-8
+"""Compact records of DAPs read from WLC.
+
+A DAP table of a large controller takes tens of megabytes as lxml tree.
+Checks only need a few attributes of every DAP and its radios, those are
+kept in DapRecord and RadioRecord while the XML is parsed and dropped
+DAP by DAP.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+from lxml import etree
+
+# Bytes of a serialized DAP table parsed at once
+PARSE_CHUNK_SIZE = 64 * 1024
+
+# Values repeated on every DAP (YES/NO, models, channels, profiles) are
+# stored once and shared by all records.
+_share = {}.setdefault
+
+
+class _Record(object):
+    __slots__ = ()
+
+    # Values of fields not given to the constructor, None otherwise
+    DEFAULTS = {}
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.pop(name, self.DEFAULTS.get(name)))
+        if values:
+            raise TypeError('Unexpected fields {}'.format(
+                ', '.join(sorted(values))))
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, name) == getattr(other, name)
+                    for name in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def as_data(self):
+        """Return field values as JSON serializable list"""
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(**dict(zip(cls.__slots__, data)))
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self.__slots__))
+
+
+class RadioRecord(_Record):
+    """AP-RADIO attributes and the name of its RADIO-PROFILE-REF"""
+
+    __slots__ = ('slot', 'enable', 'auto_config', 'channel',
+                 'auto_power_config', 'tx_power', 'profile_name')
+
+    @classmethod
+    def from_element(cls, radio):
+        record = cls.__new__(cls)
+        get = radio.attrib.get
+        value = get('slot')
+        record.slot = _share(value, value)
+        value = get('enable')
+        record.enable = _share(value, value)
+        value = get('auto-config')
+        record.auto_config = _share(value, value)
+        value = get('channel')
+        record.channel = _share(value, value)
+        value = get('auto-power-config')
+        record.auto_power_config = _share(value, value)
+        value = get('tx-power')
+        record.tx_power = _share(value, value)
+        value = radio[0].get('name') if len(radio) else None
+        record.profile_name = _share(value, value)
+        return record
+
+
+class DapRecord(_Record):
+    """DAP attributes used by AccessPoint.compare() and check results.
+
+    config_digest is set only by sources which already know it (see
+    WLCInventory), otherwise it is computed from the record.
+    """
+
+    __slots__ = ('apnum', 'fingerprint', 'model', 'name', 'serial_id',
+                 'high_latency_mode', 'radios', 'config_digest')
+
+    # Field and XML attribute of DAP attributes checked by compare()
+    ATTRS = (('apnum', 'apnum'), ('fingerprint', 'fingerprint'),
+             ('model', 'model'), ('name', 'name'),
+             ('serial_id', 'serial-id'),
+             ('high_latency_mode', 'high-latency-mode'))
+
+    DEFAULTS = {'radios': ()}
+
+    radio_elements = etree.XPath('.//AP-RADIO')
+
+    @classmethod
+    def from_element(cls, dap):
+        record = cls.__new__(cls)
+        get = dap.attrib.get
+        record.apnum = get('apnum')
+        record.fingerprint = get('fingerprint')
+        value = get('model')
+        record.model = _share(value, value)
+        record.name = get('name')
+        record.serial_id = get('serial-id')
+        value = get('high-latency-mode')
+        record.high_latency_mode = _share(value, value)
+        record.radios = tuple([RadioRecord.from_element(radio)
+                               for radio in cls.radio_elements(dap)])
+        record.config_digest = None
+        return record
+
+    def as_data(self):
+        """Return JSON serializable list of fields except config_digest"""
+        data = [getattr(self, name) for name, attr in self.ATTRS]
+        data.append([radio.as_data() for radio in self.radios])
+        return data
+
+    @classmethod
+    def from_data(cls, data):
+        values = dict(zip([name for name, attr in cls.ATTRS], data))
+        values['radios'] = tuple(RadioRecord.from_data(radio)
+                                 for radio in data[len(cls.ATTRS)])
+        return cls(**values)
+
+    @property
+    def number(self):
+        return int(self.apnum)
+
+
+def as_record(dap):
+    """Return DapRecord of dap, which is a DAP element or a DapRecord"""
+    if etree.iselement(dap):
+        return DapRecord.from_element(dap)
+    return dap
+
+
+def iter_dap_records(source):
+    """Yield DapRecords of a DAP table.
+
+    source is the DAP-TABLE element, whose DAPs are removed as they are
+    converted, or the serialized table, which is parsed incrementally so
+    that the whole tree never exists in memory.
+    """
+    if etree.iselement(source):
+        dap = source[0] if len(source) else None
+        while dap is not None:
+            following = dap.getnext()
+            if dap.tag == 'DAP':
+                yield DapRecord.from_element(dap)
+            source.remove(dap)
+            dap = following
+        return
+
+    # Fed in chunks, a file object wrapping the table would copy it
+    parser = etree.XMLPullParser(tag='DAP')
+    offset = 0
+    while True:
+        chunk = source[offset:offset + PARSE_CHUNK_SIZE]
+        offset += PARSE_CHUNK_SIZE
+        if chunk:
+            parser.feed(chunk)
+        else:
+            parser.close()
+        for event, dap in parser.read_events():
+            yield DapRecord.from_element(dap)
+            # Free the DAP and siblings parsed before it
+            dap.clear()
+            parent = dap.getparent()
+            while dap.getprevious() is not None:
+                del parent[0]
+        if not chunk:
+            return
+
+
+def load_dap_records(source):
+    return list(iter_dap_records(source))
+
+
+# Cache codec of get_dap responses which loads them as DapRecords
+RECORDS_CODEC = (etree.tostring, load_dap_records)
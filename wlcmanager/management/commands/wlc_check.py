@@ -0,0 +1,133 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import collections
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import RPC_TIMEOUT, WLC
+from ...utils import compare_config, iter_fan_out
+
+# Exit codes
+EXIT_OK = 0
+EXIT_DRIFT = 1
+EXIT_ERROR = 2
+
+CHECK = 'check'
+COMPARE = 'compare'
+
+
+class Command(BaseCommand):
+    help = ('Check APs and compare configuration of enabled WLCs in '
+            'parallel. Results are written as JSON lines, exit status is '
+            '{} on drift and {} on errors.'.format(EXIT_DRIFT, EXIT_ERROR))
+
+    def add_arguments(self, parser):
+        parser.add_argument('wlc', nargs='*',
+                            help='Names of WLCs to check (default: all '
+                                 'enabled)')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of WLCs talked to concurrently')
+        parser.add_argument('--timeout', type=float, default=RPC_TIMEOUT,
+                            help='Seconds to wait for a single WLC '
+                                 '(default: %(default)s)')
+        parser.add_argument('--no-check', action='store_false',
+                            dest='check', help='Do not check APs')
+        parser.add_argument('--no-compare', action='store_false',
+                            dest='compare',
+                            help='Do not compare configuration with master')
+
+    def emit(self, **record):
+        self.stdout.write(json.dumps(record, sort_keys=True))
+        self.stdout.flush()
+
+    def handle(self, *args, **options):
+        wlcs = WLC.objects.filter(enabled__exact=True)
+        if options['wlc']:
+            wlcs = wlcs.filter(name__in=options['wlc'])
+        wlcs = list(wlcs)
+        if options['wlc'] and not wlcs:
+            raise CommandError('No such enabled WLC: {}'.format(
+                ', '.join(options['wlc'])))
+
+        jobs = []
+        if options['check']:
+            jobs.extend((CHECK, wlc) for wlc in wlcs)
+        master = None
+        if options['compare']:
+            master = WLC.objects.filter(master__exact=True).first()
+            if master is None:
+                raise CommandError('There is no master WLC defined, '
+                                   'use --no-compare.')
+            jobs.extend((COMPARE, wlc) for wlc in wlcs if wlc != master)
+
+        # Threads only talk to controllers, the DB is read here once.
+        db_aps = WLC.load_db_aps() if options['check'] else None
+        timeout = options['timeout']
+
+        def fetch(job):
+            kind, wlc = job
+            if kind == CHECK:
+                return wlc.get_aps(records=True)
+            return compare_config(wlc, master, timeout=timeout)
+
+        summary = {wlc.name: collections.Counter() for wlc in wlcs}
+        for (kind, wlc), res, error in iter_fan_out(
+                fetch, jobs, workers=options['workers'], timeout=timeout):
+            counts = summary[wlc.name]
+            if error is not None:
+                counts['errors'] += 1
+                self.emit_error(wlc, kind, error)
+            elif kind == CHECK:
+                try:
+                    for apnum, ap_res in wlc.iter_check_aps(daps=res,
+                                                            db_aps=db_aps):
+                        counts[ap_res['result']] += 1
+                        self.emit_ap(wlc, apnum, ap_res)
+                except Exception as e:
+                    # Results are compared lazily, a bad DAP fails only its
+                    # WLC
+                    counts['errors'] += 1
+                    self.emit_error(wlc, kind, e)
+            else:
+                for conf in res:
+                    counts['config_equal' if conf['is_equal']
+                           else 'config_differ'] += 1
+                    self.emit_config(wlc, master, conf)
+
+        status = EXIT_OK
+        for wlc in wlcs:
+            counts = summary[wlc.name]
+            self.emit(type='summary', wlc=wlc.name, **counts)
+            if counts['errors']:
+                status = EXIT_ERROR
+            elif status == EXIT_OK and (
+                    counts['mismatch'] or counts['missing'] or
+                    counts['unknown'] or counts['config_differ']):
+                status = EXIT_DRIFT
+        if status != EXIT_OK:
+            sys.exit(status)
+
+    def emit_error(self, wlc, stage, error):
+        self.emit(type='error', wlc=wlc.name, stage=stage,
+                  error='{}: {}'.format(type(error).__name__, error))
+
+    def emit_ap(self, wlc, apnum, res):
+        cmp_res = res.get('cmp_res') or {}
+        diff = {k: {'wlc': v['e_val'], 'db': v['o_val']}
+                for k, v in cmp_res.items() if not v['equal']}
+        self.emit(type='ap', wlc=wlc.name, number=apnum,
+                  result=res['result'], name=res['name'],
+                  serial_number=res['serial_number'], diff=diff)
+
+    def emit_config(self, wlc, master, conf):
+        diff = conf.get('diff') or {}
+        self.emit(type='config', wlc=wlc.name, master=master.name,
+                  part=conf['name'], equal=conf['is_equal'],
+                  errors=conf['errors'], added=diff.get('added', []),
+                  removed=diff.get('removed', []),
+                  changed=diff.get('changed', []))
@@ -0,0 +1,53 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import WLC, CheckRun
+
+
+class Command(BaseCommand):
+    help = 'Execute queued AP checks (see CheckRun).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wlc', nargs='*',
+                            help='Names of WLCs to handle (default: all)')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue a check of every selected enabled '
+                                 'WLC before processing the queue')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep waiting for new runs')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between queue polls with --loop')
+
+    def handle(self, *args, **options):
+        wlcs = WLC.objects.all()
+        if options['wlc']:
+            wlcs = wlcs.filter(name__in=options['wlc'])
+        wlc_ids = list(wlcs.values_list('pk', flat=True))
+        if options['wlc'] and not wlc_ids:
+            raise CommandError('No such WLC: {}'.format(
+                ', '.join(options['wlc'])))
+
+        if options['enqueue']:
+            for wlc in wlcs.filter(enabled__exact=True):
+                CheckRun.enqueue(wlc)
+
+        while True:
+            run = CheckRun.claim_next(wlc_ids)
+            if run is None:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            self.stdout.write('Checking {}'.format(run.wlc))
+            run.execute()
+            msg = '{}: {} ({} APs)'.format(run.wlc, run.get_status_display(),
+                                           run.total)
+            if run.error:
+                msg += ': {}'.format(run.error)
+            self.stdout.write(msg)
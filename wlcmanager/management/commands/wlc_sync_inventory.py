@@ -0,0 +1,64 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import RPC_TIMEOUT, WLC
+from ...utils import iter_fan_out
+
+
+class Command(BaseCommand):
+    help = ('Refresh DAP inventory mirrors (see WLCInventory) of enabled '
+            'WLCs. Only changed DAPs are written.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('wlc', nargs='*',
+                            help='Names of WLCs to sync (default: all '
+                                 'enabled)')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of WLCs talked to concurrently')
+        parser.add_argument('--timeout', type=float, default=RPC_TIMEOUT,
+                            help='Seconds to wait for a single WLC '
+                                 '(default: %(default)s)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep syncing every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300,
+                            help='Seconds between syncs with --loop')
+
+    def handle(self, *args, **options):
+        wlcs = WLC.objects.filter(enabled__exact=True)
+        if options['wlc']:
+            wlcs = wlcs.filter(name__in=options['wlc'])
+        wlcs = list(wlcs)
+        if options['wlc'] and not wlcs:
+            raise CommandError('No such enabled WLC: {}'.format(
+                ', '.join(options['wlc'])))
+
+        while True:
+            self.sync(wlcs, options['workers'], options['timeout'])
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, wlcs, workers, timeout):
+        for wlc in wlcs:
+            wlc.invalidate_rpc_cache('get_dap')
+
+        def fetch(wlc):
+            return wlc.get_aps(records=True)
+
+        # Threads only talk to controllers, the DB is written here.
+        for wlc, records, error in iter_fan_out(fetch, wlcs, workers=workers,
+                                                timeout=timeout):
+            if error is not None:
+                self.stderr.write('{}: {}: {}'.format(
+                    wlc.name, type(error).__name__, error))
+                continue
+            counts = wlc.store_inventory(records)
+            self.stdout.write(
+                '{}: {created} created, {updated} updated, {deleted} '
+                'deleted, {unchanged} unchanged'.format(wlc.name, **counts))
@@ -0,0 +1,216 @@
+# coding: utf-8
+"""Timing and outcome counters of RPCs sent to WLCs.
+
+Metrics are kept in memory of the process which issued the RPCs, every
+worker of a multi-process server reports its own.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import collections
+import math
+import socket
+import threading
+import time
+
+from django.conf import settings
+from lxml import etree
+
+from .utils import RpcMakerProxy, RpcProxy
+
+try:
+    METRICS_SAMPLES = settings.WLCMANAGER_METRICS_SAMPLES
+except AttributeError:
+    METRICS_SAMPLES = 1000
+
+# Payloads are serialized again just to be measured, a DAP table takes
+# megabytes, so it is off by default
+try:
+    METRICS_PAYLOAD_SIZE = settings.WLCMANAGER_METRICS_PAYLOAD_SIZE
+except AttributeError:
+    METRICS_PAYLOAD_SIZE = False
+
+OUTCOMES = ('ok', 'error', 'timeout')
+
+# Upper bounds (seconds) of Prometheus histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def payload_size(element):
+    if not METRICS_PAYLOAD_SIZE or not etree.iselement(element):
+        return 0
+    return len(etree.tostring(element))
+
+
+class RpcStats(object):
+    """Counters of a single RPC of a single WLC"""
+
+    def __init__(self, samples):
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.buckets = [0] * len(BUCKETS)
+        self.seconds = 0.0
+        self.payload_bytes = 0
+        self.recent = collections.deque(maxlen=samples)
+
+    @property
+    def count(self):
+        return sum(self.outcomes.values())
+
+    def observe(self, duration, outcome, size):
+        self.outcomes[outcome] += 1
+        self.seconds += duration
+        self.payload_bytes += size
+        self.recent.append(duration)
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+
+
+class RpcMetrics(object):
+    def __init__(self, samples=METRICS_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, wlc, rpc, duration, outcome='ok', size=0):
+        with self._lock:
+            stats = self._stats.get((wlc, rpc))
+            if stats is None:
+                stats = self._stats[(wlc, rpc)] = RpcStats(self.samples)
+            stats.observe(duration, outcome, size)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self):
+        """Return list of per WLC and RPC dictionaries for display.
+
+        Percentiles (p50, p90, p99) are computed from the last
+        METRICS_SAMPLES calls, the other values from all calls.
+        """
+        with self._lock:
+            items = [(key, stats.count, dict(stats.outcomes), stats.seconds,
+                      stats.payload_bytes, sorted(stats.recent))
+                     for key, stats in self._stats.items()]
+        rows = []
+        for (wlc, rpc), count, outcomes, seconds, size, recent in \
+                sorted(items):
+            row = dict(wlc=wlc, rpc=rpc, count=count, seconds=seconds,
+                       mean=seconds / count if count else None,
+                       max=recent[-1] if recent else None,
+                       payload_bytes=size,
+                       mean_payload=size // count if count else None,
+                       **outcomes)
+            for pct in PERCENTILES:
+                row['p{}'.format(pct)] = percentile(recent, pct)
+            rows.append(row)
+        return rows
+
+    def render_prometheus(self):
+        """Return metrics in Prometheus text exposition format"""
+        with self._lock:
+            items = sorted((key, dict(stats.outcomes), list(stats.buckets),
+                            stats.count, stats.seconds, stats.payload_bytes)
+                           for key, stats in self._stats.items())
+
+        def labels(wlc, rpc, **extra):
+            pairs = [('wlc', wlc), ('rpc', rpc)] + sorted(extra.items())
+            return ','.join('{}="{}"'.format(k, _escape(v))
+                            for k, v in pairs)
+
+        lines = [
+            '# HELP wlcmanager_rpc_total WLC RPCs by outcome.',
+            '# TYPE wlcmanager_rpc_total counter',
+        ]
+        for (wlc, rpc), outcomes, buckets, count, seconds, size in items:
+            for outcome in OUTCOMES:
+                lines.append('wlcmanager_rpc_total{{{}}} {}'.format(
+                    labels(wlc, rpc, outcome=outcome), outcomes[outcome]))
+        lines += [
+            '# HELP wlcmanager_rpc_duration_seconds Duration of WLC RPCs.',
+            '# TYPE wlcmanager_rpc_duration_seconds histogram',
+        ]
+        for (wlc, rpc), outcomes, buckets, count, seconds, size in items:
+            for bound, value in zip(BUCKETS, buckets):
+                lines.append(
+                    'wlcmanager_rpc_duration_seconds_bucket{{{}}} {}'.format(
+                        labels(wlc, rpc, le=repr(float(bound))), value))
+            lines.append(
+                'wlcmanager_rpc_duration_seconds_bucket{{{}}} {}'.format(
+                    labels(wlc, rpc, le='+Inf'), count))
+            lines.append('wlcmanager_rpc_duration_seconds_sum{{{}}} {!r}'
+                         .format(labels(wlc, rpc), seconds))
+            lines.append('wlcmanager_rpc_duration_seconds_count{{{}}} {}'
+                         .format(labels(wlc, rpc), count))
+        lines += [
+            '# HELP wlcmanager_rpc_payload_bytes_total XML sent with set '
+            'RPCs and received from get RPCs.',
+            '# TYPE wlcmanager_rpc_payload_bytes_total counter',
+        ]
+        for (wlc, rpc), outcomes, buckets, count, seconds, size in items:
+            lines.append('wlcmanager_rpc_payload_bytes_total{{{}}} {}'.format(
+                labels(wlc, rpc), size))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+metrics = RpcMetrics()
+
+
+class InstrumentedConnection(object):
+    """Connection proxy recording every RPC in RpcMetrics"""
+
+    def __init__(self, connection, wlc_name, registry=metrics):
+        self.wrapped = connection
+        self.wlc_name = wlc_name
+        self.registry = registry
+        self.rpc = RpcProxy(self.call_rpc)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def RpcMaker(self, trans, *args, **kwargs):
+        return RpcMakerProxy(self.call_maker, trans, *args, **kwargs)
+
+    def call_rpc(self, name, args, kwargs):
+        return self.call(name, getattr(self.wrapped.rpc, name), args, kwargs)
+
+    def call_maker(self, proxy, args, kwargs):
+        data = getattr(proxy, 'data', None)
+        rpc = proxy.trans
+        if etree.iselement(data):
+            rpc = '{} {}'.format(proxy.trans, data.tag)
+        return self.call(rpc, proxy.make(self.wrapped), args, kwargs,
+                         request=data)
+
+    def call(self, rpc, func, args, kwargs, request=None):
+        outcome = 'error'
+        size = 0
+        start = time.time()
+        try:
+            res = func(*args, **kwargs)
+            outcome = 'ok'
+            size = payload_size(res if request is None else request)
+            return res
+        except socket.timeout:
+            outcome = 'timeout'
+            raise
+        finally:
+            self.registry.observe(self.wlc_name, rpc, time.time() - start,
+                                  outcome, size)
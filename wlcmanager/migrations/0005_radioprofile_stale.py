@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-17 22:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wlcmanager', '0004_autoaccesspoint_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='radioprofile',
+            name='stale',
+            field=models.BooleanField(default=False, editable=False, help_text='Missing on master WLC but still used by some APs'),
+        ),
+    ]
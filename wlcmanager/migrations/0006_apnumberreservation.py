@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-17 22:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wlcmanager', '0005_radioprofile_stale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APNumberReservation',
+            fields=[
+                ('number', models.IntegerField(primary_key=True, serialize=False)),
+                ('expires', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['number'],
+            },
+        ),
+    ]
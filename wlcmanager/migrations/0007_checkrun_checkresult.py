@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-17 22:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wlcmanager', '0006_apnumberreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField(verbose_name='AP number')),
+                ('result', models.CharField(db_index=True, max_length=16)),
+                ('result_verbose', models.CharField(max_length=64)),
+                ('name', models.CharField(max_length=64)),
+                ('serial_number', models.CharField(max_length=64)),
+                ('details', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CheckRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('done', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('wlc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='wlcmanager.WLC', verbose_name='WLC')),
+            ],
+            options={
+                'ordering': ['-created'],
+                'get_latest_by': 'created',
+            },
+        ),
+        migrations.AddField(
+            model_name='checkresult',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='wlcmanager.CheckRun'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='checkresult',
+            unique_together=set([('run', 'number')]),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-17 22:28
+from __future__ import unicode_literals
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+# Frozen copy of AccessPoint.RADIO_COUNT and ap_config_digest() as of this
+# migration, later changes of the digest must not change its result.
+RADIO_COUNT = {
+    'MP_432': 2,
+    'MP_522': 2,
+    'WLA321-WW': 1,
+    'WLA322-WW': 2,
+}
+
+
+def ap_config_digest(ap):
+    items = [str(ap.number), ap.fingerprint, ap.model, ap.name,
+             ap.serial_number, 'YES' if ap.high_latency else 'NO']
+    for slot in range(1, RADIO_COUNT.get(ap.model, 2) + 1):
+        channel = getattr(ap, 'radio_{}_channel'.format(slot))
+        power = getattr(ap, 'radio_{}_power'.format(slot))
+        enable = getattr(ap, 'radio_{}_enable'.format(slot))
+        items += [str(slot), 'YES' if enable else 'NO']
+        if channel == 0:
+            items.append('YES')
+        else:
+            items += ['NO', None if channel is None else str(channel)]
+        if power == 0:
+            items.append('YES')
+        else:
+            items += ['NO', None if power is None else str(power)]
+        items.append(getattr(ap, 'radio_{}_profile_id'.format(slot)))
+    data = json.dumps(items, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def fill_config_digest(apps, schema_editor):
+    AccessPoint = apps.get_model('wlcmanager', 'AccessPoint')
+    for ap in AccessPoint.objects.all().iterator():
+        AccessPoint.objects.filter(pk=ap.pk).update(
+            config_digest=ap_config_digest(ap))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wlcmanager', '0007_checkrun_checkresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accesspoint',
+            name='config_digest',
+            field=models.CharField(blank=True, editable=False, help_text='Digest of the attributes checked by compare()', max_length=40),
+        ),
+        migrations.RunPython(fill_config_digest, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-17 22:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wlcmanager', '0008_accesspoint_config_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WLCDap',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField(verbose_name='AP number')),
+                ('name', models.CharField(max_length=64)),
+                ('serial_number', models.CharField(max_length=64)),
+                ('config_digest', models.CharField(max_length=40)),
+                ('content_hash', models.CharField(max_length=40)),
+                ('data', models.TextField()),
+            ],
+            options={
+                'ordering': ['number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WLCInventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('synced', models.DateTimeField(blank=True, null=True)),
+                ('dap_count', models.IntegerField(default=0, verbose_name='DAPs')),
+                ('wlc', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='wlcmanager.WLC', verbose_name='WLC')),
+            ],
+            options={
+                'verbose_name_plural': 'WLC inventories',
+            },
+        ),
+        migrations.AddField(
+            model_name='wlcdap',
+            name='inventory',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daps', to='wlcmanager.WLCInventory'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='wlcdap',
+            unique_together=set([('inventory', 'number')]),
+        ),
+    ]
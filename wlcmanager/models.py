@@ -3,14 +3,35 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+import collections
+import hashlib
+import json
+import operator
+from datetime import timedelta
+
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.db import connection as db_connection
 from django.db import models
 from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.template import Context
 from django.template import loader
+from django.utils import timezone
+from django.utils import six
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.module_loading import import_string
 
 from jnpr import wlc as jnpr_wlc
+from lxml import etree
+from lxml.builder import E
+
+from . import cache as rpc_cache
+from .connections import pool as connection_pool
+from .daps import DapRecord, RECORDS_CODEC, as_record, load_dap_records
+from .metrics import InstrumentedConnection
+from .utils import chunks, iter_fan_out
 
 from django.conf import settings
 try:
@@ -18,6 +39,37 @@ try:
 except AttributeError:
     HIGHLATENCY_DEFAULT = False
 
+try:
+    NUMBER_RESERVATION_TTL = settings.WLCMANAGER_NUMBER_RESERVATION_TTL
+except AttributeError:
+    NUMBER_RESERVATION_TTL = 3600
+
+try:
+    CONNECTION_FACTORY = settings.WLCMANAGER_CONNECTION_FACTORY
+except AttributeError:
+    CONNECTION_FACTORY = None
+
+# Seconds to wait for a single WLC when talking to many of them
+try:
+    RPC_TIMEOUT = settings.WLCMANAGER_RPC_TIMEOUT
+except AttributeError:
+    RPC_TIMEOUT = 30
+
+# Seconds after which a running CheckRun is considered dead
+try:
+    CHECK_RUN_TIMEOUT = settings.WLCMANAGER_CHECK_RUN_TIMEOUT
+except AttributeError:
+    CHECK_RUN_TIMEOUT = 3600
+
+CHECK_PROGRESS_STEP = 100
+
+# Rows written or looked up per query, keeps IN (...) lists below the
+# SQLite bound parameters limit
+try:
+    SYNC_BATCH_SIZE = settings.WLCMANAGER_SYNC_BATCH_SIZE
+except AttributeError:
+    SYNC_BATCH_SIZE = 500
+
 
 @python_2_unicode_compatible
 class WLC(models.Model):
@@ -43,6 +95,9 @@ class WLC(models.Model):
                 pass
 
     def make_connection(self):
+        if CONNECTION_FACTORY:
+            # e.g. wlcmanager.simulator.connect, called with this WLC
+            return import_string(CONNECTION_FACTORY)(self)
         wlc = jnpr_wlc.WirelessLanController(host=self.ip_address,
                                              user=self.username,
                                              password=self.password)
@@ -51,47 +106,174 @@ class WLC(models.Model):
 
     @property
     def connection(self):
-        try:
-            self._connection
-        except AttributeError:
-            self._connection = self.make_connection()
+        def factory():
+            return InstrumentedConnection(self.make_connection(), self.name)
+        return connection_pool.get(connection_pool.make_key(self), factory)
+
+    @property
+    def rpc_ages(self):
+        """Age in seconds of cached RPC responses used by this instance"""
+        return self.__dict__.setdefault('_rpc_ages', {})
 
-        return self._connection
+    def cached_rpc(self, name, fetch, codec=rpc_cache.XML_CODEC):
+        value, self.rpc_ages[name] = rpc_cache.cached_call(self.pk, name,
+                                                           fetch, codec)
+        return value
+
+    def invalidate_rpc_cache(self, *names):
+        rpc_cache.invalidate(self.pk, names or rpc_cache.CACHED_RPCS)
 
     def get_auto_aps(self):
-        announce_table = \
-            self.connection.rpc.get_stat_dap_announce_status_table()
-        auto_aps = \
-            announce_table.findall(".//DAP-ANNOUNCE-STATUS[@status='AUTO']")
-        return [ap.attrib for ap in auto_aps]
-
-    def get_aps(self):
-        ap_list = self.connection.rpc.get_dap()
+        def fetch():
+            announce_table = \
+                self.connection.rpc.get_stat_dap_announce_status_table()
+            auto_aps = announce_table.findall(
+                ".//DAP-ANNOUNCE-STATUS[@status='AUTO']")
+            return [dict(ap.attrib) for ap in auto_aps]
+        return self.cached_rpc('get_auto_aps', fetch, rpc_cache.PLAIN_CODEC)
+
+    def get_aps(self, records=False):
+        """Return DAP-TABLE of this WLC.
+
+        With records=True a list of DapRecords is returned instead, a
+        cached table is parsed incrementally and no DAP element is kept.
+        """
+        def fetch():
+            return self.connection.rpc.get_dap()
+        if not records:
+            return self.cached_rpc('get_dap', fetch)
+        ap_list = self.cached_rpc('get_dap', fetch, RECORDS_CODEC)
+        if etree.iselement(ap_list):
+            # Fetched live, the cache already has its serialized copy
+            ap_list = load_dap_records(ap_list)
         return ap_list
 
     def get_radio_profiles(self):
-        rp_list = self.connection.rpc.get_radio_profile()
+        rp_list = self.cached_rpc(
+            'get_radio_profile',
+            lambda: self.connection.rpc.get_radio_profile())
         return rp_list
 
     @transaction.atomic
     def refresh_radio_profiles(self):
-        RadioProfile.objects.all().delete()
-        for radio_profile in self.get_radio_profiles():
-            RadioProfile.objects.create(name=radio_profile.attrib['name'])
+        """Synchronize RadioProfiles with profiles defined on this WLC.
+
+        Profiles which vanished from the WLC are deleted unless some
+        AccessPoint still uses them, those are only marked as stale.
+
+        Returns:
+            Dictionary with added, kept, removed and stale counts.
+        """
+        self.invalidate_rpc_cache('get_radio_profile')
+        names = set(rp.attrib['name'] for rp in self.get_radio_profiles())
+        existing = set(RadioProfile.objects.values_list('name', flat=True))
+
+        added = names - existing
+        vanished = existing - names
+        referenced = set()
+        # Two query parameters per profile
+        for chunk in chunks(vanished, SYNC_BATCH_SIZE // 2):
+            used = AccessPoint.objects.filter(
+                models.Q(radio_1_profile__in=chunk) |
+                models.Q(radio_2_profile__in=chunk)).values_list(
+                    'radio_1_profile', 'radio_2_profile').distinct()
+            for r1, r2 in used:
+                referenced.add(r1)
+                referenced.add(r2)
+        referenced &= vanished
+        removed = vanished - referenced
+        stale = vanished & referenced
+
+        for chunk in chunks(removed, SYNC_BATCH_SIZE):
+            RadioProfile.objects.filter(name__in=chunk).delete()
+        RadioProfile.objects.filter(stale=True).exclude(
+            name__in=stale).update(stale=False)
+        if stale:
+            RadioProfile.objects.filter(name__in=stale).update(stale=True)
+        RadioProfile.objects.bulk_create(
+            [RadioProfile(name=name) for name in sorted(added)],
+            batch_size=SYNC_BATCH_SIZE)
+
+        return dict(added=len(added), kept=len(names & existing),
+                    removed=len(removed), stale=len(stale))
+
+    def fetch_autoaps(self):
+        """Fetch live list of auto APs, bypassing the RPC cache"""
+        self.invalidate_rpc_cache('get_auto_aps')
+        return self.get_auto_aps()
 
-    @transaction.atomic
     def refresh_autoaps(self):
-        self.autoaccesspoint_set.all().delete()
-        for ap in self.get_auto_aps():
-            AutoAccessPoint.objects.filter(
-                serial_number__exact=ap['serial-id']).delete()
-            self.autoaccesspoint_set.create(serial_number=ap['serial-id'],
+        self.store_autoaps(self.fetch_autoaps())
+
+    @transaction.atomic
+    def store_autoaps(self, auto_aps):
+        """Synchronize AutoAccessPoints of this WLC with auto_aps.
+
+        auto_aps is a list returned by get_auto_aps(), it is fetched
+        separately so RPCs to many WLCs can run concurrently. Rows are
+        matched by serial number and only new, changed and vanished ones
+        are written, unchanged rows get only their last_seen bumped.
+        Only rows of this WLC and of the fetched APs are read.
+
+        Returns:
+            Dictionary with created, updated, deleted and unchanged counts.
+        """
+        now = timezone.now()
+        fetched = collections.OrderedDict()
+        for ap in auto_aps:
+            # base-mac-addr
+            # primary-ip
+            fetched[ap['serial-id']] = dict(wlc_id=self.pk,
                                             fingerprint=ap['fingerprint'],
-                                            number=ap['dapnum'],
+                                            number=int(ap['dapnum']),
                                             model=ap['model'],
                                             ip_address=ap['ip-addr'])
-            # base-mac-addr
-            # primary-ip
+
+        # Rows of fetched APs, which may be on another WLC, and rows
+        # holding their addresses (two query parameters per AP)
+        existing = {}
+        ip_holders = {}
+        for chunk in chunks(fetched.items(), SYNC_BATCH_SIZE // 2):
+            rows = AutoAccessPoint.objects.filter(
+                models.Q(serial_number__in=[sn for sn, v in chunk]) |
+                models.Q(ip_address__in=[v['ip_address'] for sn, v in chunk]))
+            for row in rows:
+                existing[row.serial_number] = row
+                ip_holders[row.ip_address] = row.serial_number
+
+        to_create = []
+        changed = []
+        unchanged = []
+        for serial_number, values in fetched.items():
+            current = existing.get(serial_number)
+            if current is None:
+                to_create.append(AutoAccessPoint(
+                    serial_number=serial_number, last_seen=now, **values))
+            elif any(getattr(current, k) != v for k, v in values.items()):
+                changed.append(AutoAccessPoint(
+                    serial_number=serial_number, last_seen=now, **values))
+            else:
+                unchanged.append(serial_number)
+
+        vanished = set(self.autoaccesspoint_set.values_list(
+            'serial_number', flat=True))
+        # An address is unique, a row not reported any more by its WLC
+        # gives it up to the AP reporting it now
+        vanished.update(ip_holders.values())
+        vanished = [sn for sn in vanished if sn not in fetched]
+        # Changed rows are replaced so that APs can swap their addresses
+        # without violating the unique constraint in between
+        for chunk in chunks(vanished + [ap.serial_number for ap in changed],
+                            SYNC_BATCH_SIZE):
+            AutoAccessPoint.objects.filter(serial_number__in=chunk).delete()
+        for chunk in chunks(unchanged, SYNC_BATCH_SIZE):
+            AutoAccessPoint.objects.filter(
+                serial_number__in=chunk).update(last_seen=now)
+        AutoAccessPoint.objects.bulk_create(to_create + changed,
+                                            batch_size=SYNC_BATCH_SIZE)
+
+        return dict(created=len(to_create), updated=len(changed),
+                    deleted=len(vanished), unchanged=len(unchanged))
 
     def delete_ap(self, ap_number):
 
@@ -105,58 +287,183 @@ class WLC(models.Model):
             self.connection.rpc.delete_dap(apnum=ap_number)
         except jnpr_wlc.RpcError as e:
             return e.errors
+        finally:
+            self.invalidate_rpc_cache('get_dap', 'get_auto_aps')
 
     def save_ap(self, ap):
         return self._save_aps([ap])
 
-    def _save_aps(self, ap_iter):
-        from lxml.builder import E
-        from lxml import etree
+    def save_aps(self, aps, chunk_size=50):
+        """Save many APs on WLC sending chunk_size DAPs per RPC.
+
+        A chunk rejected by WLC is split in halves and retried until
+        the APs causing the error are isolated.
+
+        Returns:
+            Dictionary mapping AP number to None on success or to the
+            error raised for that AP.
+        """
+        results = {}
+        for chunk in chunks(aps, chunk_size):
+            self._save_aps_bisect(chunk, results)
+        return results
 
+    def _save_aps_bisect(self, aps, results):
+        try:
+            self._save_aps(aps)
+        except RuntimeError as e:
+            if len(aps) == 1:
+                results[aps[0].number] = e
+                return
+            half = len(aps) // 2
+            self._save_aps_bisect(aps[:half], results)
+            self._save_aps_bisect(aps[half:], results)
+            return
+        for ap in aps:
+            results[ap.number] = None
+
+    def _save_aps(self, ap_iter):
         rpc = self.connection.RpcMaker('set')
         rpc.data = E('DAP-TABLE')
 
         for ap in ap_iter:
-            apxml = ap.render_xml()
-            rpc.data.append(etree.XML(apxml))
+            rpc.data.append(ap.build_xml())
+
+        try:
+            rpc()
+        finally:
+            # Even a failed request may have saved some of the APs
+            self.invalidate_rpc_cache('get_dap', 'get_auto_aps')
 
-        rpc()
+    @staticmethod
+    def load_db_aps():
+        """Return all APs from DB by number, ready for check_aps()"""
+        # One query for all APs, compare() needs both radio profiles.
+        # The join makes two profile instances per AP, only the first
+        # instance of every profile is kept.
+        profiles = {}
+        db_aps = {}
+        for ap in AccessPoint.objects.select_related(
+                'radio_1_profile', 'radio_2_profile').iterator():
+            profile = ap.radio_1_profile
+            ap.radio_1_profile = profiles.setdefault(profile.pk, profile)
+            profile = ap.radio_2_profile
+            if profile is not None:
+                ap.radio_2_profile = profiles.setdefault(profile.pk, profile)
+            db_aps[ap.number] = ap
+        return db_aps
 
-    def check_aps(self):
-        res = self.get_aps()
+    def sync_inventory(self):
+        """Refresh WLCInventory of this WLC from its live DAP table"""
+        self.invalidate_rpc_cache('get_dap')
+        return self.store_inventory(self.get_aps(records=True))
 
-        configured_ap_numbers = set(AccessPoint.objects.values_list('number',
-                                                                    flat=True))
-        present_ap_numbers = set([int(ap.attrib['apnum']) for ap in res])
+    @transaction.atomic
+    def store_inventory(self, records):
+        """Mirror DapRecords in WLCInventory of this WLC.
 
-        ap_dict = {int(ap.attrib['apnum']): ap for ap in res}
+        records (result of get_aps(records=True)) are fetched separately
+        so RPCs to many WLCs can run concurrently.
 
-        results = {}
-        for apnum in sorted(configured_ap_numbers | present_ap_numbers):
+        Returns:
+            Dictionary with created, updated, deleted and unchanged counts.
+        """
+        inventory, created = WLCInventory.objects.get_or_create(wlc=self)
+        return inventory.store(records)
+
+    def iter_check_aps(self, daps=None, db_aps=None, progress=None,
+                       results=None, search=None, inventory=False):
+        """Compare APs configured on WLC with APs in DB.
+
+        daps (DAP elements or DapRecords, result of get_aps()) and db_aps
+        (result of load_db_aps()) are fetched when not given, so callers
+        checking many WLCs can share them. With inventory=True DAPs are
+        read from the WLCInventory mirror instead of the WLC, which raises
+        WLCInventory.DoesNotExist if it was never synced. progress, if
+        given, is called as progress(done, total) every
+        CHECK_PROGRESS_STEP APs and when the check is finished. raw_ap of
+        results is a DapRecord.
+
+        Only APs with result in results (all when None) and with search
+        in their name or serial number (case-insensitive) are yielded.
+        Filters are applied before comparing, without 'ok' and 'mismatch'
+        in results no AP is compared at all.
+
+        Yields:
+            (AP number, result) tuples ordered by AP number.
+        """
+        if daps is None:
+            if inventory:
+                daps = self.inventory.iter_records()
+            else:
+                daps = self.get_aps(records=True)
+        if db_aps is None:
+            db_aps = self.load_db_aps()
+        # Before DAPs are read, the inventory joins on stored digests
+        AccessPoint.refresh_config_digests(db_aps.values())
+        configured_ap_numbers = set(db_aps)
+        ap_dict = {}
+        for ap in daps:
+            ap = as_record(ap)
+            ap_dict[ap.number] = ap
+        present_ap_numbers = set(ap_dict)
+
+        compare = results is None or bool({'ok', 'mismatch'} & set(results))
+        search = search.lower() if search else None
+
+        all_ap_numbers = sorted(configured_ap_numbers | present_ap_numbers)
+        for i, apnum in enumerate(all_ap_numbers):
+            if progress and i % CHECK_PROGRESS_STEP == 0:
+                progress(i, len(all_ap_numbers))
+            if search:
+                if apnum in configured_ap_numbers:
+                    ap = db_aps[apnum]
+                    name, serial_number = ap.name, ap.serial_number
+                else:
+                    name = ap_dict[apnum].name
+                    serial_number = ap_dict[apnum].serial_id
+                if (search not in name.lower() and
+                        search not in serial_number.lower()):
+                    continue
             if apnum not in configured_ap_numbers:
+                if results is not None and 'unknown' not in results:
+                    continue
                 raw_ap = ap_dict[apnum]
-                results[apnum] = dict(
+                yield apnum, dict(
                     result='unknown',
                     result_verbose='AP present on WLC but missing in DB',
                     raw_ap=raw_ap,
-                    serial_number=raw_ap.attrib['serial-id'],
-                    name=raw_ap.attrib['name'],
+                    serial_number=raw_ap.serial_id,
+                    name=raw_ap.name,
                 )
             elif apnum not in present_ap_numbers:
-                db_ap = AccessPoint.objects.get(number__exact=apnum)
-                results[apnum] = dict(
+                if results is not None and 'missing' not in results:
+                    continue
+                db_ap = db_aps[apnum]
+                yield apnum, dict(
                     result='missing',
                     result_verbose='AP missing on WLC',
                     db_ap=db_ap,
                     serial_number=db_ap.serial_number,
                     name=db_ap.name,
                 )
-            else:
-                db_ap = AccessPoint.objects.get(number__exact=apnum)
+            elif compare:
+                db_ap = db_aps[apnum]
                 raw_ap = ap_dict[apnum]
-                cmp_res = db_ap.compare(raw_ap)
-                res_ok = all([r['equal'] for r in cmp_res.itervalues()])
-                results[apnum] = dict(
+                dap_digest = (raw_ap.config_digest or
+                              AccessPoint.dap_config_digest(raw_ap))
+                if (db_ap.config_digest and
+                        db_ap.config_digest == dap_digest):
+                    # Equal digests, attribute diff would be empty
+                    cmp_res = {}
+                    res_ok = True
+                else:
+                    cmp_res = db_ap.compare(raw_ap)
+                    res_ok = all([r['equal'] for r in cmp_res.itervalues()])
+                if (results is not None and
+                        ('ok' if res_ok else 'mismatch') not in results):
+                    continue
+                yield apnum, dict(
                     result='ok' if res_ok else 'mismatch',
                     result_verbose='AP configuration match' if res_ok else
                                    'AP configuration mismatch',
@@ -168,13 +475,90 @@ class WLC(models.Model):
                     res_ok=res_ok,
                 )
 
-        return results
+        if progress:
+            progress(len(all_ap_numbers), len(all_ap_numbers))
+
+    @classmethod
+    def iter_check_fleet(cls, wlcs=None, workers=8, timeout=None,
+                         inventory=False, **filters):
+        """Check APs of many WLCs (all enabled ones by default).
+
+        DAP tables are fetched concurrently, APs are loaded from DB once
+        and checked in the calling thread. With inventory=True DAPs are
+        read from WLCInventory mirrors and no WLC is contacted. filters
+        (results, search) are passed to iter_check_aps().
+
+        Yields:
+            (wlc, results, error) tuples in the order fetches finish.
+            results is an iter_check_aps() iterator, or None when DAPs of
+            the WLC could not be read and error is the exception.
+        """
+        if wlcs is None:
+            wlcs = cls.objects.filter(enabled__exact=True)
+        wlcs = list(wlcs)
+        db_aps = cls.load_db_aps()
+
+        if inventory:
+            for wlc in wlcs:
+                try:
+                    daps = wlc.inventory.iter_records()
+                except WLCInventory.DoesNotExist as e:
+                    yield wlc, None, e
+                    continue
+                yield wlc, wlc.iter_check_aps(daps=daps, db_aps=db_aps,
+                                              **filters), None
+            return
+
+        def fetch(wlc):
+            return wlc.get_aps(records=True)
+
+        for wlc, daps, error in iter_fan_out(fetch, wlcs, workers=workers,
+                                             timeout=timeout):
+            if error is not None:
+                yield wlc, None, error
+                continue
+            yield wlc, wlc.iter_check_aps(daps=daps, db_aps=db_aps,
+                                          **filters), None
+
+    def check_aps(self, progress=None, inventory=False):
+        """Compare APs configured on WLC with APs in DB.
+
+        Returns:
+            Dictionary of iter_check_aps() results by AP number.
+        """
+        return dict(self.iter_check_aps(progress=progress,
+                                        inventory=inventory))
 
     class Meta(object):
         verbose_name = 'WLC'
         ordering = ['name']
 
 
+@receiver(post_save, sender=WLC)
+@receiver(post_delete, sender=WLC)
+def invalidate_wlc_connections(sender, instance, **kwargs):
+    connection_pool.invalidate(instance.pk)
+    rpc_cache.invalidate(instance.pk)
+
+
+class AutoAccessPointQuerySet(models.QuerySet):
+    def _defined_sql(self):
+        qn = db_connection.ops.quote_name
+        sql = 'EXISTS (SELECT 1 FROM {ap} WHERE {ap}.{sn} = {aap}.{sn})'
+        return sql.format(
+            ap=qn(AccessPoint._meta.db_table),
+            aap=qn(AutoAccessPoint._meta.db_table),
+            sn=qn('serial_number'))
+
+    def with_defined(self):
+        """Annotate rows with defined, read by AutoAccessPoint.is_defined"""
+        return self.extra(select={'defined': self._defined_sql()})
+
+    def filter_defined(self, defined=True):
+        sql = self._defined_sql()
+        return self.extra(where=[sql if defined else 'NOT ' + sql])
+
+
 @python_2_unicode_compatible
 class AutoAccessPoint(models.Model):
     wlc = models.ForeignKey(WLC, verbose_name='WLC')
@@ -184,12 +568,17 @@ class AutoAccessPoint(models.Model):
     model = models.CharField(max_length=16)
     ip_address = models.GenericIPAddressField(verbose_name='IP address',
                                               unique=True)
+    last_seen = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return '{} ({}@{})'.format(self.serial_number, self.number, self.wlc)
 
+    objects = AutoAccessPointQuerySet.as_manager()
+
     @property
     def is_defined(self):
+        if 'defined' in self.__dict__:
+            return bool(self.defined)
         try:
             AccessPoint.objects.get(serial_number__exact=self.serial_number)
             return True
@@ -204,6 +593,9 @@ class AutoAccessPoint(models.Model):
 @python_2_unicode_compatible
 class RadioProfile(models.Model):
     name = models.CharField(max_length=64, primary_key=True)
+    stale = models.BooleanField(default=False, editable=False,
+                                help_text="Missing on master WLC but "
+                                          "still used by some APs")
 
     def __str__(self):
         return self.name
@@ -242,6 +634,10 @@ class AccessPoint(models.Model):
     radio_2_channel = models.IntegerField(default=0, null=True, blank=True)
     radio_2_power = models.IntegerField(default=0, null=True, blank=True)
     radio_2_enable = models.BooleanField(default=False)
+    config_digest = models.CharField(max_length=40, blank=True,
+                                     editable=False,
+                                     help_text="Digest of the attributes "
+                                               "checked by compare()")
 
     class Meta(object):
         ordering = ['name']
@@ -249,6 +645,12 @@ class AccessPoint(models.Model):
     def __str__(self):
         return self.name
 
+    # Per slot values of AP-RADIO attributes which do not come from DB
+    RADIO_DEFAULTS = {
+        1: {'type': 'NG', 'auto_channel': '11'},
+        2: {'type': 'NA', 'auto_channel': '36'},
+    }
+
     def render_xml(self):
         """Render model specific XML to be send to WLC"""
         context = Context({'ap': self})
@@ -256,67 +658,214 @@ class AccessPoint(models.Model):
             'wlcmanager/wlcapi/save_ap/{}.xml'.format(self.model))
         return template.render(context)
 
-    def compare(self, dap):
-        attr_map = {
-            'apnum': str(self.number),
-            'fingerprint': self.fingerprint,
-            'model': self.model,
-            'name': self.name,
-            'serial-id': self.serial_number,
-            'high-latency-mode': 'YES' if self.high_latency else 'NO',
+    def build_xml(self):
+        """Build DAP element to be send to WLC.
+
+        Produces the same DAP as render_xml() without going through
+        the template engine and XML parser.
+        """
+        radios = [self._build_radio_xml(slot) for slot in
+                  range(1, AccessPoint.RADIO_COUNT[self.model] + 1)]
+        return E('DAP',
+                 E('AP-BOOTCONFIG', {'boot-image': ''}),
+                 E('AP-RADIO-TABLE', *radios),
+                 E('AP-ETHERNET-TABLE'),
+                 E('APINFO', E('APCONTACT'), E('APLOCATION'),
+                   E('APDESCRIPTION')),
+                 E('VLAN-PROFILE-REF', name=''),
+                 {'apnum': str(self.number),
+                  'fingerprint': self.fingerprint,
+                  'model': self.model,
+                  'name': self.name,
+                  'high-latency-mode': 'YES' if self.high_latency else 'NO',
+                  'serial-id': self.serial_number,
+                  'type': 'NG'})
+
+    def _build_radio_xml(self, slot):
+        defaults = AccessPoint.RADIO_DEFAULTS[slot]
+        channel = getattr(self, 'radio_{}_channel'.format(slot))
+        power = getattr(self, 'radio_{}_power'.format(slot))
+        profile = getattr(self, 'radio_{}_profile'.format(slot))
+        attrs = {
+            'slot': str(slot),
+            'antenna-mode': 'DUAL-BAND-3SS',
+            'antennatype': 'INTERNAL',
+            'designation': 'INDOOR',
+            'enable': 'YES' if getattr(self, 'radio_{}_enable'.format(slot))
+                      else 'NO',
+            'external-antennas': '0',
+            'force-rebalance': 'NO',
+            'load-balance-enable': 'YES',
+            'load-balance-group': '',
+            'max-tuned-power': 'default',
+            'min-tx-rate': '',
+            'type': defaults['type'],
         }
-        results = self.cmp_elem_attr(dap, attr_map, 'AP: {}')
-
-        radio_list = dap.xpath('.//AP-RADIO')
-        for radio in radio_list:
-            rnum = radio.attrib['slot']
-            attr_map = {
-                'slot': rnum,
-                'auto-config': 'NO',
-                'auto-power-config': 'NO',
-                'enable': 'NO',
-            }
-            if getattr(self, 'radio_{}_enable'.format(rnum)):
-                attr_map['enable'] = 'YES'
-
-            if getattr(self, 'radio_{}_channel'.format(rnum)) == 0:
-                attr_map['auto-config'] = 'YES'
-            else:
-                attr_map['channel'] = getattr(self,
-                                              'radio_{}_channel'.format(rnum))
+        if channel == 0:
+            attrs['auto-config'] = 'YES'
+            attrs['channel'] = defaults['auto_channel']
+        else:
+            attrs['auto-config'] = 'NO'
+            attrs['channel'] = str(channel)
+        if power == 0:
+            attrs['auto-power-config'] = 'YES'
+        else:
+            attrs['auto-power-config'] = 'NO'
+            attrs['tx-power'] = str(power)
+        return E('AP-RADIO',
+                 E('RADIO-PROFILE-REF',
+                   name=profile.name if profile else 'default'),
+                 attrs)
 
-            if getattr(self, 'radio_{}_power'.format(rnum)) == 0:
-                attr_map['auto-power-config'] = 'YES'
-            else:
-                attr_map['tx-power'] = getattr(self,
-                                               'radio_{}_power'.format(rnum))
+    def save(self, *args, **kwargs):
+        self.config_digest = ap_config_digest(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'config_digest'}
+        super(AccessPoint, self).save(*args, **kwargs)
 
-            radio_results = self.cmp_elem_attr(radio, attr_map,
-                                               "Radio {}: {}".format(rnum,
-                                                                     '{}'))
+    @staticmethod
+    def refresh_config_digests(aps):
+        """Recompute config_digest of aps and store those which changed.
 
-            radio_profile = getattr(self, 'radio_{}_profile'.format(rnum))
+        Only save() keeps the stored digest current, rows written by
+        bulk_create() or QuerySet.update() may carry a stale one.
 
-            e_val = radio_profile.name if radio_profile else None
-            o_val = radio[0].attrib['name']
-            radio_results['Radio {}: profile-name'.format(rnum)] = dict(
-                equal=(e_val == o_val),
-                e_val=e_val,
-                o_val=o_val)
+        Returns:
+            Number of APs whose digest was stale.
+        """
+        stale = []
+        for ap in aps:
+            digest = ap_config_digest(ap)
+            if digest != ap.config_digest:
+                ap.config_digest = digest
+                stale.append(ap)
+        # Rare, each row has a different value
+        for ap in stale:
+            AccessPoint.objects.filter(pk=ap.pk).update(
+                config_digest=ap.config_digest)
+        return len(stale)
+
+    @staticmethod
+    def dap_config_digest(dap):
+        """Digest of a DAP element, see ap_config_digest()"""
+        return config_digest(dap_config_items(dap))
+
+    def compare(self, dap):
+        """Compare AP with DAP read from WLC (element or DapRecord).
 
-            results.update(radio_results)
+        Return dictionary of 'AP: <attr>' and 'Radio <slot>: <attr>' keys
+        with e_val (WLC) and o_val (DB) values and whether they are equal.
+        """
+        dap = as_record(dap)
+        plan = compare_plan(self.model)
+        results = {}
+        o_vals = (str(self.number), self.fingerprint, self.model, self.name,
+                  self.serial_number, 'YES' if self.high_latency else 'NO')
+        for key, e_val, o_val in zip(plan.ap_keys, plan.dap_values(dap),
+                                     o_vals):
+            results[key] = dict(equal=e_val == o_val, e_val=e_val,
+                                o_val=o_val)
+
+        for radio in dap.radios:
+            rnum = radio.slot
+            radio_plan = plan.radio(rnum)
+            enable, channel, power, profile = radio_plan.values(self)
+            keys = radio_plan.keys
+
+            values = [('slot', radio.slot, rnum),
+                      ('enable', radio.enable, 'YES' if enable else 'NO')]
+            if channel == 0:
+                values.append(('auto-config', radio.auto_config, 'YES'))
+            else:
+                values += [('auto-config', radio.auto_config, 'NO'),
+                           ('channel', radio.channel, channel)]
+            if power == 0:
+                values.append(('auto-power-config', radio.auto_power_config,
+                               'YES'))
+            else:
+                values += [('auto-power-config', radio.auto_power_config,
+                            'NO'),
+                           ('tx-power', radio.tx_power, power)]
+            for attr, e_val, o_val in values:
+                results[keys[attr]] = dict(equal=_attr_equal(e_val, o_val),
+                                           e_val=e_val, o_val=o_val)
+
+            # DB value is reported as e_val here
+            e_val = profile.name if profile else None
+            o_val = radio.profile_name
+            results[keys['profile-name']] = dict(equal=(e_val == o_val),
+                                                 e_val=e_val, o_val=o_val)
         return results
 
-    def cmp_elem_attr(self, elem, attr_map, kfmt='{}'):
-        res = {}
-        for k, v in attr_map.iteritems():
-            e_val = elem.attrib[k]
-            o_val = v
-            res[kfmt.format(k)] = dict(
-                equal=(e_val == o_val),
-                e_val=e_val,
-                o_val=o_val)
-        return res
+    @classmethod
+    def find_free_numbers(cls, count=1, start=1, contiguous=False):
+        """Find count AP numbers not used by APs nor reservations.
+
+        Gaps are found by a single query using the primary key indexes.
+        With contiguous=True the numbers form one uninterrupted range.
+        """
+        qn = db_connection.ops.quote_name
+        ap_table = qn(cls._meta.db_table)
+        res_table = qn(APNumberReservation._meta.db_table)
+        # Every gap starts right after a used number, start - 1 is
+        # included to find the gap at the very beginning.
+        sql = """
+            SELECT u.n + 1,
+                   (SELECT MIN({num}) FROM {ap} WHERE {num} > u.n),
+                   (SELECT MIN({num}) FROM {res} WHERE {num} > u.n)
+            FROM (SELECT {num} AS n FROM {ap} WHERE {num} >= %s
+                  UNION SELECT {num} FROM {res} WHERE {num} >= %s
+                  UNION SELECT %s) u
+            WHERE NOT EXISTS (SELECT 1 FROM {ap} WHERE {num} = u.n + 1)
+              AND NOT EXISTS (SELECT 1 FROM {res} WHERE {num} = u.n + 1)
+            ORDER BY u.n
+        """.format(ap=ap_table, res=res_table, num=qn('number'))
+        params = [start - 1] * 3
+        if not contiguous:
+            sql += " LIMIT %s"
+            params.append(count)
+
+        numbers = []
+        with db_connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for gap_start, next_ap, next_res in cursor.fetchall():
+                ends = [n for n in (next_ap, next_res) if n is not None]
+                gap_end = min(ends) - 1 if ends else None
+                size = count - len(numbers)
+                if gap_end is not None:
+                    size = min(size, gap_end - gap_start + 1)
+                if contiguous and size < count:
+                    continue
+                numbers.extend(range(gap_start, gap_start + size))
+                if len(numbers) == count:
+                    break
+        return numbers
+
+    @classmethod
+    def reserve_numbers(cls, count=1, start=1, contiguous=False,
+                        ttl=NUMBER_RESERVATION_TTL, attempts=5):
+        """Find free AP numbers and reserve them for ttl seconds.
+
+        Reserved numbers are not returned to anybody else until they
+        expire or an AP with that number is saved.
+        """
+        for attempt in range(attempts):
+            now = timezone.now()
+            try:
+                with transaction.atomic():
+                    APNumberReservation.objects.filter(
+                        expires__lte=now).delete()
+                    numbers = cls.find_free_numbers(count, start, contiguous)
+                    expires = now + timedelta(seconds=ttl)
+                    APNumberReservation.objects.bulk_create(
+                        [APNumberReservation(number=n, expires=expires)
+                         for n in numbers])
+                return numbers
+            except IntegrityError:
+                # Somebody reserved the same number in the meantime
+                continue
+        raise RuntimeError('Unable to reserve {} AP numbers'.format(count))
 
     def clean(self):
         """Make sure that radio 2 properties are set if there are 2 radios"""
@@ -333,3 +882,430 @@ class AccessPoint(models.Model):
             if self.radio_2_power is None:
                 raise ValidationError(msg.format(self.get_model_display(),
                                                  'power'))
+
+
+class APNumberReservation(models.Model):
+    number = models.IntegerField(primary_key=True)
+    expires = models.DateTimeField()
+
+    class Meta(object):
+        ordering = ['number']
+
+
+def _attr_equal(e_val, o_val):
+    if isinstance(o_val, six.integer_types):
+        # Numbers from DB are compared with their XML text
+        return e_val == six.text_type(o_val)
+    return e_val == o_val
+
+
+class RadioComparePlan(object):
+    """Accessors and result keys of one radio slot"""
+
+    ATTRS = ('slot', 'enable', 'auto-config', 'channel',
+             'auto-power-config', 'tx-power', 'profile-name')
+
+    def __init__(self, slot):
+        self.slot = slot
+        # enable, channel, power, profile
+        self.values = operator.attrgetter(*[
+            'radio_{}_{}'.format(slot, field)
+            for field in ('enable', 'channel', 'power', 'profile')])
+        self.keys = {attr: 'Radio {}: {}'.format(slot, attr)
+                     for attr in self.ATTRS}
+
+
+class ComparePlan(object):
+    """Precompiled steps of AccessPoint.compare() for one AP model.
+
+    Radios are taken from the DAP, slots beyond the model's RADIO_COUNT
+    (a DAP of another model) get their plan on first use.
+    """
+
+    dap_values = operator.attrgetter(*[name for name, attr
+                                       in DapRecord.ATTRS])
+
+    def __init__(self, radio_count):
+        self.ap_keys = tuple('AP: {}'.format(attr)
+                             for name, attr in DapRecord.ATTRS)
+        self.radio_plans = {str(slot): RadioComparePlan(slot)
+                            for slot in range(1, radio_count + 1)}
+
+    def radio(self, slot):
+        plan = self.radio_plans.get(slot)
+        if plan is None:
+            plan = self.radio_plans[slot] = RadioComparePlan(slot)
+        return plan
+
+
+_compare_plans = {}
+
+
+def compare_plan(model):
+    """Return (cached) ComparePlan for AP model"""
+    plan = _compare_plans.get(model)
+    if plan is None:
+        plan = _compare_plans[model] = ComparePlan(
+            AccessPoint.RADIO_COUNT.get(model, 2))
+    return plan
+
+
+def ap_config_items(ap):
+    """Return list of configuration values of ap checked by compare().
+
+    Radios are listed in slot order, channel and tx-power only when they
+    are not set automatically. Only plain fields are used, radio profiles
+    are referenced by their primary key and need not be loaded.
+    """
+    items = [str(ap.number), ap.fingerprint, ap.model, ap.name,
+             ap.serial_number, 'YES' if ap.high_latency else 'NO']
+    for slot in range(1, AccessPoint.RADIO_COUNT.get(ap.model, 2) + 1):
+        channel = getattr(ap, 'radio_{}_channel'.format(slot))
+        power = getattr(ap, 'radio_{}_power'.format(slot))
+        enable = getattr(ap, 'radio_{}_enable'.format(slot))
+        items += [str(slot), 'YES' if enable else 'NO']
+        if channel == 0:
+            items.append('YES')
+        else:
+            items += ['NO', None if channel is None else str(channel)]
+        if power == 0:
+            items.append('YES')
+        else:
+            items += ['NO', None if power is None else str(power)]
+        items.append(getattr(ap, 'radio_{}_profile_id'.format(slot)))
+    return items
+
+
+def dap_config_items(dap):
+    """Return list of DAP configuration ordered like ap_config_items()"""
+    dap = as_record(dap)
+    items = list(ComparePlan.dap_values(dap))
+    for radio in dap.radios:
+        items += [radio.slot, radio.enable, radio.auto_config]
+        if radio.auto_config != 'YES':
+            items.append(radio.channel)
+        items.append(radio.auto_power_config)
+        if radio.auto_power_config != 'YES':
+            items.append(radio.tx_power)
+        items.append(radio.profile_name)
+    return items
+
+
+def config_digest(items):
+    """Return hex digest of configuration items.
+
+    Equal digests of an AccessPoint and a DAP mean compare() finds no
+    difference between them.
+    """
+    data = json.dumps(items, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def ap_config_digest(ap):
+    return config_digest(ap_config_items(ap))
+
+
+@receiver(post_save, sender=AccessPoint)
+def release_ap_number(sender, instance, **kwargs):
+    APNumberReservation.objects.filter(number=instance.number).delete()
+
+
+@python_2_unicode_compatible
+class CheckRun(models.Model):
+    """Stored result of WLC.check_aps(), executed outside of requests.
+
+    Runs are queued with enqueue() and picked up by the wlc_run_checks
+    management command.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    wlc = models.ForeignKey(WLC, verbose_name='WLC')
+    status = models.CharField(max_length=16, choices=STATUSES,
+                              default=QUEUED)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    total = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta(object):
+        ordering = ['-created']
+        get_latest_by = 'created'
+
+    def __str__(self):
+        return '{} @ {} ({})'.format(self.wlc, self.created,
+                                     self.get_status_display())
+
+    @property
+    def is_pending(self):
+        return self.status in (CheckRun.QUEUED, CheckRun.RUNNING)
+
+    @classmethod
+    def fail_stale(cls, wlc=None):
+        """Mark runs running longer than CHECK_RUN_TIMEOUT as failed.
+
+        Their worker was killed or lost, they would block new runs of
+        the WLC forever.
+        """
+        now = timezone.now()
+        stale = cls.objects.filter(
+            status=cls.RUNNING,
+            started__lt=now - timedelta(seconds=CHECK_RUN_TIMEOUT))
+        if wlc is not None:
+            stale = stale.filter(wlc=wlc)
+        return stale.update(
+            status=cls.FAILED, finished=now,
+            error='Not finished within {} seconds'.format(CHECK_RUN_TIMEOUT))
+
+    @classmethod
+    def enqueue(cls, wlc):
+        """Queue a check of wlc unless one is already waiting or running"""
+        with transaction.atomic():
+            cls.fail_stale(wlc)
+            pending = cls.objects.filter(
+                wlc=wlc, status__in=(cls.QUEUED, cls.RUNNING)).first()
+            if pending is not None:
+                return pending
+            return cls.objects.create(wlc=wlc)
+
+    @classmethod
+    def claim_next(cls, wlc_ids=None):
+        """Mark the oldest queued run as running and return it"""
+        queued = cls.objects.filter(status=cls.QUEUED)
+        if wlc_ids:
+            queued = queued.filter(wlc_id__in=wlc_ids)
+        for run in queued.order_by('created'):
+            claimed = cls.objects.filter(pk=run.pk, status=cls.QUEUED).update(
+                status=cls.RUNNING, started=timezone.now())
+            if claimed:
+                run.refresh_from_db()
+                return run
+        return None
+
+    def _report_progress(self, done, total):
+        self.done, self.total = done, total
+        CheckRun.objects.filter(pk=self.pk).update(done=done, total=total)
+
+    def execute(self):
+        """Run the check and store its results"""
+        if self.status != CheckRun.RUNNING:
+            self.status = CheckRun.RUNNING
+            self.started = timezone.now()
+            self.save(update_fields=['status', 'started'])
+        try:
+            # Re-run has to see the current state of WLC
+            self.wlc.invalidate_rpc_cache('get_dap')
+            results = self.wlc.check_aps(progress=self._report_progress)
+            with transaction.atomic():
+                CheckResult.objects.bulk_create(
+                    [CheckResult.from_check(self, number, res)
+                     for number, res in results.items()],
+                    batch_size=SYNC_BATCH_SIZE)
+        except RuntimeError as e:
+            self.status = CheckRun.FAILED
+            self.error = '{}'.format(e)
+        except Exception as e:
+            # Anything else must not leave the run running forever
+            self.status = CheckRun.FAILED
+            self.error = '{}: {}'.format(type(e).__name__, e)
+        else:
+            self.status = CheckRun.DONE
+        self.finished = timezone.now()
+        self.save(update_fields=['status', 'error', 'finished'])
+
+    def results_dict(self):
+        """Results in the format returned by WLC.check_aps()"""
+        return collections.OrderedDict(
+            (r.number, r.as_dict()) for r in self.results.order_by('number'))
+
+    def filter_results(self, results=None, search=None, sort='number'):
+        """Return queryset of results filtered like WLC.iter_check_aps().
+
+        sort is a CheckResult.SORT_FIELDS name, prefixed with '-' for
+        descending order.
+        """
+        qs = self.results.all()
+        if results is not None:
+            qs = qs.filter(result__in=results)
+        if search:
+            qs = qs.filter(models.Q(name__icontains=search) |
+                           models.Q(serial_number__icontains=search))
+        if sort.lstrip('-') not in CheckResult.SORT_FIELDS:
+            sort = 'number'
+        return qs.order_by(sort, 'number')
+
+    def result_counts(self):
+        """Return dictionary with number of APs by result"""
+        counts = self.results.values_list('result').annotate(
+            models.Count('pk')).order_by()
+        return dict(counts)
+
+
+class CheckResult(models.Model):
+    RESULTS = ('ok', 'mismatch', 'missing', 'unknown')
+    SORT_FIELDS = ('number', 'result', 'name', 'serial_number')
+
+    run = models.ForeignKey(CheckRun, related_name='results')
+    number = models.IntegerField('AP number')
+    result = models.CharField(max_length=16, db_index=True)
+    result_verbose = models.CharField(max_length=64)
+    name = models.CharField(max_length=64)
+    serial_number = models.CharField(max_length=64)
+    # JSON encoded differing attributes (only for mismatch)
+    details = models.TextField(blank=True)
+
+    class Meta(object):
+        ordering = ['number']
+        unique_together = [('run', 'number')]
+
+    @classmethod
+    def from_check(cls, run, number, res):
+        cmp_res = res.get('cmp_res') or {}
+        details = {k: v for k, v in cmp_res.items() if not v['equal']}
+        return cls(run=run, number=number, result=res['result'],
+                   result_verbose=res['result_verbose'], name=res['name'],
+                   serial_number=res['serial_number'],
+                   details=json.dumps(details) if details else '')
+
+    def as_dict(self):
+        return dict(result=self.result, result_verbose=self.result_verbose,
+                    name=self.name, serial_number=self.serial_number,
+                    cmp_res=json.loads(self.details) if self.details else {})
+
+
+@python_2_unicode_compatible
+class WLCInventory(models.Model):
+    """Mirror of the DAP table of a WLC, see WLC.sync_inventory().
+
+    Checks against the mirror do not contact the WLC and DAPs matching
+    their AccessPoint are found by a join in the database.
+    """
+    wlc = models.OneToOneField(WLC, verbose_name='WLC',
+                               related_name='inventory')
+    synced = models.DateTimeField(null=True, blank=True)
+    dap_count = models.IntegerField('DAPs', default=0)
+
+    class Meta(object):
+        verbose_name_plural = 'WLC inventories'
+
+    def __str__(self):
+        return '{} inventory'.format(self.wlc)
+
+    def store(self, records):
+        """Write DAPs whose content hash changed, delete vanished ones.
+
+        Changed DAPs are deleted and inserted again, both in batches.
+
+        Returns:
+            Dictionary with created, updated, deleted and unchanged counts.
+        """
+        now = timezone.now()
+        existing = dict(self.daps.values_list('number', 'content_hash'))
+
+        seen = set()
+        to_create = []
+        changed = []
+        unchanged = 0
+        for record in records:
+            number = record.number
+            if number in seen:
+                continue
+            seen.add(number)
+            values = WLCDap.values_from_record(record)
+            current = existing.get(number)
+            if current is None:
+                to_create.append(WLCDap(inventory=self, number=number,
+                                        **values))
+            elif current != values['content_hash']:
+                changed.append(WLCDap(inventory=self, number=number,
+                                      **values))
+            else:
+                unchanged += 1
+
+        vanished = [number for number in existing if number not in seen]
+        for chunk in chunks(vanished + [dap.number for dap in changed],
+                            SYNC_BATCH_SIZE):
+            self.daps.filter(number__in=chunk).delete()
+        WLCDap.objects.bulk_create(to_create + changed,
+                                   batch_size=SYNC_BATCH_SIZE)
+
+        self.synced = now
+        self.dap_count = len(seen)
+        self.save(update_fields=['synced', 'dap_count'])
+        return dict(created=len(to_create), updated=len(changed),
+                    deleted=len(vanished), unchanged=unchanged)
+
+    def iter_records(self):
+        """Yield DapRecords of mirrored DAPs with config_digest set.
+
+        DAPs matching the AccessPoint with the same number are yielded
+        without loading their data, only apnum, name and serial_id are
+        set. A check needs nothing else for them.
+        """
+        matching = self.daps.filter_matching().values_list(
+            'number', 'name', 'serial_number', 'config_digest')
+        for number, name, serial_number, digest in matching.iterator():
+            yield DapRecord(apnum=str(number), name=name,
+                            serial_id=serial_number, config_digest=digest)
+
+        other = self.daps.filter_matching(False).values_list(
+            'data', 'config_digest')
+        for data, digest in other.iterator():
+            record = DapRecord.from_data(json.loads(data))
+            record.config_digest = digest
+            yield record
+
+
+class WLCDapQuerySet(models.QuerySet):
+    def _matching_sql(self):
+        qn = db_connection.ops.quote_name
+        sql = ('EXISTS (SELECT 1 FROM {ap} WHERE {ap}.{num} = {dap}.{num} '
+               'AND {ap}.{digest} = {dap}.{digest})')
+        return sql.format(
+            ap=qn(AccessPoint._meta.db_table),
+            dap=qn(WLCDap._meta.db_table),
+            num=qn('number'),
+            digest=qn('config_digest'))
+
+    def filter_matching(self, matching=True):
+        """DAPs with config digest equal to their AccessPoint's"""
+        sql = self._matching_sql()
+        return self.extra(where=[sql if matching else 'NOT ' + sql])
+
+
+class WLCDap(models.Model):
+    inventory = models.ForeignKey(WLCInventory, related_name='daps')
+    number = models.IntegerField('AP number')
+    name = models.CharField(max_length=64)
+    serial_number = models.CharField(max_length=64)
+    # AccessPoint.dap_config_digest(), joined with AccessPoint
+    config_digest = models.CharField(max_length=40)
+    # Digest of data, DAPs are only written when it changes
+    content_hash = models.CharField(max_length=40)
+    # JSON encoded DapRecord.as_data()
+    data = models.TextField()
+
+    objects = WLCDapQuerySet.as_manager()
+
+    class Meta(object):
+        ordering = ['number']
+        unique_together = [('inventory', 'number')]
+
+    @staticmethod
+    def values_from_record(record):
+        data = json.dumps(record.as_data(), separators=(',', ':'))
+        return dict(name=record.name or '',
+                    serial_number=record.serial_id or '',
+                    config_digest=AccessPoint.dap_config_digest(record),
+                    content_hash=hashlib.sha1(
+                        data.encode('utf-8')).hexdigest(),
+                    data=data)
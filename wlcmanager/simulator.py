@@ -0,0 +1,242 @@
+# coding: utf-8
+"""In-process fake WLC for load and latency testing.
+
+Point ``WLCMANAGER_CONNECTION_FACTORY`` at ``wlcmanager.simulator.connect``
+and every WLC talks to a FakeWLC instead of a real controller::
+
+    WLCMANAGER_CONNECTION_FACTORY = 'wlcmanager.simulator.connect'
+    WLCMANAGER_SIMULATOR = {'daps': 5000, 'latency': 0.2, 'error_rate': 0.01}
+
+Controllers are kept in a registry by IP address, use register() to set
+up a particular one.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import random
+import socket
+import threading
+import time
+
+from django.conf import settings
+from jnpr import wlc as jnpr_wlc
+from lxml import etree
+from lxml.builder import E
+
+try:
+    SIMULATOR_OPTIONS = settings.WLCMANAGER_SIMULATOR
+except AttributeError:
+    SIMULATOR_OPTIONS = {}
+
+
+def generate_access_points(count, first_number=1, radio_profile='default',
+                           model='MP_432'):
+    """Yield count unsaved AccessPoints with deterministic attributes.
+
+    config_digest is filled in, the APs are ready for bulk_create().
+    """
+    from .models import AccessPoint, RadioProfile, ap_config_digest
+
+    profile = RadioProfile(name=radio_profile)
+    for number in range(first_number, first_number + count):
+        ap = AccessPoint(
+            number=number,
+            fingerprint='sim:{:012x}'.format(number),
+            model=model,
+            name='SIM-AP{:05d}'.format(number),
+            serial_number='SIM{:08d}'.format(number),
+            high_latency=False,
+            radio_1_profile=profile,
+            radio_2_profile=profile,
+            radio_2_enable=True,
+        )
+        ap.config_digest = ap_config_digest(ap)
+        yield ap
+
+
+def _rpc_error(cmd, code, msg):
+    return jnpr_wlc.RpcError(cmd, E('TRANSACTION', E('ERROR', msg,
+                                                     code=str(code))))
+
+
+class FakeRpcMaker(object):
+    """Stand-in for RpcMaker, only 'set' transactions are supported"""
+
+    def __init__(self, controller, trans):
+        if trans != 'set':
+            raise ValueError("Unsupported transaction {!r}, the simulator "
+                             "handles only 'set'".format(trans))
+        self.controller = controller
+        self.trans = trans
+        self.data = None
+
+    def __call__(self):
+        return self.controller.call('set', self.controller.set_daps,
+                                    self.data)
+
+
+class FakeRpc(object):
+    def __init__(self, controller):
+        self._controller = controller
+
+    # RPCs may be passed extra positional arguments (see compare_config),
+    # they are ignored like by the real client.
+
+    def get_dap(self, *args, **kwargs):
+        return self._controller.call('get_dap', self._controller.dap_table)
+
+    def get_stat_dap_announce_status_table(self, *args, **kwargs):
+        return self._controller.call(
+            'get_stat_dap_announce_status_table',
+            self._controller.announce_table)
+
+    def get_radio_profile(self, *args, **kwargs):
+        return self._controller.call(
+            'get_radio_profile', self._controller.profile_table,
+            'RADIO-PROFILE', self._controller.radio_profiles)
+
+    def get_service_profile(self, *args, **kwargs):
+        return self._controller.call(
+            'get_service_profile', self._controller.profile_table,
+            'SERVICE-PROFILE', self._controller.service_profiles)
+
+    def delete_dap(self, apnum, *args, **kwargs):
+        return self._controller.call('delete_dap',
+                                     self._controller.delete_dap, apnum)
+
+
+class FakeWLC(object):
+    """Simulated controller with the interface of WirelessLanController.
+
+    Every RPC waits latency (plus up to jitter) seconds. With probability
+    error_rate it fails with RpcError, with probability timeout_rate it
+    hangs for hang seconds and raises socket.timeout. DAPs with numbers
+    in reject are refused by 'set' transactions.
+    """
+
+    def __init__(self, daps=0, auto_aps=0, radio_profiles=('default',),
+                 service_profiles=('default',), latency=0, jitter=0,
+                 error_rate=0, timeout_rate=0, hang=30, reject=(),
+                 seed=None, sleep=time.sleep, **ap_options):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.reject = set(reject)
+        self.radio_profiles = list(radio_profiles)
+        self.service_profiles = list(service_profiles)
+        self.sleep = sleep
+        self.random = random.Random(seed)
+        self.rpc = FakeRpc(self)
+        self.connected = False
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._daps = {}
+        self._dap_xml = None
+
+        ap_options.setdefault('radio_profile', self.radio_profiles[0])
+        for ap in generate_access_points(daps, **ap_options):
+            self._daps[ap.number] = ap.build_xml()
+        first_auto = max(self._daps or [0]) + 1
+        self.auto_aps = [
+            {'dapnum': str(ap.number), 'fingerprint': ap.fingerprint,
+             'model': ap.model, 'serial-id': ap.serial_number,
+             'ip-addr': '10.{}.{}.{}'.format(ap.number >> 16 & 255,
+                                             ap.number >> 8 & 255,
+                                             ap.number & 255),
+             'status': 'AUTO'}
+            for ap in generate_access_points(auto_aps, first_auto)]
+
+    def open(self):
+        self.connected = True
+        return self
+
+    def close(self):
+        self.connected = False
+
+    def RpcMaker(self, trans, *args, **kwargs):
+        return FakeRpcMaker(self, trans)
+
+    def call(self, name, handler, *args):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fate = self.random.random()
+        if delay:
+            self.sleep(delay)
+        if fate < self.timeout_rate:
+            self.sleep(self.hang)
+            raise socket.timeout('simulated timeout of {}'.format(name))
+        if fate < self.timeout_rate + self.error_rate:
+            raise _rpc_error(name, 500, 'simulated error')
+        with self._lock:
+            return handler(*args)
+
+    @property
+    def daps(self):
+        """DAPs configured on this controller by AP number"""
+        return self._daps
+
+    def dap_table(self):
+        # Responses are parsed from the wire like the real client does,
+        # serialization is reused until the table changes.
+        xml = self._dap_xml
+        if xml is None:
+            table = E('DAP-TABLE', *[self._daps[n]
+                                     for n in sorted(self._daps)])
+            xml = self._dap_xml = etree.tostring(table)
+        return etree.fromstring(xml)
+
+    def announce_table(self):
+        return E('DAP-ANNOUNCE-STATUS-TABLE', *[
+            E('DAP-ANNOUNCE-STATUS', attrs) for attrs in self.auto_aps])
+
+    def profile_table(self, tag, names):
+        return E(tag + '-TABLE', *[E(tag, name=name) for name in names])
+
+    def delete_dap(self, apnum):
+        apnum = int(apnum)
+        if self._daps.pop(apnum, None) is None:
+            raise _rpc_error('delete_dap', 404,
+                             'DAP {} does not exist'.format(apnum))
+        self._dap_xml = None
+
+    def set_daps(self, data):
+        daps = list(data.iter('DAP'))
+        # The whole transaction fails, nothing is saved
+        for dap in daps:
+            if int(dap.attrib['apnum']) in self.reject:
+                raise _rpc_error('set', 400, 'DAP {} rejected'.format(
+                    dap.attrib['apnum']))
+        for dap in daps:
+            self._daps[int(dap.attrib['apnum'])] = etree.fromstring(
+                etree.tostring(dap))
+        self._dap_xml = None
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def register(ip_address, controller):
+    """Use controller for WLCs with given IP address"""
+    with _registry_lock:
+        _registry[ip_address] = controller
+    return controller
+
+
+def unregister_all():
+    with _registry_lock:
+        _registry.clear()
+
+
+def connect(wlc):
+    """Connection factory, see WLCMANAGER_CONNECTION_FACTORY"""
+    with _registry_lock:
+        controller = _registry.get(wlc.ip_address)
+        if controller is None:
+            controller = _registry[wlc.ip_address] = FakeWLC(
+                **SIMULATOR_OPTIONS)
+    return controller.open()
@@ -3,6 +3,9 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+import json
+import threading
+
 import mock
 
 from django.contrib.admin.sites import AdminSite
@@ -13,9 +16,12 @@ from django.http import HttpRequest
 from django.test import TestCase
 
 
-from ..admin import (WLCAdmin, AutoAccessPointAdmin, RadioProfileAdmin,
-                     AccessPointAdmin)
-from ..models import WLC, AutoAccessPoint, RadioProfile, AccessPoint
+from ..metrics import metrics
+from ..admin import (ROWS_MARKER, FORMS_MARKER, WLCAdmin,
+                     AutoAccessPointAdmin, RadioProfileAdmin,
+                     AccessPointAdmin, DefinedListFilter)
+from ..models import (WLC, AutoAccessPoint, RadioProfile, AccessPoint,
+                      CheckRun, WLCInventory)
 
 from .factories import WLCFactory, AccessPointFactory, AutoAccessPointFactory
 
@@ -92,7 +98,8 @@ class WLCAdminTest(TestCase):
                 as compare_config_mock:
             response = self.wa.compare_config_view(request, wlc.id)
 
-            compare_config_mock.assert_called_once_with(wlc, master_wlc)
+            compare_config_mock.assert_called_once_with(
+                wlc, master_wlc, workers=6, timeout=30)
             self.assertEqual(response.context_data['results'],
                              compare_config_mock.return_value)
 
@@ -109,17 +116,347 @@ class WLCAdminTest(TestCase):
         request.user = AnonymousUser()
         request.META['SCRIPT_NAME'] = None
         wlc = WLCFactory(master=False)
+        run = CheckRun.objects.create(wlc=wlc, status=CheckRun.DONE)
+        run.results.create(number=1234, result='missing',
+                           result_verbose='AP missing on WLC', name='AP1',
+                           serial_number='SN1')
+        pending = CheckRun.objects.create(wlc=wlc, status=CheckRun.RUNNING,
+                                          done=10, total=20)
 
         with mock.patch('wlcmanager.models.WLC.check_aps') \
                 as check_aps_mock:
             response = self.wa.check_aps_view(request, wlc.id)
 
-            check_aps_mock.assert_called_once_with()
-            self.assertEqual(response.context_data['results'],
-                             check_aps_mock.return_value)
+            self.assertFalse(check_aps_mock.called)
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context_data['wlc'], wlc)
+        self.assertEqual(response.context_data['run'], run)
+        self.assertEqual(response.context_data['pending'], pending)
+        self.assertEqual(response.context_data['results'], {
+            1234: dict(result='missing', result_verbose='AP missing on WLC',
+                       name='AP1', serial_number='SN1', cmp_res={})})
+
+    @mock.patch('wlcmanager.admin.loader')
+    def test_check_aps_view_stream(self, loader_mock):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        request.GET['stream'] = '1'
+        wlc = WLCFactory(master=False)
+        loader_mock.render_to_string.return_value = (
+            '<head>' + ROWS_MARKER + '</table>' + FORMS_MARKER + '</html>')
+        templates = {
+            'wlcmanager/admin/check_aps_row.html': lambda c, request:
+            '<row {}>'.format(c['k']),
+            'wlcmanager/admin/check_aps_save_forms.html': lambda c, request:
+            '<forms {} {}>'.format(c['mismatch_numbers'],
+                                   c['missing_numbers']),
+        }
+        loader_mock.get_template.side_effect = \
+            lambda name: mock.MagicMock(render=templates[name])
+        results = [(1, dict(result='ok')), (2, dict(result='mismatch')),
+                   (3, dict(result='missing'))]
+
+        with mock.patch('wlcmanager.models.WLC.iter_check_aps',
+                        return_value=iter(results)) as iter_mock:
+            response = self.wa.check_aps_view(request, wlc.id)
+            chunks = iter(response.streaming_content)
+            # Page head is sent before APs are compared
+            self.assertEqual(next(chunks), b'<head>')
+            content = b''.join(chunks)
+
+        iter_mock.assert_called_once_with(results=None, search='',
+                                          inventory=False)
+        self.assertEqual(content, b'<row 1><row 2><row 3></table>'
+                                  b'<forms [2] [3]></html>')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+
+    @mock.patch('wlcmanager.admin.loader')
+    def test_check_aps_view_stream_error(self, loader_mock):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        request.GET['stream'] = '1'
+        wlc = WLCFactory(master=False)
+        loader_mock.render_to_string.return_value = (
+            ROWS_MARKER + FORMS_MARKER)
+
+        with mock.patch('wlcmanager.models.WLC.get_aps',
+                        side_effect=RuntimeError('<boom>')):
+            response = self.wa.check_aps_view(request, wlc.id)
+            content = b''.join(response.streaming_content)
+
+        self.assertIn(b'Error while fetching data: &lt;boom&gt;', content)
+
+        def iter_check_aps(**kwargs):
+            yield 1, dict(result='ok')
+            raise TypeError('bad DAP')
+
+        with mock.patch('wlcmanager.models.WLC.iter_check_aps',
+                        side_effect=iter_check_aps):
+            response = self.wa.check_aps_view(request, wlc.id)
+            content = b''.join(response.streaming_content)
+
+        self.assertIn(b'Error while checking APs: TypeError: bad DAP',
+                      content)
+        # The rest of the page is still sent
+        render = loader_mock.get_template.return_value.render
+        self.assertIn('mismatch_numbers', render.call_args[0][0])
+
+    @mock.patch('wlcmanager.admin.loader')
+    def test_check_aps_view_stream_cache_age(self, loader_mock):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        request.GET['stream'] = '1'
+        wlc = WLCFactory(master=False)
+        loader_mock.render_to_string.return_value = (
+            ROWS_MARKER + FORMS_MARKER)
+
+        def iter_check_aps(self, **kwargs):
+            self.rpc_ages['get_dap'] = 42.5
+            return iter([])
+
+        with mock.patch.object(WLC, 'iter_check_aps', autospec=True,
+                               side_effect=iter_check_aps), \
+                mock.patch.object(WLC, 'invalidate_rpc_cache') as invalidate:
+            response = self.wa.check_aps_view(request, wlc.id)
+            content = b''.join(response.streaming_content)
+            self.assertFalse(invalidate.called)
+
+            request.GET['refresh'] = '1'
+            response = self.wa.check_aps_view(request, wlc.id)
+            b''.join(response.streaming_content)
+            invalidate.assert_called_once_with('get_dap')
+
+        self.assertIn(b'DAPs were cached 42 s ago. <a href="?stream=1&amp;'
+                      b'refresh=1">Refresh now</a>', content)
+
+    def test_check_aps_view_stream_templates(self):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        request.GET['stream'] = '1'
+        wlc = WLCFactory(master=False)
+        results = [
+            (1, dict(result='ok', result_verbose='OK', name='ap1',
+                     serial_number='sn1')),
+            (2, dict(result='missing', result_verbose='Missing', name='ap2',
+                     serial_number='sn2')),
+        ]
+
+        with mock.patch('wlcmanager.models.WLC.iter_check_aps',
+                        return_value=iter(results)):
+            response = self.wa.check_aps_view(request, wlc.id)
+            content = b''.join(response.streaming_content).decode('utf-8')
+
+        self.assertIn('Live check of {}'.format(wlc), content)
+        self.assertIn('<td>sn1</td>', content)
+        self.assertIn('Save AP 2@{}'.format(wlc.name), content)
+        self.assertIn('value="2" name="ap_numbers"', content)
+        self.assertNotIn(ROWS_MARKER, content)
+        self.assertNotIn(FORMS_MARKER, content)
+        self.assertIn('</html>', content)
+
+    @mock.patch('wlcmanager.admin.loader')
+    def test_check_aps_view_stream_inventory(self, loader_mock):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        request.GET['stream'] = '1'
+        request.GET['inventory'] = '1'
+        wlc = WLCFactory(master=False)
+
+        response = self.wa.check_aps_view(request, wlc.id)
+
+        # Never synced
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, '?')
+
+        inventory = WLCInventory.objects.create(wlc=wlc)
+        loader_mock.render_to_string.return_value = (
+            ROWS_MARKER + FORMS_MARKER)
+        with mock.patch('wlcmanager.models.WLC.iter_check_aps',
+                        return_value=iter([])) as iter_mock:
+            response = self.wa.check_aps_view(request, wlc.id)
+            b''.join(response.streaming_content)
+
+        iter_mock.assert_called_once_with(results=None, search='',
+                                          inventory=True)
+        context = loader_mock.render_to_string.call_args[0][1]
+        self.assertEqual(context['inventory'], inventory)
+
+    def test_sync_inventory_view(self):
+        request = HttpRequest()
+        request.META['HTTP_REFERER'] = 'http://google.com/'
+        wlc = WLCFactory(master=False)
+
+        response = self.wa.sync_inventory_view(request, wlc.id)
+        self.assertEqual(response.status_code, 405)
+
+        request.method = 'POST'
+        counts = dict(created=1, updated=2, deleted=3, unchanged=4)
+        with mock.patch('wlcmanager.models.WLC.sync_inventory',
+                        return_value=counts):
+            response = self.wa.sync_inventory_view(request, wlc.id)
+
+        self.assertEqual(response.status_code, 302)
+        self.wa.message_user.assert_called_once_with(
+            request, 'Inventory of {} synced: 1 created, 2 updated, 3 '
+                     'deleted, 4 unchanged'.format(wlc),
+            level=messages.INFO)
+
+    def test_rpc_metrics_view(self):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        metrics.clear()
+        metrics.observe('WLC1', 'get_dap', 0.25)
+
+        response = self.wa.rpc_metrics_view(request)
+
+        self.assertEqual(response.status_code, 200)
+        row, = response.context_data['rows']
+        self.assertEqual((row['wlc'], row['rpc']), ('WLC1', 'get_dap'))
+        self.assertEqual(row['p99_ms'], 250)
+
+    def fleet_rows(self):
+        wlc1 = WLCFactory(name='WLC1')
+        wlc2 = WLCFactory(name='WLC2')
+        results = [
+            (1, dict(result='ok', name='AP1', serial_number='SN1')),
+            (2, dict(result='mismatch', name='AP2', serial_number='SN2',
+                     cmp_res={'name': dict(equal=False, e_val='AP2',
+                                           o_val='AP-2'),
+                              'model': dict(equal=True, e_val='MP_432',
+                                            o_val='MP_432')})),
+        ]
+        return [(wlc2, None, RuntimeError('boom')),
+                (wlc1, iter(results), None)]
+
+    def test_fleet_check_view(self):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        rows = self.fleet_rows()
+
+        with mock.patch('wlcmanager.models.WLC.iter_check_fleet',
+                        return_value=rows) as fleet_mock:
+            response = self.wa.fleet_check_view(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fleet_mock.call_args[1]['inventory'], False)
+        wlc1, wlc2 = response.context_data['rows']
+        self.assertEqual(wlc1['wlc'].name, 'WLC1')
+        self.assertEqual(list(wlc1['problems']), [2])
+        self.assertIsNone(wlc1['error'])
+        self.assertEqual(wlc2['error'], 'RuntimeError: boom')
+        self.assertEqual(response.context_data['totals'],
+                         [('ok', 1), ('mismatch', 1), ('missing', 0),
+                          ('unknown', 0)])
+
+    def test_fleet_check_view_check_error(self):
+        request = HttpRequest()
+        request.GET['format'] = 'json'
+        wlc1, wlc2 = WLCFactory(name='WLC1'), WLCFactory(name='WLC2')
+
+        def broken():
+            yield 1, dict(result='ok', name='AP1', serial_number='SN1')
+            raise KeyError('apnum')
+
+        rows = [(wlc1, broken(), None),
+                (wlc2, iter([(2, dict(result='ok', name='AP2',
+                                      serial_number='SN2'))]), None)]
+        with mock.patch('wlcmanager.models.WLC.iter_check_fleet',
+                        return_value=rows):
+            response = self.wa.fleet_check_view(request)
+
+        self.assertEqual(response.status_code, 200)
+        wlc1, wlc2 = json.loads(response.content.decode('utf-8'))['wlcs']
+        self.assertTrue(wlc1['error'].startswith('KeyError: '))
+        self.assertEqual(wlc1['ok'], 1)
+        self.assertEqual((wlc2['error'], wlc2['ok']), (None, 1))
+
+    def test_fleet_check_view_json(self):
+        request = HttpRequest()
+        request.GET['format'] = 'json'
+        request.GET['inventory'] = '1'
+
+        with mock.patch('wlcmanager.models.WLC.iter_check_fleet',
+                        return_value=self.fleet_rows()) as fleet_mock:
+            response = self.wa.fleet_check_view(request)
+
+        self.assertEqual(fleet_mock.call_args[1]['inventory'], True)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertTrue(data['inventory'])
+        wlc1, wlc2 = data['wlcs']
+        self.assertEqual(wlc1['aps'], [dict(
+            number=2, result='mismatch', name='AP2', serial_number='SN2',
+            diff={'name': {'wlc': 'AP2', 'db': 'AP-2'}})])
+        self.assertEqual((wlc1['ok'], wlc1['mismatch']), (1, 1))
+        self.assertEqual((wlc2['error'], wlc2['aps']),
+                         ('RuntimeError: boom', []))
+
+    @mock.patch('wlcmanager.admin.CHECK_PAGE_SIZE', 2)
+    def test_check_aps_view_filters(self):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        request.GET.setlist('result', ['missing', 'mismatch', 'bogus'])
+        request.GET['sort'] = '-number'
+        request.GET['page'] = '2'
+        wlc = WLCFactory(master=False)
+        run = CheckRun.objects.create(wlc=wlc, status=CheckRun.DONE)
+        for number, result in ((1, 'missing'), (2, 'ok'), (3, 'mismatch'),
+                               (4, 'missing'), (5, 'missing')):
+            run.results.create(number=number, result=result,
+                               name='AP{}'.format(number),
+                               serial_number='SN{}'.format(number))
+
+        response = self.wa.check_aps_view(request, wlc.id)
+
+        context = response.context_data
+        self.assertEqual(list(context['results']), [3, 1])
+        self.assertEqual(context['page'].paginator.num_pages, 2)
+        self.assertEqual(context['result_filter'], ['missing', 'mismatch'])
+        self.assertEqual(context['result_counts'], [
+            ('ok', 1), ('mismatch', 1), ('missing', 3), ('unknown', 0)])
+        self.assertNotIn('page=', context['page_query'])
+        self.assertNotIn('sort=', context['sort_query'])
+        # Save forms cover all pages
+        self.assertEqual(context['missing_numbers'], [1, 4, 5])
+        self.assertEqual(context['mismatch_numbers'], [3])
+
+    def test_check_aps_view_no_runs(self):
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.META['SCRIPT_NAME'] = None
+        wlc = WLCFactory(master=False)
+
+        response = self.wa.check_aps_view(request, wlc.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context_data['run'])
+        self.assertEqual(response.context_data['pending'].status,
+                         CheckRun.QUEUED)
+        self.assertEqual(response.context_data['results'], {})
+
+    def test_rerun_check_view(self):
+        request = HttpRequest()
+        request.META['HTTP_REFERER'] = 'http://google.com/'
+        wlc = WLCFactory(master=False)
+
+        response = self.wa.rerun_check_view(request, wlc.id)
+        self.assertEqual(response.status_code, 405)
+
+        request.method = 'POST'
+        response = self.wa.rerun_check_view(request, wlc.id)
+        self.wa.rerun_check_view(request, wlc.id)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(wlc.checkrun_set.filter(
+            status=CheckRun.QUEUED).count(), 1)
 
     def test_delete_ap_view_get(self):
         # Wrong method (GET instead of POST)
@@ -299,6 +636,57 @@ class WLCAdminTest(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, request.META['HTTP_REFERER'])
 
+    def test_save_many_aps_view_post(self):
+        wlc = WLCFactory(master=False)
+        ap1 = AccessPointFactory()
+        ap2 = AccessPointFactory()
+        ap3 = AccessPointFactory()
+        error = RuntimeError('some error')
+
+        request = HttpRequest()
+        request.method = 'POST'
+        # AP 1 is listed twice but saved once
+        request.POST['ap_numbers'] = '{},{},7788,{},{},'.format(
+            ap1.number, ap2.number, ap3.number, ap1.number)
+        request.META['HTTP_REFERER'] = 'http://google.com/'
+
+        with mock.patch('wlcmanager.models.WLC.save_aps') \
+                as save_aps_mock:
+            save_aps_mock.return_value = {ap1.number: None,
+                                          ap2.number: error,
+                                          ap3.number: None}
+            response = self.wa.save_many_aps_view(request, wlc.id)
+
+            save_aps_mock.assert_called_once_with([ap1, ap2, ap3],
+                                                  chunk_size=50)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.wa.message_user.call_args_list, [
+            mock.call(request, 'AP 7788 not found', level=messages.ERROR),
+            mock.call(request, 'Error while saving AP {}@{}: '
+                      'some error'.format(ap2.number, wlc),
+                      level=messages.ERROR),
+            mock.call(request, 'Saved 2 APs @{}: {}, {}'.format(
+                wlc, ap1.number, ap3.number), level=messages.SUCCESS),
+        ])
+
+    def test_save_many_aps_view_empty(self):
+        wlc = WLCFactory(master=False)
+        request = HttpRequest()
+        request.method = 'POST'
+        request.POST['ap_numbers'] = ''
+        request.META['HTTP_REFERER'] = 'http://google.com/'
+
+        with mock.patch('wlcmanager.models.WLC._save_aps') \
+                as save_aps_mock:
+            response = self.wa.save_many_aps_view(request, wlc.id)
+
+            self.assertFalse(save_aps_mock.called)
+
+        self.assertEqual(response.status_code, 302)
+        self.wa.message_user.assert_called_once_with(
+            request, 'AP list is empty', level=messages.ERROR)
+
 
 class AutoAccessPointAdminTest(TestCase):
     def setUp(self):
@@ -323,17 +711,49 @@ class AutoAccessPointAdminTest(TestCase):
         self.assertRegexpMatches(rv, 'accesspoint/add/\?auto_sn={}'.format(
             autoap.serial_number))
 
+    def test_changelist_is_defined(self):
+        request = HttpRequest()
+        AccessPointFactory(serial_number='0123456789')
+        AutoAccessPointFactory(serial_number='0123456789')
+        AutoAccessPointFactory(serial_number='1111111111')
+
+        qs = self.aaa.get_queryset(request)
+        with self.assertNumQueries(1):
+            urls = [self.aaa.create_ap_url(ap) for ap in qs]
+
+        self.assertEqual(urls[0], '')
+        self.assertRegexpMatches(urls[1], 'auto_sn=1111111111')
+
+    def test_defined_list_filter(self):
+        AccessPointFactory(serial_number='0123456789')
+        AutoAccessPointFactory(serial_number='0123456789')
+        AutoAccessPointFactory(serial_number='1111111111')
+        request = HttpRequest()
+        qs = self.aaa.get_queryset(request)
+
+        for value, expected in (('yes', ['0123456789']),
+                                ('no', ['1111111111']),
+                                (None, ['0123456789', '1111111111'])):
+            params = {'defined': value} if value else {}
+            list_filter = DefinedListFilter(request, params, AutoAccessPoint,
+                                            self.aaa)
+            self.assertEqual([ap.serial_number for ap in
+                              list_filter.queryset(request, qs)], expected)
+
     def test_refresh_autoaps_not_enabled(self):
         request = HttpRequest()
         request.META['HTTP_REFERER'] = 'http://google.com/'
 
         wlc = WLCFactory(enabled=False)  # noqa
 
-        with mock.patch('wlcmanager.models.WLC.refresh_autoaps') \
-                as refresh_autoaps_mock:
+        with mock.patch('wlcmanager.models.WLC.get_auto_aps') \
+                as get_auto_aps_mock, \
+                mock.patch('wlcmanager.models.WLC.store_autoaps') \
+                as store_autoaps_mock:
             response = self.aaa.refresh_autoaps(request)
 
-            self.assertFalse(refresh_autoaps_mock.called)
+            self.assertFalse(get_auto_aps_mock.called)
+            self.assertFalse(store_autoaps_mock.called)
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, request.META['HTTP_REFERER'])
@@ -344,14 +764,17 @@ class AutoAccessPointAdminTest(TestCase):
 
         wlc = WLCFactory(enabled=True)
 
-        with mock.patch('wlcmanager.models.WLC.refresh_autoaps') \
-                as refresh_autoaps_mock:
+        with mock.patch('wlcmanager.models.WLC.get_auto_aps') \
+                as get_auto_aps_mock, \
+                mock.patch('wlcmanager.models.WLC.store_autoaps') \
+                as store_autoaps_mock:
 
-            refresh_autoaps_mock.side_effect = RuntimeError('some error')
+            get_auto_aps_mock.side_effect = RuntimeError('some error')
 
             response = self.aaa.refresh_autoaps(request)
 
-            refresh_autoaps_mock.assert_called_once_with()
+            get_auto_aps_mock.assert_called_once_with()
+            self.assertFalse(store_autoaps_mock.called)
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, request.META['HTTP_REFERER'])
@@ -359,6 +782,38 @@ class AutoAccessPointAdminTest(TestCase):
             request, 'Error while fetching AP data from {}: some error'.format(
                 wlc), level=messages.ERROR)
 
+    def test_refresh_autoaps_timeout(self):
+        request = HttpRequest()
+        request.META['HTTP_REFERER'] = 'http://google.com/'
+
+        wlc_slow = WLCFactory(enabled=True)
+        wlc_fast = WLCFactory(enabled=True)
+        release = threading.Event()
+
+        def get_auto_aps(wlc):
+            if wlc == wlc_slow:
+                release.wait(5)
+            return [wlc.name]
+
+        with mock.patch('wlcmanager.models.WLC.get_auto_aps',
+                        autospec=True) as get_auto_aps_mock, \
+                mock.patch('wlcmanager.models.WLC.store_autoaps',
+                           autospec=True) as store_autoaps_mock, \
+                mock.patch('wlcmanager.admin.RPC_TIMEOUT', 0.2):
+            get_auto_aps_mock.side_effect = get_auto_aps
+
+            response = self.aaa.refresh_autoaps(request)
+            release.set()
+
+            store_autoaps_mock.assert_called_once_with(wlc_fast,
+                                                       [wlc_fast.name])
+
+        self.assertEqual(response.status_code, 302)
+        self.aaa.message_user.assert_called_once_with(
+            request, 'Error while fetching AP data from {}: '
+            'no response within 0.2 s'.format(wlc_slow),
+            level=messages.ERROR)
+
     def test_refresh_autoaps_ok(self):
         request = HttpRequest()
         request.META['HTTP_REFERER'] = 'http://google.com/'
@@ -366,13 +821,19 @@ class AutoAccessPointAdminTest(TestCase):
         wlc1 = WLCFactory(enabled=True)  # noqa
         wlc2 = WLCFactory(enabled=True)  # noqa
 
-        with mock.patch('wlcmanager.models.WLC.refresh_autoaps') \
-                as refresh_autoaps_mock:
-
+        # The return value is set up front, MagicMock creates it lazily
+        # and workers calling get_auto_aps concurrently could get two.
+        with mock.patch('wlcmanager.models.WLC.get_auto_aps',
+                        return_value=[{'dapnum': '1'}]) \
+                as get_auto_aps_mock, \
+                mock.patch('wlcmanager.models.WLC.store_autoaps') \
+                as store_autoaps_mock:
             response = self.aaa.refresh_autoaps(request)
 
-            self.assertEqual(refresh_autoaps_mock.call_count, 2)
-            refresh_autoaps_mock.assert_called_with()
+            self.assertEqual(get_auto_aps_mock.call_count, 2)
+            self.assertEqual(store_autoaps_mock.call_count, 2)
+            store_autoaps_mock.assert_called_with(
+                get_auto_aps_mock.return_value)
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, request.META['HTTP_REFERER'])
@@ -433,6 +894,8 @@ class RadioProfileAdminTest(TestCase):
 
         with mock.patch('wlcmanager.models.WLC.refresh_radio_profiles') \
                 as refresh_radio_profiles_mock:
+            refresh_radio_profiles_mock.return_value = dict(
+                added=1, kept=2, removed=3, stale=4)
 
             response = self.rpa.refresh_profiles(request)
 
@@ -440,7 +903,9 @@ class RadioProfileAdminTest(TestCase):
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, request.META['HTTP_REFERER'])
-        self.assertFalse(self.rpa.message_user.called)
+        self.rpa.message_user.assert_called_once_with(
+            request, 'Radio profiles refreshed: 1 added, 2 kept, 3 removed, '
+            '4 stale', level=messages.SUCCESS)
 
 
 class AccessPointAdminTest(TestCase):
@@ -504,3 +969,18 @@ class AccessPointAdminTest(TestCase):
         self.assertEqual(request.GET['fingerprint'], autoap.fingerprint)
 
         self.assertFalse(self.apa.message_user.called)
+
+    def test_add_view_post_keeps_number(self):
+        request = HttpRequest()
+        request.method = 'POST'
+        autoap = AutoAccessPointFactory()
+        request.GET['auto_sn'] = autoap.serial_number
+        request.POST['number'] = '7'
+
+        with mock.patch('django.contrib.admin.ModelAdmin.add_view'), \
+                mock.patch('wlcmanager.models.AccessPoint.reserve_numbers') \
+                as reserve_mock:
+            self.apa.add_view(request)
+
+        self.assertFalse(reserve_mock.called)
+        self.assertNotIn('number', request.GET)
@@ -0,0 +1,74 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+from lxml import etree
+import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..cache import cached_call, invalidate, PLAIN_CODEC, XML_CODEC
+
+
+class CachedCallTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fetch = mock.MagicMock(side_effect=lambda: [len(
+            self.fetch.call_args_list)])
+        time_patch = mock.patch('wlcmanager.cache.time')
+        self.time = time_patch.start()
+        self.time.time.return_value = 1000.0
+        self.addCleanup(time_patch.stop)
+
+    def call(self, name='rpc'):
+        return cached_call(1, name, self.fetch, PLAIN_CODEC, ttl=10, stale=20)
+
+    def test_fresh(self):
+        self.assertEqual(self.call(), ([1], 0))
+        self.time.time.return_value += 5
+        self.assertEqual(self.call(), ([1], 5))
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_stale_while_revalidate(self):
+        self.call()
+        self.time.time.return_value += 15
+
+        with mock.patch('wlcmanager.cache._spawn') as spawn:
+            spawn.side_effect = lambda func: func()
+            self.assertEqual(self.call(), ([1], 15))
+
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(self.call(), ([2], 0))
+
+    def test_expired(self):
+        self.call()
+        self.time.time.return_value += 31
+
+        self.assertEqual(self.call(), ([2], 0))
+
+    def test_disabled(self):
+        cached_call(1, 'rpc', self.fetch, ttl=0)
+        cached_call(1, 'rpc', self.fetch, ttl=0)
+
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_invalidate(self):
+        self.call('rpc')
+        self.call('other')
+        invalidate(1, ['rpc'])
+        self.call('rpc')
+        self.call('other')
+
+        self.assertEqual(self.fetch.call_count, 3)
+
+    def test_xml(self):
+        element = etree.XML('<DAP-TABLE><DAP apnum="1"/></DAP-TABLE>')
+        fetch = mock.MagicMock(return_value=element)
+
+        cached_call(1, 'get_dap', fetch, XML_CODEC)
+        rv, age = cached_call(1, 'get_dap', fetch, XML_CODEC)
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(rv[0].attrib['apnum'], '1')
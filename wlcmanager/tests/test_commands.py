@@ -0,0 +1,233 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import json
+import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+from lxml import etree
+
+from ..daps import DapRecord
+from ..models import WLC, CheckRun, WLCInventory
+
+from .factories import AccessPointFactory, RadioProfileFactory, WLCFactory
+
+DAP_FMT = """
+    <DAP apnum="{0}" fingerprint="{1}" model="MP_432" name="{2}"
+         serial-id="{3}" high-latency-mode="NO">
+        <AP-RADIO-TABLE>
+            <AP-RADIO slot="1" auto-config="YES" enable="YES"
+                      auto-power-config="YES">
+                <RADIO-PROFILE-REF name="{4}"/>
+            </AP-RADIO>
+            <AP-RADIO slot="2" auto-config="YES" enable="YES"
+                      auto-power-config="YES">
+                <RADIO-PROFILE-REF name="{4}"/>
+            </AP-RADIO>
+        </AP-RADIO-TABLE>
+    </DAP>"""
+
+
+class RunChecksCommandTest(TestCase):
+    def test_process_queue(self):
+        wlc1 = WLCFactory(name='WLC1')
+        wlc2 = WLCFactory(name='WLC2')
+        CheckRun.enqueue(wlc1)
+        CheckRun.enqueue(wlc2)
+        out = StringIO()
+
+        with mock.patch('wlcmanager.models.WLC.check_aps') as check_aps_mock:
+            check_aps_mock.return_value = {}
+            call_command('wlc_run_checks', 'WLC1', stdout=out)
+
+        self.assertEqual(check_aps_mock.call_count, 1)
+        self.assertEqual(wlc1.checkrun_set.get().status, CheckRun.DONE)
+        self.assertEqual(wlc2.checkrun_set.get().status, CheckRun.QUEUED)
+        self.assertIn('WLC1', out.getvalue())
+
+    def test_enqueue(self):
+        wlc1 = WLCFactory(name='WLC1')
+        wlc2 = WLCFactory(name='WLC2', enabled=False)
+
+        with mock.patch('wlcmanager.models.WLC.check_aps') as check_aps_mock:
+            check_aps_mock.return_value = {}
+            call_command('wlc_run_checks', enqueue=True, stdout=StringIO())
+
+        self.assertEqual(wlc1.checkrun_set.get().status, CheckRun.DONE)
+        self.assertFalse(wlc2.checkrun_set.exists())
+
+    def test_unknown_wlc(self):
+        self.assertRaises(CommandError, call_command, 'wlc_run_checks',
+                          'nope', stdout=StringIO())
+
+
+class CheckCommandTest(TestCase):
+    def setUp(self):
+        self.master = WLCFactory(name='MASTER', master=True)
+        self.wlc = WLCFactory(name='WLC1')
+        WLCFactory(name='DISABLED', enabled=False)
+        profile = RadioProfileFactory(name='default')
+        self.ap = AccessPointFactory(number=10, radio_1_profile=profile,
+                                     radio_2_profile=profile)
+        self.daps = {}
+
+    def dap(self, ap, **overrides):
+        values = dict(number=ap.number, fingerprint=ap.fingerprint,
+                      name=ap.name, serial_number=ap.serial_number,
+                      profile=ap.radio_1_profile.name)
+        values.update(overrides)
+        return etree.XML(DAP_FMT.format(
+            values['number'], values['fingerprint'], values['name'],
+            values['serial_number'], values['profile']))
+
+    def run_command(self, *args, **options):
+        def get_aps(wlc, records=False):
+            res = self.daps[wlc.name]
+            if isinstance(res, Exception):
+                raise res
+            return res
+
+        out = StringIO()
+        status = 0
+        with mock.patch.object(WLC, 'get_aps', autospec=True,
+                               side_effect=get_aps):
+            try:
+                call_command('wlc_check', *args, stdout=out, **options)
+            except SystemExit as e:
+                status = e.code
+        return status, [json.loads(line)
+                        for line in out.getvalue().splitlines()]
+
+    def test_no_drift(self):
+        self.daps = {'MASTER': [self.dap(self.ap)],
+                     'WLC1': [self.dap(self.ap)]}
+
+        status, records = self.run_command(compare=False)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted((r['type'], r['wlc']) for r in records), [
+            ('ap', 'MASTER'), ('ap', 'WLC1'),
+            ('summary', 'MASTER'), ('summary', 'WLC1')])
+        self.assertEqual(records[-1], dict(type='summary', wlc='WLC1', ok=1))
+
+    def test_ap_drift(self):
+        self.daps = {'WLC1': [self.dap(self.ap, name='renamed'),
+                              self.dap(self.ap, number=20)]}
+
+        status, records = self.run_command('WLC1', compare=False)
+
+        self.assertEqual(status, 1)
+        self.assertEqual(records[0], dict(
+            type='ap', wlc='WLC1', number=10, result='mismatch',
+            name=self.ap.name, serial_number=self.ap.serial_number,
+            diff={'AP: name': {'wlc': 'renamed', 'db': self.ap.name}}))
+        self.assertEqual(records[1]['result'], 'unknown')
+        self.assertEqual(records[2], dict(type='summary', wlc='WLC1',
+                                          mismatch=1, unknown=1))
+
+    @mock.patch('wlcmanager.management.commands.wlc_check.compare_config')
+    def test_compare(self, compare_config_mock):
+        compare_config_mock.return_value = [
+            dict(name='Radio Profiles', is_equal=True, errors=[]),
+            dict(name='Access Points', is_equal=False,
+                 errors=['children missing in WLC1: DAP apnum=10'],
+                 diff=dict(added=['DAP apnum=10'], removed=[], changed=[])),
+        ]
+
+        status, records = self.run_command(check=False)
+
+        compare_config_mock.assert_called_once_with(self.wlc, self.master,
+                                                    timeout=30)
+        self.assertEqual(status, 1)
+        self.assertEqual(records[1], dict(
+            type='config', wlc='WLC1', master='MASTER',
+            part='Access Points', equal=False,
+            errors=['children missing in WLC1: DAP apnum=10'],
+            added=['DAP apnum=10'], removed=[], changed=[]))
+        self.assertEqual(records[3], dict(type='summary', wlc='WLC1',
+                                          config_equal=1, config_differ=1))
+
+    def test_error(self):
+        self.daps = {'MASTER': [self.dap(self.ap)],
+                     'WLC1': RuntimeError('boom')}
+
+        status, records = self.run_command(compare=False)
+
+        self.assertEqual(status, 2)
+        errors = [r for r in records if r['type'] == 'error']
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]['wlc'], 'WLC1')
+        self.assertEqual(errors[0]['stage'], 'check')
+
+    def test_malformed_dap(self):
+        self.daps = {'MASTER': [self.dap(self.ap)],
+                     'WLC1': [etree.Element('DAP')]}
+
+        status, records = self.run_command(compare=False)
+
+        self.assertEqual(status, 2)
+        self.assertEqual(sorted((r['type'], r['wlc']) for r in records), [
+            ('ap', 'MASTER'), ('error', 'WLC1'),
+            ('summary', 'MASTER'), ('summary', 'WLC1')])
+        error, = [r for r in records if r['type'] == 'error']
+        self.assertEqual(error['stage'], 'check')
+        self.assertEqual(records[-1], dict(type='summary', wlc='WLC1',
+                                           errors=1))
+
+    def test_no_master(self):
+        self.master.delete()
+        self.assertRaises(CommandError, call_command, 'wlc_check',
+                          stdout=StringIO())
+
+    def test_unknown_wlc(self):
+        self.assertRaises(CommandError, call_command, 'wlc_check',
+                          'DISABLED', stdout=StringIO())
+
+
+class SyncInventoryCommandTest(TestCase):
+    def setUp(self):
+        self.wlc1 = WLCFactory(name='WLC1')
+        self.wlc2 = WLCFactory(name='WLC2')
+        self.ap = AccessPointFactory(number=10)
+        self.records = {'WLC1': [DapRecord.from_element(
+                            self.ap.build_xml())],
+                        'WLC2': RuntimeError('boom')}
+
+    def run_command(self, *args):
+        def get_aps(wlc, records=False):
+            res = self.records[wlc.name]
+            if isinstance(res, Exception):
+                raise res
+            return res
+
+        out = StringIO()
+        err = StringIO()
+        with mock.patch.object(WLC, 'get_aps', autospec=True,
+                               side_effect=get_aps):
+            call_command('wlc_sync_inventory', *args, stdout=out,
+                         stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_sync(self):
+        out, err = self.run_command()
+
+        self.assertEqual(out, 'WLC1: 1 created, 0 updated, 0 deleted, '
+                              '0 unchanged\n')
+        self.assertEqual(err, 'WLC2: RuntimeError: boom\n')
+        self.assertEqual(list(self.wlc1.inventory.daps.values_list(
+            'number', flat=True)), [10])
+        self.assertFalse(WLCInventory.objects.filter(wlc=self.wlc2).exists())
+
+        out, err = self.run_command('WLC1')
+
+        self.assertEqual(out, 'WLC1: 0 created, 0 updated, 0 deleted, '
+                              '1 unchanged\n')
+
+    def test_unknown_wlc(self):
+        self.assertRaises(CommandError, call_command, 'wlc_sync_inventory',
+                          'nope', stdout=StringIO())
@@ -0,0 +1,232 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import mock
+import socket
+import threading
+import unittest
+
+from django.test import TestCase
+
+from ..connections import ConnectionPool, ConnectionPoolTimeout, pool
+
+from .factories import WLCFactory
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.pool = ConnectionPool(size=2, acquire_timeout=5,
+                                   idle_timeout=10, max_age=100,
+                                   clock=self.clock, prune_interval=30)
+        self.factory = mock.MagicMock(side_effect=lambda: mock.MagicMock())
+
+    def use(self, key):
+        with self.pool.get(key, self.factory).checkout() as connection:
+            return connection
+
+    def test_get(self):
+        h1 = self.pool.get((1, 'a'), self.factory)
+        h2 = self.pool.get((1, 'a'), self.factory)
+
+        self.assertIs(h1, h2)
+        self.assertIsNot(h1, self.pool.get((2, 'a'), self.factory))
+        self.assertFalse(self.factory.called)
+
+    def test_hit_miss(self):
+        c1 = self.use((1, 'a'))
+        c2 = self.use((1, 'a'))
+        c3 = self.use((2, 'a'))
+
+        self.assertIs(c1, c2)
+        self.assertIsNot(c1, c3)
+        self.assertEqual(self.factory.call_count, 2)
+        self.assertEqual(self.pool.stats(), dict(size=2, idle=2, hits=1,
+                                                 misses=2, evictions=0))
+
+    def test_idle_timeout(self):
+        c1 = self.use((1, 'a'))
+        self.clock.now += 11
+        c2 = self.use((1, 'a'))
+
+        self.assertIsNot(c1, c2)
+        c1.close.assert_called_once_with()
+        self.assertEqual(self.pool.evictions, 1)
+
+    def test_max_age(self):
+        c1 = self.use((1, 'a'))
+        for i in range(11):
+            self.clock.now += 9
+            self.assertIs(self.use((1, 'a')), c1)
+        self.clock.now += 9
+        self.assertIsNot(self.use((1, 'a')), c1)
+
+    def test_health_check(self):
+        self.pool.health_check = lambda c: False
+        c1 = self.use((1, 'a'))
+        c2 = self.use((1, 'a'))
+
+        self.assertIsNot(c1, c2)
+        self.assertEqual(self.pool.hits, 0)
+
+    def test_invalidate(self):
+        h1 = self.pool.get((1, 'a'), self.factory)
+        c1 = self.use((1, 'a'))
+        c2 = self.use((2, 'a'))
+
+        self.pool.invalidate(1)
+
+        c1.close.assert_called_once_with()
+        self.assertFalse(c2.close.called)
+        self.assertIsNot(self.pool.get((1, 'a'), self.factory), h1)
+        self.assertIsNot(self.use((1, 'a')), c1)
+
+    def test_invalidate_checked_out(self):
+        with self.pool.get((1, 'a'), self.factory).checkout() as c1:
+            self.pool.invalidate(1)
+            self.assertFalse(c1.close.called)
+
+        c1.close.assert_called_once_with()
+        self.assertIsNot(self.use((1, 'a')), c1)
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_prune(self):
+        c1 = self.use((1, 'a'))
+        self.clock.now += 5
+        self.use((2, 'a'))
+        self.clock.now += 6
+
+        self.pool.prune()
+
+        c1.close.assert_called_once_with()
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_prune_from_get(self):
+        c1 = self.use((1, 'a'))
+        self.clock.now += 20
+        self.pool.get((2, 'a'), self.factory)
+        self.assertFalse(c1.close.called)
+
+        self.clock.now += 10
+        self.pool.get((2, 'a'), self.factory)
+
+        c1.close.assert_called_once_with()
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_factory_error(self):
+        self.factory.side_effect = [socket.error, mock.MagicMock()]
+        handle = self.pool.get((1, 'a'), self.factory)
+
+        self.assertRaises(socket.error, handle.rpc.get_dap)
+        self.assertEqual(self.pool.stats()['size'], 0)
+        handle.rpc.get_dap()
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_transport_error_evicts(self):
+        handle = self.pool.get((1, 'a'), self.factory)
+        c1 = self.use((1, 'a'))
+        c1.rpc.get_dap.side_effect = socket.timeout
+        c1.rpc.delete_dap.side_effect = RuntimeError
+
+        self.assertRaises(RuntimeError, handle.rpc.delete_dap, apnum=1)
+        self.assertIs(self.use((1, 'a')), c1)
+        self.assertRaises(socket.timeout, handle.rpc.get_dap)
+
+        c1.close.assert_called_once_with()
+        self.assertIsNot(self.use((1, 'a')), c1)
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_rpc_maker(self):
+        handle = self.pool.get((1, 'a'), self.factory)
+        maker = handle.RpcMaker('set')
+        maker.data = 'data'
+        maker()
+
+        conn = self.use((1, 'a'))
+        conn.RpcMaker.assert_called_once_with('set')
+        self.assertEqual(conn.RpcMaker.return_value.data, 'data')
+        conn.RpcMaker.return_value.assert_called_once_with()
+
+    def test_concurrent_rpcs(self):
+        handle = self.pool.get((1, 'a'), self.factory)
+        release = threading.Event()
+        busy = []
+
+        def get_dap():
+            busy.append(threading.current_thread())
+            release.wait(5)
+
+        def factory():
+            connection = mock.MagicMock()
+            connection.rpc.get_dap.side_effect = get_dap
+            return connection
+
+        self.factory.side_effect = factory
+        threads = [threading.Thread(target=handle.rpc.get_dap)
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        threads[2].join(0.2)
+
+        # Two connections run RPCs at once, the third caller waits
+        self.assertEqual(len(busy), 2)
+        self.assertEqual(self.factory.call_count, 2)
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(busy), 3)
+        self.assertEqual(self.factory.call_count, 2)
+        self.assertEqual(self.pool.stats()['idle'], 2)
+
+    def test_acquire_timeout(self):
+        self.pool.size = 1
+        self.pool.acquire_timeout = 0.05
+        handle = self.pool.get((1, 'a'), self.factory)
+
+        with handle.checkout():
+            self.assertRaises(ConnectionPoolTimeout, handle.rpc.get_dap)
+        handle.rpc.get_dap()
+
+
+class WLCConnectionPoolTest(TestCase):
+    def setUp(self):
+        pool.clear()
+        self.wlc = WLCFactory(name='WLC1', ip_address='1.2.3.4',
+                              username='some_user', password='some_password')
+
+    def test_shared_between_instances(self):
+        make_connection = mock.MagicMock()
+        with mock.patch('wlcmanager.models.WLC.make_connection',
+                        make_connection):
+            wlc_copy = type(self.wlc).objects.get(pk=self.wlc.pk)
+            self.assertIs(self.wlc.connection, wlc_copy.connection)
+            self.wlc.connection.rpc.get_dap()
+            wlc_copy.connection.rpc.get_dap()
+
+        make_connection.assert_called_once_with()
+
+    def test_credentials_change(self):
+        make_connection = mock.MagicMock(
+            side_effect=lambda: mock.MagicMock())
+        with mock.patch('wlcmanager.models.WLC.make_connection',
+                        make_connection):
+            with self.wlc.connection.checkout() as c1:
+                pass
+            self.wlc.password = 'new_password'
+            self.wlc.save()
+            with self.wlc.connection.checkout() as c2:
+                pass
+
+        self.assertIsNot(c1, c2)
+        c1.close.assert_called_once_with()
@@ -0,0 +1,112 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import mock
+import unittest
+
+from django.test import TestCase
+from lxml import etree
+
+from ..daps import DapRecord, RadioRecord, iter_dap_records
+
+from .factories import AccessPointFactory, WLCFactory
+
+DAP_TABLE = b"""
+<DAP-TABLE>
+    <DAP apnum="1" fingerprint="fp1" model="MP_432" name="AP1"
+         serial-id="SN1" high-latency-mode="NO" type="NG">
+        <AP-RADIO-TABLE>
+            <AP-RADIO slot="1" auto-config="NO" channel="3" enable="YES"
+                      auto-power-config="NO" tx-power="6">
+                <RADIO-PROFILE-REF name="default"/>
+            </AP-RADIO>
+            <AP-RADIO slot="2" auto-config="YES" channel="36" enable="NO"
+                      auto-power-config="YES">
+                <RADIO-PROFILE-REF name="default"/>
+            </AP-RADIO>
+        </AP-RADIO-TABLE>
+    </DAP>
+    <DAP apnum="2" fingerprint="fp2" model="MP_432" name="AP2"
+         serial-id="SN2" high-latency-mode="YES"/>
+</DAP-TABLE>
+"""
+
+
+class DapRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.table = etree.XML(DAP_TABLE)
+
+    def test_from_element(self):
+        record = DapRecord.from_element(self.table[0])
+
+        self.assertEqual(record, DapRecord(
+            apnum='1', fingerprint='fp1', model='MP_432', name='AP1',
+            serial_id='SN1', high_latency_mode='NO', radios=(
+                RadioRecord(slot='1', enable='YES', auto_config='NO',
+                            channel='3', auto_power_config='NO',
+                            tx_power='6', profile_name='default'),
+                RadioRecord(slot='2', enable='NO', auto_config='YES',
+                            channel='36', auto_power_config='YES',
+                            profile_name='default'))))
+        self.assertEqual(record.number, 1)
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_shared_values(self):
+        first, second = [DapRecord.from_element(dap) for dap in self.table]
+
+        self.assertIs(first.model, second.model)
+        self.assertIs(first.radios[0].profile_name,
+                      first.radios[1].profile_name)
+
+    def test_unexpected_field(self):
+        self.assertRaises(TypeError, DapRecord, apnum='1', type='NG')
+
+    def test_iter_element(self):
+        records = list(iter_dap_records(self.table))
+
+        self.assertEqual([r.apnum for r in records], ['1', '2'])
+        # Converted DAPs are removed from the table
+        self.assertEqual(len(self.table), 0)
+
+    def test_iter_serialized(self):
+        expected = [DapRecord.from_element(dap) for dap in self.table]
+
+        self.assertEqual(list(iter_dap_records(DAP_TABLE)), expected)
+
+    @mock.patch('wlcmanager.daps.PARSE_CHUNK_SIZE', 7)
+    def test_iter_serialized_chunks(self):
+        expected = [DapRecord.from_element(dap) for dap in self.table]
+
+        self.assertEqual(list(iter_dap_records(DAP_TABLE)), expected)
+
+    def test_iter_serialized_malformed(self):
+        self.assertRaises(etree.XMLSyntaxError, list,
+                          iter_dap_records(DAP_TABLE[:-20]))
+
+
+class GetApRecordsTest(TestCase):
+    def setUp(self):
+        self.wlc = WLCFactory()
+        self.wlc.make_connection = mock.MagicMock()
+        self.rpc = self.wlc.make_connection.return_value.rpc
+        self.rpc.get_dap.side_effect = lambda: etree.XML(DAP_TABLE)
+
+    def test_get_aps_records(self):
+        with mock.patch('wlcmanager.cache.RPC_CACHE_TTL', 60):
+            live = self.wlc.get_aps(records=True)
+            cached = self.wlc.get_aps(records=True)
+            tree = self.wlc.get_aps()
+
+        self.assertEqual(self.rpc.get_dap.call_count, 1)
+        self.assertEqual([r.apnum for r in live], ['1', '2'])
+        self.assertEqual(cached, live)
+        self.assertEqual(len(tree), 2)
+
+    def test_compare_record(self):
+        ap = AccessPointFactory(number=1)
+        dap = ap.build_xml()
+
+        self.assertEqual(ap.compare(DapRecord.from_element(dap)),
+                         ap.compare(dap))
@@ -0,0 +1,160 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import mock
+import socket
+import unittest
+
+from django.test import TestCase
+from lxml import etree
+from lxml.builder import E
+
+from ..metrics import (InstrumentedConnection, RpcMetrics, metrics,
+                       percentile)
+
+from .factories import WLCFactory
+
+
+class PercentileTest(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 90), 7)
+        self.assertIsNone(percentile([], 50))
+
+
+class RpcMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = RpcMetrics(samples=3)
+
+    def test_snapshot(self):
+        for duration in (0.4, 0.1, 0.2, 0.3):
+            self.metrics.observe('WLC1', 'get_dap', duration, size=10)
+        self.metrics.observe('WLC1', 'get_dap', 5, 'timeout')
+        self.metrics.observe('WLC0', 'delete_dap', 1, 'error')
+
+        rows = self.metrics.snapshot()
+
+        self.assertEqual([(r['wlc'], r['rpc']) for r in rows],
+                         [('WLC0', 'delete_dap'), ('WLC1', 'get_dap')])
+        row = rows[1]
+        self.assertEqual((row['count'], row['ok'], row['error'],
+                          row['timeout']), (5, 4, 0, 1))
+        self.assertEqual(row['payload_bytes'], 40)
+        self.assertEqual(row['mean_payload'], 8)
+        self.assertAlmostEqual(row['mean'], 6.0 / 5)
+        # Only the last 3 samples are used for percentiles
+        self.assertEqual((row['p50'], row['max']), (0.3, 5))
+
+    def test_render_prometheus(self):
+        self.metrics.observe('WLC "1"', 'get_dap', 0.3, size=10)
+        self.metrics.observe('WLC "1"', 'get_dap', 20, 'timeout')
+
+        text = self.metrics.render_prometheus()
+
+        labels = 'wlc="WLC \\"1\\"",rpc="get_dap"'
+        self.assertIn('wlcmanager_rpc_total{{{},outcome="timeout"}} 1'
+                      .format(labels), text)
+        self.assertIn('wlcmanager_rpc_duration_seconds_bucket{{{},le="0.25"}}'
+                      ' 0'.format(labels), text)
+        self.assertIn('wlcmanager_rpc_duration_seconds_bucket{{{},le="0.5"}}'
+                      ' 1'.format(labels), text)
+        self.assertIn('wlcmanager_rpc_duration_seconds_bucket{{{},le="+Inf"}}'
+                      ' 2'.format(labels), text)
+        self.assertIn('wlcmanager_rpc_duration_seconds_count{{{}}} 2'
+                      .format(labels), text)
+        self.assertIn('wlcmanager_rpc_payload_bytes_total{{{}}} 10'
+                      .format(labels), text)
+
+
+class InstrumentedConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = RpcMetrics()
+        self.wrapped = mock.MagicMock()
+        self.conn = InstrumentedConnection(self.wrapped, 'WLC1',
+                                           self.metrics)
+
+    @mock.patch('wlcmanager.metrics.METRICS_PAYLOAD_SIZE', True)
+    def test_rpc(self):
+        self.wrapped.rpc.get_dap.return_value = E('DAP-TABLE')
+
+        rv = self.conn.rpc.get_dap(apnum=1)
+
+        self.wrapped.rpc.get_dap.assert_called_once_with(apnum=1)
+        self.assertIs(rv, self.wrapped.rpc.get_dap.return_value)
+        row, = self.metrics.snapshot()
+        self.assertEqual((row['rpc'], row['ok']), ('get_dap', 1))
+        self.assertEqual(row['payload_bytes'], len(b'<DAP-TABLE/>'))
+
+    def test_rpc_payload_size_off(self):
+        self.wrapped.rpc.get_dap.return_value = E('DAP-TABLE')
+
+        with mock.patch('wlcmanager.metrics.etree.tostring') as tostring:
+            self.conn.rpc.get_dap()
+
+        self.assertFalse(tostring.called)
+        row, = self.metrics.snapshot()
+        self.assertEqual(row['payload_bytes'], 0)
+
+    def test_rpc_failure(self):
+        self.wrapped.rpc.get_dap.side_effect = RuntimeError
+        self.wrapped.rpc.delete_dap.side_effect = socket.timeout
+
+        self.assertRaises(RuntimeError, self.conn.rpc.get_dap)
+        self.assertRaises(socket.timeout, self.conn.rpc.delete_dap)
+
+        rows = self.metrics.snapshot()
+        self.assertEqual([(r['rpc'], r['error'], r['timeout'])
+                          for r in rows],
+                         [('delete_dap', 0, 1), ('get_dap', 1, 0)])
+
+    @mock.patch('wlcmanager.metrics.METRICS_PAYLOAD_SIZE', True)
+    def test_rpc_maker(self):
+        rpc = self.conn.RpcMaker('set')
+        rpc.data = E('DAP-TABLE', E('DAP'))
+        rpc()
+
+        self.wrapped.RpcMaker.assert_called_once_with('set')
+        maker = self.wrapped.RpcMaker.return_value
+        self.assertIs(maker.data, rpc.data)
+        maker.assert_called_once_with()
+        row, = self.metrics.snapshot()
+        self.assertEqual(row['rpc'], 'set DAP-TABLE')
+        self.assertEqual(row['payload_bytes'],
+                         len(etree.tostring(maker.data)))
+
+    def test_passthrough(self):
+        self.assertIs(self.conn.close, self.wrapped.close)
+
+
+class WLCMetricsTest(TestCase):
+    def setUp(self):
+        metrics.clear()
+        self.wlc = WLCFactory(name='WLC1')
+
+    def test_wlc_connection(self):
+        make_connection = mock.MagicMock()
+        make_connection.return_value.rpc.get_dap.return_value = \
+            E('DAP-TABLE')
+        self.wlc.make_connection = make_connection
+
+        self.wlc.get_aps()
+
+        row, = metrics.snapshot()
+        self.assertEqual((row['wlc'], row['rpc'], row['count']),
+                         ('WLC1', 'get_dap', 1))
+
+    def test_prometheus_view(self):
+        metrics.observe('WLC1', 'get_dap', 0.1)
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'wlcmanager_rpc_duration_seconds_count{wlc="WLC1",'
+                      b'rpc="get_dap"} 1', response.content)
@@ -3,13 +3,20 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+from datetime import timedelta
+
 from lxml import etree
 import mock
 
 from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.utils import timezone
 
-from ..models import RadioProfile, AccessPoint
+from ..daps import DapRecord
+from ..models import (WLC, RadioProfile, AutoAccessPoint, AccessPoint,
+                      APNumberReservation, CheckRun, ComparePlan,
+                      WLCInventory, ap_config_digest, compare_plan)
+from ..utils import xml_compare
 
 from .factories import (WLCFactory, RadioProfileFactory,
                         AutoAccessPointFactory, AccessPointFactory)
@@ -59,9 +66,11 @@ class WLCTest(TestCase):
         c1 = self.wlc.connection
         c2 = self.wlc.connection
 
+        self.assertIs(c1, c2)
+        self.assertFalse(make_connection.called)
+        with c1.checkout() as c:
+            self.assertIs(c.wrapped, conn_instance)
         make_connection.assert_called_once_with()
-        self.assertIs(c1, conn_instance)
-        self.assertIs(c2, conn_instance)
 
     def test_get_auto_aps(self):
         make_connection = mock.MagicMock()
@@ -84,7 +93,9 @@ class WLCTest(TestCase):
     def test_get_aps(self):
         make_connection = mock.MagicMock()
         conn_instance = make_connection.return_value
-        dap_list_instance = conn_instance.rpc.get_dap.return_value
+        dap_list_instance = etree.XML(
+            '<DAP-TABLE><DAP apnum="1"/></DAP-TABLE>')
+        conn_instance.rpc.get_dap.return_value = dap_list_instance
 
         self.wlc.make_connection = make_connection
         rv = self.wlc.get_aps()
@@ -92,10 +103,18 @@ class WLCTest(TestCase):
         conn_instance.rpc.get_dap.assert_called_once_with()
         self.assertIs(rv, dap_list_instance)
 
+        # Served from cache
+        rv = self.wlc.get_aps()
+
+        conn_instance.rpc.get_dap.assert_called_once_with()
+        self.assertEqual(etree.tostring(rv), etree.tostring(dap_list_instance))
+        self.assertIn('get_dap', self.wlc.rpc_ages)
+
     def test_get_radio_profiles(self):
         make_connection = mock.MagicMock()
         conn_instance = make_connection.return_value
-        rp_list_instance = conn_instance.rpc.get_radio_profile.return_value
+        rp_list_instance = etree.XML('<RADIO-PROFILE-TABLE/>')
+        conn_instance.rpc.get_radio_profile.return_value = rp_list_instance
 
         self.wlc.make_connection = make_connection
         rv = self.wlc.get_radio_profiles()
@@ -122,6 +141,32 @@ class WLCTest(TestCase):
         get_radio_profiles.assert_called_once_with()
         self.assertEqual(RadioProfile.objects.count(), 2)
 
+    def test_refresh_radio_profiles_referenced(self):
+        self.wlc.get_radio_profiles = mock.MagicMock(return_value=[
+            etree.Element("rp", name="kept"),
+            etree.Element("rp", name="new"),
+        ])
+        kept = RadioProfileFactory(name='kept')
+        RadioProfileFactory(name='unused')
+        AccessPointFactory(radio_1_profile__name='used',
+                           radio_2_profile=kept)
+        # Only APs using vanished profiles are read, one chunk at a time
+        with mock.patch('wlcmanager.models.SYNC_BATCH_SIZE', 2):
+            rv = self.wlc.refresh_radio_profiles()
+
+        self.assertEqual(rv, dict(added=1, kept=1, removed=1, stale=1))
+        self.assertEqual(
+            sorted(RadioProfile.objects.values_list('name', 'stale')),
+            [('kept', False), ('new', False), ('used', True)])
+
+        # Profile is back on WLC
+        self.wlc.get_radio_profiles.return_value.append(
+            etree.Element("rp", name="used"))
+        rv = self.wlc.refresh_radio_profiles()
+
+        self.assertEqual(rv, dict(added=0, kept=3, removed=0, stale=0))
+        self.assertFalse(RadioProfile.objects.filter(stale=True).exists())
+
     def test_refresh_autoaps(self):
         get_auto_aps = mock.MagicMock()
         get_auto_aps.return_value = [
@@ -180,6 +225,93 @@ class WLCTest(TestCase):
         self.assertEqual(self.wlc.autoaccesspoint_set.count(), 1)
         self.assertEqual(wlc2.autoaccesspoint_set.count(), 0)
 
+    def test_store_autoaps_diff(self):
+        unchanged = AutoAccessPointFactory(
+            wlc=self.wlc, serial_number='0123456789', fingerprint='fp1',
+            number=9999, model='MP_432', ip_address='10.11.12.13')
+        changed = AutoAccessPointFactory(
+            wlc=self.wlc, serial_number='9123456789', fingerprint='fp2',
+            number=9998, model='MP_432', ip_address='10.11.12.14')
+        vanished = AutoAccessPointFactory(wlc=self.wlc)
+        other_wlc = AutoAccessPointFactory()
+
+        auto_aps = [
+            {'serial-id': '0123456789', 'fingerprint': 'fp1',
+             'dapnum': '9999', 'model': 'MP_432', 'ip-addr': '10.11.12.13'},
+            {'serial-id': '9123456789', 'fingerprint': 'fp2',
+             'dapnum': '9997', 'model': 'MP_432', 'ip-addr': '10.11.12.14'},
+            {'serial-id': '5555555555', 'fingerprint': 'fp3',
+             'dapnum': '9996', 'model': 'MP_522', 'ip-addr': '10.11.12.15'},
+        ]
+
+        # savepoint, load fetched, load own, delete vanished and changed,
+        # touch unchanged, insert new and changed, release
+        with self.assertNumQueries(7):
+            rv = self.wlc.store_autoaps(auto_aps)
+
+        self.assertEqual(rv, dict(created=1, updated=1, deleted=1,
+                                  unchanged=1))
+        self.assertEqual(self.wlc.autoaccesspoint_set.get(
+            serial_number=changed.serial_number).number, 9997)
+        new = self.wlc.autoaccesspoint_set.get(serial_number='5555555555')
+        self.assertEqual(new.model, 'MP_522')
+        self.assertFalse(self.wlc.autoaccesspoint_set.filter(
+            serial_number=vanished.serial_number).exists())
+        self.assertTrue(other_wlc.wlc.autoaccesspoint_set.filter(
+            serial_number=other_wlc.serial_number).exists())
+        for ap in self.wlc.autoaccesspoint_set.all():
+            self.assertIsNotNone(ap.last_seen)
+        self.assertEqual(self.wlc.autoaccesspoint_set.get(
+            serial_number=unchanged.serial_number).last_seen, new.last_seen)
+
+    def test_store_autoaps_nothing_changed(self):
+        AutoAccessPointFactory(
+            wlc=self.wlc, serial_number='0123456789', fingerprint='fp1',
+            number=9999, model='MP_432', ip_address='10.11.12.13')
+        auto_aps = [
+            {'serial-id': '0123456789', 'fingerprint': 'fp1',
+             'dapnum': '9999', 'model': 'MP_432', 'ip-addr': '10.11.12.13'},
+        ]
+
+        # savepoint, load fetched, load own, touch unchanged, release
+        with self.assertNumQueries(5):
+            rv = self.wlc.store_autoaps(auto_aps)
+
+        self.assertEqual(rv, dict(created=0, updated=0, deleted=0,
+                                  unchanged=1))
+
+    def test_store_autoaps_swap_addresses(self):
+        AutoAccessPointFactory(
+            wlc=self.wlc, serial_number='1', fingerprint='fp1',
+            number=1, model='MP_432', ip_address='10.11.12.1')
+        AutoAccessPointFactory(
+            wlc=self.wlc, serial_number='2', fingerprint='fp2',
+            number=2, model='MP_432', ip_address='10.11.12.2')
+        # Not seen by its WLC since, the address was reassigned
+        stale = AutoAccessPointFactory(ip_address='10.11.12.3')
+        other_wlc = AutoAccessPointFactory()
+        auto_aps = [
+            {'serial-id': '1', 'fingerprint': 'fp1', 'dapnum': '1',
+             'model': 'MP_432', 'ip-addr': '10.11.12.2'},
+            {'serial-id': '2', 'fingerprint': 'fp2', 'dapnum': '2',
+             'model': 'MP_432', 'ip-addr': '10.11.12.1'},
+            {'serial-id': '3', 'fingerprint': 'fp3', 'dapnum': '3',
+             'model': 'MP_432', 'ip-addr': '10.11.12.3'},
+        ]
+
+        rv = self.wlc.store_autoaps(auto_aps)
+
+        self.assertEqual(rv, dict(created=1, updated=2, deleted=1,
+                                  unchanged=0))
+        self.assertEqual(
+            dict(self.wlc.autoaccesspoint_set.values_list(
+                'serial_number', 'ip_address')),
+            {'1': '10.11.12.2', '2': '10.11.12.1', '3': '10.11.12.3'})
+        self.assertFalse(AutoAccessPoint.objects.filter(
+            serial_number=stale.serial_number).exists())
+        self.assertTrue(AutoAccessPoint.objects.filter(
+            serial_number=other_wlc.serial_number).exists())
+
     def test_delete_ap(self):
         make_connection = mock.MagicMock()
         conn_instance = make_connection.return_value
@@ -207,7 +339,7 @@ class WLCTest(TestCase):
     def test_save_ap(self):
         make_connection = mock.MagicMock()
         ap = mock.MagicMock()
-        ap.render_xml.return_value = "<someXML>sth</someXML>"
+        ap.build_xml.return_value = etree.XML("<someXML>sth</someXML>")
         conn_instance = make_connection.return_value
         rpc_instance = conn_instance.RpcMaker.return_value
 
@@ -215,28 +347,69 @@ class WLCTest(TestCase):
 
         self.wlc.save_ap(ap)
 
-        ap.render_xml.assert_called_once_with()
+        ap.build_xml.assert_called_once_with()
         conn_instance.RpcMaker.assert_called_once_with('set')
         self.assertEqual(etree.tostring(rpc_instance.data),
                          '<DAP-TABLE><someXML>sth</someXML></DAP-TABLE>')
         rpc_instance.assert_called_once_with()
 
+    def test_save_aps_chunks(self):
+        aps = [mock.MagicMock(number=i) for i in range(5)]
+        self.wlc._save_aps = mock.MagicMock()
+
+        rv = self.wlc.save_aps(aps, chunk_size=2)
+
+        self.assertEqual(self.wlc._save_aps.call_args_list, [
+            mock.call(aps[0:2]), mock.call(aps[2:4]), mock.call(aps[4:5])])
+        self.assertEqual(rv, dict((i, None) for i in range(5)))
+
+    def test_save_aps_bisect(self):
+        aps = [mock.MagicMock(number=i) for i in range(8)]
+        error = RuntimeError('bad AP')
+
+        def save_aps(chunk):
+            if aps[5] in chunk:
+                raise error
+        self.wlc._save_aps = mock.MagicMock(side_effect=save_aps)
+
+        rv = self.wlc.save_aps(aps, chunk_size=4)
+
+        self.assertEqual(rv, dict((i, error if i == 5 else None)
+                                  for i in range(8)))
+        # chunk 0-3, chunk 4-7, bisect 4-5 / 6-7, bisect 4 / 5
+        self.assertEqual(self.wlc._save_aps.call_count, 6)
+
+    def test_save_ap_invalidates_cache(self):
+        self.wlc.make_connection = mock.MagicMock()
+        rpc = self.wlc.make_connection.return_value.rpc
+        rpc.get_dap.return_value = etree.XML('<DAP-TABLE/>')
+        ap = mock.MagicMock()
+        ap.build_xml.return_value = etree.XML("<DAP/>")
+
+        self.wlc.get_aps()
+        self.wlc.save_ap(ap)
+        self.wlc.get_aps()
+        self.wlc.delete_ap(1234)
+        self.wlc.get_aps()
+
+        self.assertEqual(rpc.get_dap.call_count, 3)
+
     def test_check_aps_empty(self):
         self.wlc.get_aps = mock.MagicMock()
 
         rv = self.wlc.check_aps()
 
-        self.wlc.get_aps.assert_called_once_with()
+        self.wlc.get_aps.assert_called_once_with(records=True)
         self.assertEqual(rv, {})
 
     def test_check_aps(self):
         self.wlc.get_aps = mock.MagicMock()
-        dap_notequal = mock.MagicMock(attrib={
-            'apnum': '1234', 'serial-id': 'notequal', 'name': 'noteqaulAP'})
-        dap_equal = mock.MagicMock(attrib={
-            'apnum': '5555', 'serial-id': 'equal123', 'name': 'eqaulAP'})
-        dap_unknown = mock.MagicMock(attrib={
-            'apnum': '9999', 'serial-id': 'notexists', 'name': 'unknownAP'})
+        dap_notequal = DapRecord(apnum='1234', serial_id='notequal',
+                                 name='noteqaulAP')
+        dap_equal = DapRecord(apnum='5555', serial_id='equal123',
+                              name='eqaulAP')
+        dap_unknown = DapRecord(apnum='9999', serial_id='notexists',
+                                name='unknownAP')
 
         self.wlc.get_aps.return_value = [dap_unknown, dap_equal, dap_notequal]
 
@@ -246,14 +419,14 @@ class WLCTest(TestCase):
 
         with mock.patch.object(AccessPoint, 'compare') as compare_patch:
             def compare_patch_side_effect(dap):
-                return {'attr': {'equal': dap.attrib['apnum'] == '5555'}}
+                return {'attr': {'equal': dap.apnum == '5555'}}
 
             compare_patch.side_effect = compare_patch_side_effect
             rv = self.wlc.check_aps()
             compare_patch.assert_has_calls([mock.call(dap_notequal),
                                             mock.call(dap_equal)])
 
-        self.wlc.get_aps.assert_called_once_with()
+        self.wlc.get_aps.assert_called_once_with(records=True)
         self.assertEqual(len(rv), 4)
 
         self.maxDiff = None
@@ -271,8 +444,8 @@ class WLCTest(TestCase):
         self.assertEqual(rv[9999], {
             'result': 'unknown',
             'result_verbose': 'AP present on WLC but missing in DB',
-            'name': dap_unknown.attrib['name'],
-            'serial_number': dap_unknown.attrib['serial-id'],
+            'name': dap_unknown.name,
+            'serial_number': dap_unknown.serial_id,
             'raw_ap': dap_unknown,
         })
 
@@ -300,6 +473,118 @@ class WLCTest(TestCase):
             'cmp_res': {u'attr': {u'equal': True}},
         })
 
+    def test_iter_check_aps_filters(self):
+        self.wlc.get_aps = mock.MagicMock(return_value=[
+            DapRecord(apnum=str(n), serial_id='SN{}'.format(n),
+                      name='wlc-AP{}'.format(n))
+            for n in (1, 2, 3)])
+        for n in (2, 3, 4):
+            AccessPointFactory(number=n, name='db-AP{}'.format(n))
+
+        def check(**filters):
+            return [(n, r['result'])
+                    for n, r in self.wlc.iter_check_aps(**filters)]
+
+        with mock.patch.object(AccessPoint, 'compare') as compare_patch:
+            compare_patch.side_effect = lambda dap: {'attr': {
+                'equal': dap.apnum == '2'}}
+
+            # Nothing has to be compared
+            self.assertEqual(check(results=['missing', 'unknown']),
+                             [(1, 'unknown'), (4, 'missing')])
+            self.assertFalse(compare_patch.called)
+
+            self.assertEqual(check(results=['mismatch']), [(3, 'mismatch')])
+            self.assertEqual(check(search='WLC-AP'), [(1, 'unknown')])
+            self.assertEqual(check(search='db-ap3'), [(3, 'mismatch')])
+            self.assertEqual(compare_patch.call_count, 3)
+
+    def test_check_aps_digest(self):
+        ap_equal = AccessPointFactory(number=10)
+        ap_changed = AccessPointFactory(number=11)
+        dap_equal = ap_equal.build_xml()
+        dap_changed = ap_changed.build_xml()
+        dap_changed.attrib['name'] = 'renamed'
+        self.wlc.get_aps = mock.MagicMock(return_value=[dap_equal,
+                                                        dap_changed])
+
+        with mock.patch.object(AccessPoint, 'compare',
+                               autospec=True) as compare_patch:
+            compare_patch.return_value = {'attr': {'equal': False}}
+            rv = self.wlc.check_aps()
+
+        # Only the AP with different digest is compared attribute by
+        # attribute
+        compare_patch.assert_called_once_with(
+            ap_changed, DapRecord.from_element(dap_changed))
+        self.assertEqual(rv[10]['result'], 'ok')
+        self.assertEqual(rv[10]['cmp_res'], {})
+        self.assertEqual(rv[11]['result'], 'mismatch')
+
+    def test_check_aps_stale_digest(self):
+        ap = AccessPointFactory(number=10)
+        dap = ap.build_xml()
+        # Written without save(), the stored digest still matches the DAP
+        AccessPoint.objects.filter(pk=ap.pk).update(name='renamed')
+        self.wlc.get_aps = mock.MagicMock(return_value=[dap])
+
+        rv = self.wlc.check_aps()
+
+        self.assertEqual(rv[10]['result'], 'mismatch')
+        self.assertEqual(AccessPoint.objects.get(pk=10).config_digest,
+                         ap_config_digest(AccessPoint.objects.get(pk=10)))
+
+    def test_check_aps_query_count(self):
+        dap_fmt = """
+            <DAP apnum="{0}" fingerprint="fp" model="MP_432" name="AP{0}"
+                 serial-id="SN{0}" high-latency-mode="NO">
+                <AP-RADIO-TABLE>
+                    <AP-RADIO slot="1" auto-config="YES" enable="YES"
+                              auto-power-config="YES">
+                        <RADIO-PROFILE-REF name="default"/>
+                    </AP-RADIO>
+                    <AP-RADIO slot="2" auto-config="YES" enable="NO"
+                              auto-power-config="YES">
+                        <RADIO-PROFILE-REF name="default"/>
+                    </AP-RADIO>
+                </AP-RADIO-TABLE>
+            </DAP>"""
+        daps = []
+        for i in range(20):
+            AccessPointFactory(number=100 + i)
+            daps.append(etree.XML(dap_fmt.format(100 + i)))
+        # Only on WLC
+        daps.append(etree.XML(dap_fmt.format(500)))
+        # Only in DB
+        AccessPointFactory(number=600)
+        self.wlc.get_aps = mock.MagicMock(return_value=daps)
+
+        # Query count does not depend on the number of APs
+        with self.assertNumQueries(1):
+            rv = self.wlc.check_aps()
+
+        self.assertEqual(len(rv), 22)
+        self.assertEqual(rv[500]['result'], 'unknown')
+        self.assertEqual(rv[600]['result'], 'missing')
+        self.assertEqual(rv[100]['result'], 'mismatch')
+
+    def test_load_db_aps_shares_profiles(self):
+        profile = RadioProfileFactory(name='shared')
+        for number in (1, 2):
+            AccessPointFactory(number=number, radio_1_profile=profile,
+                               radio_2_profile=profile)
+        AccessPointFactory(number=3, radio_1_profile=profile,
+                           radio_2_profile=None)
+
+        with self.assertNumQueries(1):
+            db_aps = WLC.load_db_aps()
+            self.assertIsNone(db_aps[3].radio_2_profile)
+
+        self.assertEqual(sorted(db_aps), [1, 2, 3])
+        self.assertEqual(db_aps[1].radio_1_profile, profile)
+        self.assertIs(db_aps[1].radio_1_profile, db_aps[1].radio_2_profile)
+        self.assertIs(db_aps[1].radio_1_profile, db_aps[3].radio_1_profile)
+
 
 class AutoAccessPointTest(TestCase):
     def setUp(self):
@@ -320,6 +605,27 @@ class AutoAccessPointTest(TestCase):
         AccessPointFactory(serial_number='0123456789')
         self.assertTrue(self.autoap.is_defined)
 
+    def test_is_defined_annotated(self):
+        AccessPointFactory(serial_number='0123456789')
+        AutoAccessPointFactory(serial_number='1111111111')
+
+        with self.assertNumQueries(1):
+            defined = dict((ap.serial_number, ap.is_defined) for ap in
+                           AutoAccessPoint.objects.with_defined())
+
+        self.assertEqual(defined, {'0123456789': True, '1111111111': False})
+
+    def test_filter_defined(self):
+        AccessPointFactory(serial_number='0123456789')
+        AutoAccessPointFactory(serial_number='1111111111')
+
+        self.assertEqual(
+            [ap.serial_number for ap in
+             AutoAccessPoint.objects.filter_defined(True)], ['0123456789'])
+        self.assertEqual(
+            [ap.serial_number for ap in
+             AutoAccessPoint.objects.filter_defined(False)], ['1111111111'])
+
 
 class AccessPointTest(TestCase):
     def setUp(self):
@@ -371,6 +677,41 @@ class AccessPointTest(TestCase):
             self.assertEqual(xml,
                              '<DAP model="MP_432" name="AP1234"><SOME-TAG/></DAP>')
 
+    def test_build_xml(self):
+        # Templates used by render_xml() are the reference
+        templates_config = [
+            {
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'APP_DIRS': True,
+            },
+        ]
+        variants = [
+            {},
+            dict(radio_1_channel=0, radio_1_power=0, radio_2_channel=44,
+                 radio_2_power=3, radio_2_enable=True, high_latency=False),
+            dict(radio_2_profile=None),
+        ]
+        for model, _ in AccessPoint.MODELS:
+            for variant in variants:
+                attrs = dict(number=1234, name='AP<&>"1234"', model=model,
+                             radio_1_profile=self.ap.radio_1_profile,
+                             radio_2_profile=self.ap.radio_2_profile)
+                attrs.update(variant)
+                ap = AccessPointFactory.build(**attrs)
+                reporter = mock.MagicMock()
+
+                with self.settings(TEMPLATES=templates_config):
+                    golden = etree.XML(ap.render_xml())
+                built = ap.build_xml()
+
+                self.assertTrue(
+                    xml_compare(golden, built, reporter, 'template',
+                                'builder'),
+                    '{} {}: {}'.format(model, variant,
+                                       reporter.call_args_list))
+                self.assertEqual(len(built.findall('.//AP-RADIO')),
+                                 AccessPoint.RADIO_COUNT[model])
+
     def test_clean(self):
         self.ap.clean()
 
@@ -386,6 +727,124 @@ class AccessPointTest(TestCase):
         ap_one_radio = AccessPointFactory(model='WLA321-WW')
         ap_one_radio.clean()
 
+    def test_find_free_numbers(self):
+        # self.ap has number 1234
+        for number in (1, 2, 4, 5, 8):
+            AccessPointFactory(number=number)
+        APNumberReservation.objects.create(number=9, expires=timezone.now())
+
+        self.assertEqual(AccessPoint.find_free_numbers(), [3])
+        self.assertEqual(AccessPoint.find_free_numbers(4), [3, 6, 7, 10])
+        self.assertEqual(AccessPoint.find_free_numbers(2, start=4), [6, 7])
+        self.assertEqual(AccessPoint.find_free_numbers(3, contiguous=True),
+                         [10, 11, 12])
+        self.assertEqual(AccessPoint.find_free_numbers(1, start=1234),
+                         [1235])
+        self.assertEqual(AccessPoint.find_free_numbers(1, start=2000),
+                         [2000])
+
+    def test_find_free_numbers_query_count(self):
+        for number in range(1, 50, 2):
+            AccessPointFactory(number=number)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(AccessPoint.find_free_numbers(5),
+                             [2, 4, 6, 8, 10])
+
+    def test_reserve_numbers(self):
+        AccessPointFactory(number=1)
+
+        self.assertEqual(AccessPoint.reserve_numbers(), [2])
+        # Reserved number is not handed out again
+        self.assertEqual(AccessPoint.reserve_numbers(2), [3, 4])
+
+        # Saving an AP releases its reservation
+        AccessPointFactory(number=3)
+        self.assertFalse(APNumberReservation.objects.filter(
+            number=3).exists())
+
+        # Expired reservations are reused
+        APNumberReservation.objects.filter(number=2).update(
+            expires=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(AccessPoint.reserve_numbers(), [2])
+
+    def test_reserve_numbers_conflict(self):
+        real_find = AccessPoint.find_free_numbers.__func__
+        calls = []
+
+        def find_free_numbers(cls, *args):
+            calls.append(args)
+            if len(calls) == 1:
+                # Another admin reserved this number after we looked
+                return [1]
+            return real_find(cls, *args)
+
+        APNumberReservation.objects.create(
+            number=1, expires=timezone.now() + timedelta(hours=1))
+
+        with mock.patch.object(AccessPoint, 'find_free_numbers',
+                               classmethod(find_free_numbers)):
+            rv = AccessPoint.reserve_numbers()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(rv, [2])
+
+    def test_config_digest(self):
+        self.ap.radio_2_channel = 0
+        self.ap.radio_2_power = 0
+        self.ap.save()
+        stored = AccessPoint.objects.get(pk=self.ap.pk).config_digest
+
+        self.assertEqual(len(stored), 40)
+        dap = self.ap.build_xml()
+        self.assertEqual(AccessPoint.dap_config_digest(dap), stored)
+        # Digest agrees with compare() which finds no difference
+        self.assertTrue(all(r['equal']
+                            for r in self.ap.compare(dap).values()))
+
+        for changes in [dict(name='other'), dict(radio_1_channel=6),
+                        dict(radio_2_power=0), dict(radio_2_enable=False),
+                        dict(high_latency=True)]:
+            ap = AccessPoint.objects.get(pk=self.ap.pk)
+            for k, v in changes.items():
+                setattr(ap, k, v)
+            ap.save(update_fields=list(changes))
+            ap = AccessPoint.objects.get(pk=self.ap.pk)
+            self.assertNotEqual(ap.config_digest, stored, changes)
+            self.assertEqual(ap.config_digest,
+                             AccessPoint.dap_config_digest(ap.build_xml()))
+
+    def test_dap_config_digest_differs(self):
+        dap = self.ap.build_xml()
+        digest = AccessPoint.dap_config_digest(dap)
+
+        dap.find('AP-RADIO-TABLE/AP-RADIO').attrib['channel'] = '1'
+        self.assertNotEqual(AccessPoint.dap_config_digest(dap), digest)
+        dap.find('AP-RADIO-TABLE').remove(dap.find('.//AP-RADIO'))
+        self.assertNotEqual(AccessPoint.dap_config_digest(dap), digest)
+
+    def test_compare_plan(self):
+        plan = compare_plan('WLA321-WW')
+
+        self.assertIs(compare_plan('WLA321-WW'), plan)
+        self.assertEqual(sorted(ComparePlan(1).radio_plans), ['1'])
+        self.assertEqual(plan.radio('1').keys['tx-power'],
+                         'Radio 1: tx-power')
+
+    def test_compare_other_model(self):
+        # Radios of the DAP are compared even if AP model has less
+        dap = self.ap.build_xml()
+        self.ap.model = 'WLA321-WW'
+
+        rv = self.ap.compare(dap)
+
+        self.assertFalse(rv['AP: model']['equal'])
+        self.assertEqual(rv['Radio 2: profile-name'], {
+            'e_val': 'other_profile',
+            'o_val': 'other_profile',
+            'equal': True,
+        })
+
     def test_compare(self):
         dap_xml = """
             <DAP apnum="4422" fingerprint="aa:bb:cc" model="MODEL_1"
@@ -495,3 +954,253 @@ class AccessPointTest(TestCase):
             'equal': False,
         })
         self.assertEqual(len(rv), 18)
+
+
+class CheckRunTest(TestCase):
+    def setUp(self):
+        self.wlc = WLCFactory()
+        self.ap = AccessPointFactory(number=1234)
+
+    def test_enqueue(self):
+        run = CheckRun.enqueue(self.wlc)
+
+        self.assertEqual(run.status, CheckRun.QUEUED)
+        self.assertEqual(CheckRun.enqueue(self.wlc), run)
+
+        run.status = CheckRun.DONE
+        run.save()
+        self.assertNotEqual(CheckRun.enqueue(self.wlc), run)
+
+    def test_claim_next(self):
+        wlc2 = WLCFactory()
+        run1 = CheckRun.enqueue(self.wlc)
+        run2 = CheckRun.enqueue(wlc2)
+
+        self.assertEqual(CheckRun.claim_next([wlc2.pk]), run2)
+        claimed = CheckRun.claim_next()
+        self.assertEqual(claimed, run1)
+        self.assertEqual(claimed.status, CheckRun.RUNNING)
+        self.assertIsNotNone(claimed.started)
+        self.assertIsNone(CheckRun.claim_next())
+
+    def test_execute(self):
+        check_results = {
+            1234: dict(result='mismatch',
+                       result_verbose='AP configuration mismatch',
+                       raw_ap=mock.MagicMock(), db_ap=self.ap,
+                       name='AP1234', serial_number='SN1234', res_ok=False,
+                       cmp_res={'AP: name': dict(equal=False, e_val='X',
+                                                 o_val='AP1234'),
+                                'AP: model': dict(equal=True, e_val='M',
+                                                  o_val='M')}),
+            9999: dict(result='unknown',
+                       result_verbose='AP present on WLC but missing in DB',
+                       raw_ap=mock.MagicMock(), name='AP9999',
+                       serial_number='SN9999'),
+        }
+
+        def check_aps(progress):
+            progress(1, 2)
+            self.assertEqual(CheckRun.objects.get(pk=run.pk).done, 1)
+            return check_results
+
+        run = CheckRun.enqueue(self.wlc)
+        with mock.patch('wlcmanager.models.WLC.check_aps') as check_aps_mock:
+            check_aps_mock.side_effect = check_aps
+            run.execute()
+
+        run = CheckRun.objects.get(pk=run.pk)
+        self.assertEqual(run.status, CheckRun.DONE)
+        self.assertIsNotNone(run.finished)
+        self.assertEqual(list(run.results_dict().items()), [
+            (1234, dict(result='mismatch',
+                        result_verbose='AP configuration mismatch',
+                        name='AP1234', serial_number='SN1234',
+                        cmp_res={'AP: name': dict(equal=False, e_val='X',
+                                                  o_val='AP1234')})),
+            (9999, dict(result='unknown',
+                        result_verbose='AP present on WLC but missing in DB',
+                        name='AP9999', serial_number='SN9999', cmp_res={})),
+        ])
+
+    def test_filter_results(self):
+        run = CheckRun.objects.create(wlc=self.wlc, status=CheckRun.DONE)
+        for number, result, name in ((1, 'ok', 'b'), (2, 'missing', 'a'),
+                                     (3, 'missing', 'c'), (4, 'ok', 'x')):
+            run.results.create(number=number, result=result, name=name,
+                               serial_number='SN{}'.format(number))
+
+        def numbers(*args, **kwargs):
+            return [r.number for r in run.filter_results(*args, **kwargs)]
+
+        self.assertEqual(numbers(), [1, 2, 3, 4])
+        self.assertEqual(numbers(['missing']), [2, 3])
+        self.assertEqual(numbers(search='sn4'), [4])
+        self.assertEqual(numbers(sort='-name'), [4, 3, 1, 2])
+        self.assertEqual(numbers(sort='result'), [2, 3, 1, 4])
+        self.assertEqual(numbers(sort='error'), [1, 2, 3, 4])
+        self.assertEqual(run.result_counts(), {'ok': 2, 'missing': 2})
+
+    def test_execute_failed(self):
+        run = CheckRun.enqueue(self.wlc)
+        with mock.patch('wlcmanager.models.WLC.check_aps') as check_aps_mock:
+            check_aps_mock.side_effect = RuntimeError('some error')
+            run.execute()
+
+        run = CheckRun.objects.get(pk=run.pk)
+        self.assertEqual(run.status, CheckRun.FAILED)
+        self.assertEqual(run.error, 'some error')
+        self.assertEqual(run.results.count(), 0)
+
+    def test_execute_unexpected_error(self):
+        run = CheckRun.enqueue(self.wlc)
+        with mock.patch('wlcmanager.models.WLC.check_aps') as check_aps_mock:
+            check_aps_mock.side_effect = ValueError('bad apnum')
+            run.execute()
+
+        run = CheckRun.objects.get(pk=run.pk)
+        self.assertEqual(run.status, CheckRun.FAILED)
+        self.assertEqual(run.error, 'ValueError: bad apnum')
+        self.assertIsNotNone(run.finished)
+        self.assertFalse(run.is_pending)
+
+    def test_enqueue_stale(self):
+        run = CheckRun.enqueue(self.wlc)
+        CheckRun.claim_next()
+        self.assertEqual(CheckRun.enqueue(self.wlc), run)
+
+        CheckRun.objects.filter(pk=run.pk).update(
+            started=timezone.now() - timedelta(seconds=3601))
+        new_run = CheckRun.enqueue(self.wlc)
+
+        self.assertNotEqual(new_run, run)
+        run = CheckRun.objects.get(pk=run.pk)
+        self.assertEqual(run.status, CheckRun.FAILED)
+        self.assertEqual(run.error, 'Not finished within 3600 seconds')
+
+
+class WLCInventoryTest(TestCase):
+    def setUp(self):
+        self.wlc = WLCFactory()
+        self.aps = [AccessPointFactory(number=n) for n in (1, 2, 3)]
+
+    def records(self, *aps):
+        return [DapRecord.from_element(ap.build_xml()) for ap in aps]
+
+    def test_store(self):
+        ap1, ap2, ap3 = self.aps
+        rv = self.wlc.store_inventory(self.records(ap1, ap2, ap3))
+
+        self.assertEqual(rv, dict(created=3, updated=0, deleted=0,
+                                  unchanged=0))
+        inventory = self.wlc.inventory
+        self.assertEqual(inventory.dap_count, 3)
+        self.assertIsNotNone(inventory.synced)
+
+        records = self.records(ap1, ap2)
+        records[1].name = 'renamed'
+        with self.assertNumQueries(7):
+            # Lookup and hashes, delete AP 3 and old AP 2, insert AP 2,
+            # inventory
+            rv = self.wlc.store_inventory(records)
+
+        self.assertEqual(rv, dict(created=0, updated=1, deleted=1,
+                                  unchanged=1))
+        self.assertEqual(sorted(inventory.daps.values_list('number', 'name')),
+                         [(1, ap1.name), (2, 'renamed')])
+
+        records = self.records(ap1, ap2, ap3)
+        for record in records:
+            record.name += '-new'
+        # Any number of changed DAPs is written in the same queries
+        with self.assertNumQueries(7):
+            rv = self.wlc.store_inventory(records)
+
+        self.assertEqual(rv, dict(created=1, updated=2, deleted=0,
+                                  unchanged=0))
+        self.assertEqual(inventory.daps.filter(
+            name__endswith='-new').count(), 3)
+
+    def test_check_aps_inventory_stale_digest(self):
+        ap1 = self.aps[0]
+        self.wlc.store_inventory(self.records(ap1))
+        AccessPoint.objects.filter(pk=ap1.pk).update(name='renamed')
+
+        rv = self.wlc.check_aps(inventory=True)
+
+        self.assertEqual(rv[1]['result'], 'mismatch')
+        self.assertEqual(rv[1]['raw_ap'].name, ap1.name)
+
+    def test_check_aps_inventory(self):
+        ap1, ap2, ap3 = self.aps
+        records = self.records(ap1, ap2)
+        records[1].name = 'renamed'
+        records.append(DapRecord.from_element(
+            AccessPointFactory.build(number=9).build_xml()))
+        self.wlc.store_inventory(records)
+        self.wlc.make_connection = mock.MagicMock()
+
+        with mock.patch.object(AccessPoint, 'compare',
+                               autospec=True) as compare_patch:
+            compare_patch.return_value = {'attr': {'equal': False}}
+            rv = self.wlc.check_aps(inventory=True)
+
+        self.assertFalse(self.wlc.make_connection.called)
+        self.assertEqual({n: r['result'] for n, r in rv.items()}, {
+            1: 'ok', 2: 'mismatch', 3: 'missing', 9: 'unknown'})
+        # Matching DAP is found by the DB, its data is not loaded
+        self.assertEqual(rv[1]['raw_ap'].radios, ())
+        self.assertEqual(rv[1]['name'], ap1.name)
+        records[1].config_digest = AccessPoint.dap_config_digest(records[1])
+        compare_patch.assert_called_once_with(ap2, records[1])
+
+    def test_check_aps_not_synced(self):
+        self.assertRaises(WLCInventory.DoesNotExist, self.wlc.check_aps,
+                          inventory=True)
+
+
+class FleetCheckTest(TestCase):
+    def setUp(self):
+        self.wlc1 = WLCFactory(name='WLC1')
+        self.wlc2 = WLCFactory(name='WLC2')
+        WLCFactory(name='DISABLED', enabled=False)
+        self.ap = AccessPointFactory(number=1)
+        self.records = {'WLC1': [DapRecord.from_element(
+                            self.ap.build_xml())],
+                        'WLC2': RuntimeError('boom')}
+
+    def check(self, **kwargs):
+        def get_aps(wlc, records=False):
+            res = self.records[wlc.name]
+            if isinstance(res, Exception):
+                raise res
+            return res
+
+        with mock.patch.object(WLC, 'get_aps', autospec=True,
+                               side_effect=get_aps), \
+                mock.patch.object(WLC, 'load_db_aps',
+                                  wraps=WLC.load_db_aps) as load_mock:
+            rv = {wlc.name: (dict(results) if results is not None
+                             else None, error)
+                  for wlc, results, error in WLC.iter_check_fleet(**kwargs)}
+        self.assertEqual(load_mock.call_count, 1)
+        return rv
+
+    def test_check_fleet(self):
+        rv = self.check()
+
+        self.assertEqual(sorted(rv), ['WLC1', 'WLC2'])
+        results, error = rv['WLC1']
+        self.assertIsNone(error)
+        self.assertEqual(results[1]['result'], 'ok')
+        results, error = rv['WLC2']
+        self.assertIsNone(results)
+        self.assertEqual(str(error), 'boom')
+
+    def test_check_fleet_inventory(self):
+        self.wlc1.store_inventory(self.records['WLC1'])
+
+        rv = self.check(inventory=True, results=['missing'])
+
+        self.assertEqual(rv['WLC1'], ({}, None))
+        self.assertIsInstance(rv['WLC2'][1], WLCInventory.DoesNotExist)
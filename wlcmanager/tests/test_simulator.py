@@ -0,0 +1,131 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import mock
+import socket
+
+from django.test import TestCase
+from jnpr import wlc as jnpr_wlc
+
+from .. import simulator
+from ..models import AccessPoint, AutoAccessPoint, RadioProfile
+from ..utils import compare_config
+
+from .factories import WLCFactory
+
+
+@mock.patch('wlcmanager.models.CONNECTION_FACTORY',
+            'wlcmanager.simulator.connect')
+class SimulatorTest(TestCase):
+    def setUp(self):
+        self.wlc = WLCFactory(ip_address='10.0.0.1')
+        self.sleep = mock.MagicMock()
+
+    def tearDown(self):
+        simulator.unregister_all()
+
+    def fake(self, **options):
+        options.setdefault('sleep', self.sleep)
+        return simulator.register(self.wlc.ip_address,
+                                  simulator.FakeWLC(**options))
+
+    def test_connect(self):
+        fake = self.fake()
+
+        with self.wlc.connection.checkout() as connection:
+            self.assertIs(connection.wrapped, fake)
+        self.assertTrue(fake.connected)
+
+    def test_connect_default(self):
+        with mock.patch('wlcmanager.simulator.SIMULATOR_OPTIONS',
+                        {'daps': 3}):
+            daps = self.wlc.get_aps()
+
+        self.assertEqual([d.attrib['apnum'] for d in daps], ['1', '2', '3'])
+
+    def test_check_aps_generated(self):
+        self.fake(daps=300)
+        RadioProfile.objects.create(name='default')
+        AccessPoint.objects.bulk_create(
+            simulator.generate_access_points(300))
+
+        rv = self.wlc.check_aps()
+
+        self.assertEqual(len(rv), 300)
+        self.assertEqual(set(r['result'] for r in rv.values()), {'ok'})
+
+    def test_refresh_autoaps(self):
+        self.fake(daps=2, auto_aps=3)
+
+        self.wlc.refresh_autoaps()
+
+        self.assertEqual(sorted(AutoAccessPoint.objects.values_list(
+            'number', flat=True)), [3, 4, 5])
+
+    def test_radio_profiles(self):
+        self.fake(radio_profiles=['default', 'office'])
+
+        self.wlc.refresh_radio_profiles()
+
+        self.assertEqual(sorted(RadioProfile.objects.values_list(
+            'name', flat=True)), ['default', 'office'])
+
+    def test_save_and_delete(self):
+        fake = self.fake(reject=[3])
+        RadioProfile.objects.create(name='default')
+        aps = list(simulator.generate_access_points(4))
+
+        rv = self.wlc.save_aps(aps, chunk_size=4)
+
+        self.assertEqual(sorted(k for k, v in rv.items() if v is None),
+                         [1, 2, 4])
+        self.assertIsInstance(rv[3], jnpr_wlc.RpcError)
+        self.assertEqual(sorted(fake.daps), [1, 2, 4])
+
+        self.assertIsNone(self.wlc.delete_ap(2))
+        self.assertEqual(self.wlc.delete_ap(2), {'404': 'DAP 2 does not '
+                                                        'exist'})
+        self.assertEqual(sorted(d.attrib['apnum']
+                                for d in self.wlc.get_aps()), ['1', '4'])
+
+    def test_unsupported_transaction(self):
+        fake = self.fake()
+
+        rpc = self.wlc.connection.RpcMaker('get')
+        with self.assertRaises(ValueError) as cm:
+            rpc()
+        self.assertIn("handles only 'set'", '{}'.format(cm.exception))
+        self.assertEqual(fake.calls, {})
+
+    def test_compare_config(self):
+        self.fake(daps=20)
+        master = WLCFactory(ip_address='10.0.0.2', master=True)
+        simulator.register(master.ip_address,
+                           simulator.FakeWLC(daps=20, sleep=self.sleep))
+
+        res = compare_config(self.wlc, master)
+
+        self.assertEqual([c['is_equal'] for c in res], [True] * 3)
+
+    def test_latency(self):
+        fake = self.fake(latency=0.5, jitter=0.1, seed=1)
+
+        self.wlc.get_radio_profiles()
+
+        delay = self.sleep.call_args[0][0]
+        self.assertTrue(0.5 <= delay <= 0.6)
+        self.assertEqual(fake.calls, {'get_radio_profile': 1})
+
+    def test_errors(self):
+        self.fake(error_rate=1)
+
+        self.assertRaises(jnpr_wlc.RpcError, self.wlc.get_aps)
+        self.assertEqual(self.wlc.delete_ap(1), {'500': 'simulated error'})
+
+    def test_timeout(self):
+        self.fake(timeout_rate=1, hang=10)
+
+        self.assertRaises(socket.timeout, self.wlc.get_aps)
+        self.sleep.assert_called_once_with(10)
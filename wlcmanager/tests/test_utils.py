@@ -3,12 +3,19 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+import threading
+
 from lxml import etree
 from mock import MagicMock, call
 import unittest
 
-from ..utils import (get_free_from_sequence, ppxml, xml_compare, text_compare,
-                     Reporter)
+from django.core.cache import cache
+
+from ..utils import (get_free_from_sequence, ppxml, iter_ppxml, write_ppxml,
+                     xml_compare, text_compare,
+                     Reporter, fan_out, iter_fan_out, FanOutTimeout,
+                     compare_config, keyed_diff, DEFAULT_MATCH_KEYS,
+                     RpcProxy, RpcMakerProxy)
 
 
 class SeqTest(unittest.TestCase):
@@ -69,6 +76,37 @@ class PpxmlTest(unittest.TestCase):
    <child2 attr="val"/>
  </root>\n""")
 
+    def test_deep(self):
+        e = etree.Element("root")
+        parent = e
+        for i in range(2000):
+            parent = etree.SubElement(parent, "child")
+        rv = ppxml(e)
+        self.assertEqual(len(rv.splitlines()), 2 * 2000 + 1)
+        self.assertTrue(rv.endswith("</root>\n"))
+
+    def test_streaming(self):
+        e = etree.Element("root", aname1="avalue1")
+        child = etree.SubElement(e, "child1", a="1", b="2")
+        etree.SubElement(child, "grandchild")
+        etree.SubElement(e, "child2")
+        expected = """<root aname1="avalue1">
+  <child1
+      a="1"
+      b="2">
+    <grandchild/>
+  </child1>
+  <child2/>
+</root>\n"""
+        out = MagicMock()
+
+        write_ppxml(e, out)
+
+        self.assertEqual(''.join(c[0][0] for c in out.write.call_args_list),
+                         expected)
+        self.assertEqual(ppxml(e), expected)
+        self.assertEqual(len(list(iter_ppxml(e))), 6)
+
 
 class XMLCmpTest(unittest.TestCase):
     def test_tag(self):
@@ -194,6 +232,92 @@ class XMLCmpTest(unittest.TestCase):
         reporter.assert_called_once_with(e5_msg)
 
 
+class XMLCmpKeyedTest(unittest.TestCase):
+    def make_table(self, *daps):
+        table = etree.Element("DAP-TABLE")
+        for apnum, name in daps:
+            dap = etree.SubElement(table, "DAP", apnum=apnum, name=name)
+            radios = etree.SubElement(dap, "AP-RADIO-TABLE")
+            etree.SubElement(radios, "AP-RADIO", slot="2", enable="NO")
+            etree.SubElement(radios, "AP-RADIO", slot="1", enable="YES")
+        return table
+
+    def test_order_insensitive(self):
+        e1 = self.make_table(('1', 'a'), ('2', 'b'), ('3', 'c'))
+        e2 = self.make_table(('3', 'c'), ('1', 'a'), ('2', 'b'))
+        reporter = MagicMock()
+
+        self.assertFalse(xml_compare(e1, e2))
+        self.assertTrue(xml_compare(e1, e2, reporter, keys=DEFAULT_MATCH_KEYS))
+        self.assertFalse(reporter.called)
+
+    def test_added_removed_changed(self):
+        e1 = self.make_table(('1', 'a'), ('2', 'b'), ('3', 'c'))
+        e2 = self.make_table(('1', 'a'), ('4', 'd'), ('2', 'x'))
+        e2[0][0][1].attrib['enable'] = 'NO'
+        reporter = MagicMock()
+
+        self.assertFalse(xml_compare(e1, e2, reporter, 'name1', 'name2',
+                                     keys=DEFAULT_MATCH_KEYS))
+        self.assertEqual(reporter.call_args_list, [
+            call('children missing in name2: DAP apnum=3'),
+            call('children missing in name1: DAP apnum=4'),
+            call('Attributes do not match: enable="YES" (name1), '
+                 'enable="NO" (name2)'),
+            call('children do not match: AP-RADIO slot=1'),
+            call('children 1 do not match: AP-RADIO-TABLE'),
+            call('children do not match: DAP apnum=1'),
+            call('Attributes do not match: name="b" (name1), '
+                 'name="x" (name2)'),
+            call('children do not match: DAP apnum=2'),
+        ])
+        self.assertEqual(keyed_diff(e1, e2), dict(
+            added=['DAP apnum=4'],
+            removed=['DAP apnum=3'],
+            changed=['DAP apnum=1', 'DAP apnum=2']))
+
+    def test_custom_keys(self):
+        e1 = etree.Element("root")
+        etree.SubElement(e1, "item", id="1", name="x")
+        etree.SubElement(e1, "item", id="2", name="x")
+        e2 = etree.Element("root")
+        etree.SubElement(e2, "item", id="2", name="x")
+        etree.SubElement(e2, "item", id="1", name="x")
+
+        self.assertTrue(xml_compare(e1, e2, keys={'item': 'id'}))
+        # Duplicated names are paired by occurrence
+        self.assertFalse(xml_compare(e1, e2, keys={'item': 'name'}))
+        self.assertEqual(keyed_diff(e1, e2, keys={'item': 'name'}), dict(
+            added=[], removed=[],
+            changed=['item name=x', 'item name=x (#2)']))
+
+    def test_unkeyed_count(self):
+        e1 = etree.Element("root")
+        etree.SubElement(e1, "child")
+        e2 = etree.Element("root")
+        reporter = MagicMock()
+
+        self.assertFalse(xml_compare(e1, e2, reporter, 'name1', 'name2',
+                                     keys={}))
+        reporter.assert_called_once_with(
+            'child children count differs, 1 (name1) != 0 (name2)')
+
+    def test_diff_unkeyed_and_numeric_order(self):
+        e1 = self.make_table(('9', 'a'), ('10', 'b'), ('11', 'c'))
+        e2 = self.make_table(('9', 'x'), ('10', 'y'))
+        for element, values in ((e1, ('1', '2', '3')), (e2, ('1', '5'))):
+            for value in values:
+                etree.SubElement(element, 'NOTE', text=value)
+        diff = dict(added=[], removed=[], changed=[])
+
+        self.assertFalse(xml_compare(e1, e2, keys=DEFAULT_MATCH_KEYS,
+                                     diff=diff))
+        self.assertEqual(diff, dict(
+            added=[], removed=['DAP apnum=11', 'NOTE (#3)'],
+            changed=['DAP apnum=9', 'DAP apnum=10', 'NOTE (#2)']))
+        self.assertEqual(keyed_diff(e1, e2), diff)
+
+
 class TextCmpTest(unittest.TestCase):
     def test_empty(self):
         self.assertTrue(text_compare('', ''))
@@ -222,3 +346,144 @@ class TextReporterTest(unittest.TestCase):
         r.report('msg1')
         r.report('msg2')
         self.assertEqual(r.msg, ['msg1', 'msg2'])
+
+
+class FanOutTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(fan_out(lambda x: x, []), [])
+
+    def test_results_in_order(self):
+        def func(x):
+            if x == 3:
+                raise ValueError('three')
+            return x * 2
+
+        rv = fan_out(func, range(5), workers=2)
+
+        self.assertEqual([(i, r) for i, r, e in rv],
+                         [(0, 0), (1, 2), (2, 4), (3, None), (4, 8)])
+        self.assertIsInstance(rv[3][2], ValueError)
+        self.assertEqual([e for i, r, e in rv if i != 3], [None] * 4)
+
+    def test_concurrent(self):
+        barrier = threading.Event()
+        started = []
+
+        def func(x):
+            started.append(x)
+            if len(started) == 3:
+                barrier.set()
+            # Would time out if calls were serialized
+            return barrier.wait(2)
+
+        rv = fan_out(func, range(3), workers=3)
+
+        self.assertEqual([r for i, r, e in rv], [True] * 3)
+
+    def test_timeout(self):
+        release = threading.Event()
+
+        def func(x):
+            if x == 0:
+                release.wait(5)
+            return x
+
+        rv = fan_out(func, range(3), workers=2, timeout=0.2)
+        release.set()
+
+        self.assertIsInstance(rv[0][2], FanOutTimeout)
+        self.assertEqual([r for i, r, e in rv[1:]], [1, 2])
+
+    def test_iter_completion_order(self):
+        release = threading.Event()
+
+        def func(x):
+            if x == 0:
+                release.wait(2)
+            return x
+
+        done = []
+        for i, r, e in iter_fan_out(func, range(3), workers=3):
+            done.append(i)
+            if len(done) == 2:
+                release.set()
+
+        self.assertEqual(sorted(done[:2]), [1, 2])
+        self.assertEqual(done[2], 0)
+
+
+class RpcProxyTest(unittest.TestCase):
+    def test_rpc(self):
+        call_rpc = MagicMock()
+
+        rv = RpcProxy(call_rpc).get_dap(1, apnum=2)
+
+        call_rpc.assert_called_once_with('get_dap', (1,), {'apnum': 2})
+        self.assertIs(rv, call_rpc.return_value)
+
+    def test_rpc_maker(self):
+        call_maker = MagicMock(
+            side_effect=lambda proxy, args, kwargs:
+            proxy.make(connection)(*args, **kwargs))
+        connection = MagicMock()
+        proxy = RpcMakerProxy(call_maker, 'set', target='x')
+        proxy.data = etree.Element('DAP-TABLE')
+
+        self.assertEqual(proxy.data.tag, 'DAP-TABLE')
+        self.assertRaises(AttributeError, getattr, proxy, 'missing')
+        self.assertFalse(connection.RpcMaker.called)
+        rv = proxy(1)
+
+        connection.RpcMaker.assert_called_once_with('set', target='x')
+        maker = connection.RpcMaker.return_value
+        self.assertIs(maker.data, proxy.data)
+        maker.assert_called_once_with(1)
+        self.assertIs(rv, maker.return_value)
+
+
+class CompareConfigTest(unittest.TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_wlc(self, name, dap_name):
+        wlc = MagicMock()
+        wlc.__str__.return_value = name
+        wlc.pk = name
+        rpc = wlc.connection.rpc
+        rpc.get_radio_profile.return_value = etree.Element('RADIO-PROFILES')
+        rpc.get_service_profile.return_value = etree.Element('SERVICE')
+        rpc.get_dap.return_value = etree.Element('DAP', name=dap_name)
+        return wlc
+
+    def test_compare(self):
+        wlc1 = self.make_wlc('wlc1', 'ap1')
+        wlc2 = self.make_wlc('wlc2', 'ap2')
+
+        rv = compare_config(wlc1, wlc2, workers=3)
+
+        self.assertEqual([c['is_equal'] for c in rv], [True, True, False])
+        self.assertEqual(rv[2]['errors'], [
+            'Attributes do not match: name="ap1" (wlc1), name="ap2" (wlc2)'])
+        self.assertEqual(rv[2]['element1_raw'], '<DAP name="ap1"/>\n')
+        self.assertEqual(rv[2]['element2_raw'], '<DAP name="ap2"/>\n')
+        for conf in rv:
+            self.assertGreaterEqual(conf['element1_time'], 0)
+            self.assertGreaterEqual(conf['element2_time'], 0)
+            self.assertEqual(conf['element1_age'], 0)
+        wlc2.connection.rpc.get_dap.assert_called_once_with(
+            wlc2.connection.rpc)
+
+        # Second compare is served from cache
+        rv = compare_config(wlc1, wlc2, workers=3)
+
+        self.assertEqual([c['is_equal'] for c in rv], [True, True, False])
+        wlc2.connection.rpc.get_dap.assert_called_once_with(
+            wlc2.connection.rpc)
+
+    def test_fetch_error(self):
+        wlc1 = self.make_wlc('wlc1', 'ap1')
+        wlc2 = self.make_wlc('wlc2', 'ap2')
+        wlc2.connection.rpc.get_service_profile.side_effect = \
+            RuntimeError('some error')
+
+        self.assertRaises(RuntimeError, compare_config, wlc1, wlc2)
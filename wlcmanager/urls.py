@@ -0,0 +1,12 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+from django.conf.urls import url
+
+from . import views
+
+urlpatterns = [
+    url(r'^metrics$', views.prometheus_metrics, name='wlcmanager-metrics'),
+]
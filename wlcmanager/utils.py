@@ -1,5 +1,16 @@
 # coding: utf-8
 
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from .cache import cached_call
+
+
+class FanOutTimeout(RuntimeError):
+    pass
+
 
 def get_free_from_sequence(seq, start_value=1):
     """Get next missing value form sequence starting with start_value"""
@@ -13,29 +24,75 @@ def get_free_from_sequence(seq, start_value=1):
     return i
 
 
+def chunks(seq, size):
+    """Split seq into lists of at most size elements"""
+    seq = list(seq)
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+
+def iter_ppxml(element, indent_level=0, attr_num_limit=1):
+    """Pretty print element yielding output piece by piece.
+
+    Uses an explicit stack instead of recursion, so arbitrarily large and
+    deep trees are printed in linear time and can be streamed.
+    """
+    stack = [(element, indent_level, False)]
+    while stack:
+        element, indent_level, closing = stack.pop()
+        indent = " " * indent_level
+        if closing:
+            yield "{}</{}>\n".format(indent, element.tag)
+            continue
+
+        parts = ["{}<{}".format(indent, element.tag)]
+        attr_list = sorted(element.attrib)
+        attr_prefix = ' '
+        if len(attr_list) > attr_num_limit:
+            attr_prefix = '\n{}    '.format(indent)
+        for k in attr_list:
+            parts.append('{}{}="{}"'.format(attr_prefix, k, element.attrib[k]))
+
+        if len(element) > 0:
+            parts.append('>\n')
+            stack.append((element, indent_level, True))
+            stack.extend((child, indent_level + 2, False)
+                         for child in reversed(element))
+        else:
+            parts.append('/>\n')
+        yield ''.join(parts)
+
+
+def write_ppxml(element, out, indent_level=0, attr_num_limit=1):
+    """Pretty print element into file-like object out"""
+    for chunk in iter_ppxml(element, indent_level=indent_level,
+                            attr_num_limit=attr_num_limit):
+        out.write(chunk)
+
+
 def ppxml(element, indent_level=0, attr_num_limit=1):
-    indent = " " * indent_level
-    res = "{}<{}".format(indent, element.tag)
-    attr_list = sorted(element.attrib)
-    attr_prefix = ' '
-    if len(attr_list) > attr_num_limit:
-        attr_prefix = '\n{}    '.format(indent)
-    for k in attr_list:
-        res += '{}{}="{}"'.format(attr_prefix, k, element.attrib[k])
-
-    if len(element) > 0:
-        res += '>\n'
-        for child in element:
-            res += ppxml(child, indent_level=indent_level + 2,
-                         attr_num_limit=attr_num_limit)
-        res += "{}</{}>\n".format(indent, element.tag)
-    else:
-        res += '/>\n'
+    return ''.join(iter_ppxml(element, indent_level=indent_level,
+                              attr_num_limit=attr_num_limit))
 
-    return res
 
+# Attribute identifying a child element, '*' applies to all other tags
+DEFAULT_MATCH_KEYS = {
+    'DAP': 'apnum',
+    'AP-RADIO': 'slot',
+    '*': 'name',
+}
 
-def xml_compare(e1, e2, reporter=None, e1_name='e1', e2_name='e2'):
+
+def xml_compare(e1, e2, reporter=None, e1_name='e1', e2_name='e2',
+                keys=None, diff=None):
+    """Compare two elements recursively.
+
+    By default children are paired by position. If keys (tag to
+    attribute name mapping, see DEFAULT_MATCH_KEYS) is given, children
+    are paired by their identity attribute instead so order does not
+    matter, and all added, removed and changed children are reported.
+    Labels of those children of e1 and e2 are then appended to lists of
+    diff (see keyed_diff) if it is given.
+    """
     if e1.tag != e2.tag:
         if reporter:
             reporter('Tags do not match: {} ({}) and {} ({})'.format(
@@ -67,6 +124,10 @@ def xml_compare(e1, e2, reporter=None, e1_name='e1', e2_name='e2'):
     cl1 = e1.getchildren()
     cl2 = e2.getchildren()
 
+    if keys is not None:
+        return _xml_compare_children_keyed(cl1, cl2, reporter, e1_name,
+                                           e2_name, keys, diff)
+
     cl1_names = set([c.tag for c in cl1])
     cl2_names = set([c.tag for c in cl2])
     cl1_diff = cl2_names.difference(cl1_names)
@@ -102,6 +163,129 @@ def xml_compare(e1, e2, reporter=None, e1_name='e1', e2_name='e2'):
     return True
 
 
+def _child_key(child, keys):
+    attr = keys.get(child.tag, keys.get('*'))
+    if attr is None or attr not in child.attrib:
+        return None
+    return (child.tag, attr, child.attrib[attr])
+
+
+def _format_key(key):
+    tag, attr, value = key[:3]
+    if len(key) > 3:
+        return '{} {}={} (#{})'.format(tag, attr, value, key[3] + 1)
+    return '{} {}={}'.format(tag, attr, value)
+
+
+def index_children(children, keys):
+    """Split children into a key -> child map and a list of unkeyed ones"""
+    keyed = {}
+    unkeyed = []
+    for child in children:
+        key = _child_key(child, keys)
+        if key is None:
+            unkeyed.append(child)
+            continue
+        if key in keyed:
+            # Duplicated identity, tell the copies apart by occurrence
+            n = 1
+            while key + (n,) in keyed:
+                n += 1
+            key = key + (n,)
+        keyed[key] = child
+    return keyed, unkeyed
+
+
+def _key_order(key):
+    """Sort key of child identities, numeric values in numeric order"""
+    value = key[2]
+    if value.isdigit():
+        value = (0, int(value), '')
+    else:
+        value = (1, 0, value)
+    return key[:2] + (value,) + key[3:]
+
+
+def keyed_diff(e1, e2, keys=DEFAULT_MATCH_KEYS):
+    """Compare children of e1 and e2 paired by identity attributes.
+
+    Returns:
+        Dictionary with lists of labels of children present only in e2
+        (added), only in e1 (removed) and in both but different
+        (changed). Children without identity are labeled by position.
+    """
+    diff = dict(added=[], removed=[], changed=[])
+    _xml_compare_children_keyed(e1.getchildren(), e2.getchildren(), None,
+                                'e1', 'e2', keys, diff)
+    return diff
+
+
+def _xml_compare_children_keyed(cl1, cl2, reporter, e1_name, e2_name, keys,
+                                diff=None):
+    keyed1, unkeyed1 = index_children(cl1, keys)
+    keyed2, unkeyed2 = index_children(cl2, keys)
+    equal = True
+
+    only1 = sorted(set(keyed1) - set(keyed2), key=_key_order)
+    only2 = sorted(set(keyed2) - set(keyed1), key=_key_order)
+    if only1:
+        equal = False
+        if reporter:
+            reporter('children missing in {}: {}'.format(
+                e2_name, ', '.join(_format_key(k) for k in only1)))
+    if only2:
+        equal = False
+        if reporter:
+            reporter('children missing in {}: {}'.format(
+                e1_name, ', '.join(_format_key(k) for k in only2)))
+    if diff is not None:
+        diff['removed'].extend(_format_key(k) for k in only1)
+        diff['added'].extend(_format_key(k) for k in only2)
+
+    for key in sorted(set(keyed1) & set(keyed2), key=_key_order):
+        if not xml_compare(keyed1[key], keyed2[key], reporter=reporter,
+                           e1_name=e1_name, e2_name=e2_name, keys=keys):
+            equal = False
+            if reporter:
+                reporter('children do not match: {}'.format(
+                    _format_key(key)))
+            if diff is not None:
+                diff['changed'].append(_format_key(key))
+
+    # Children without identity are still paired by position within tag
+    by_tag1 = {}
+    by_tag2 = {}
+    for c in unkeyed1:
+        by_tag1.setdefault(c.tag, []).append(c)
+    for c in unkeyed2:
+        by_tag2.setdefault(c.tag, []).append(c)
+    for tag in sorted(set(by_tag1) | set(by_tag2)):
+        l1 = by_tag1.get(tag, [])
+        l2 = by_tag2.get(tag, [])
+        if len(l1) != len(l2):
+            equal = False
+            if reporter:
+                reporter('{} children count differs, {} ({}) != '
+                         '{} ({})'.format(tag, len(l1), e1_name,
+                                          len(l2), e2_name))
+            if diff is not None:
+                common = min(len(l1), len(l2))
+                diff['removed'].extend('{} (#{})'.format(tag, i + 1)
+                                       for i in range(common, len(l1)))
+                diff['added'].extend('{} (#{})'.format(tag, i + 1)
+                                     for i in range(common, len(l2)))
+        for i, (c1, c2) in enumerate(zip(l1, l2)):
+            if not xml_compare(c1, c2, reporter=reporter, e1_name=e1_name,
+                               e2_name=e2_name, keys=keys):
+                equal = False
+                if reporter:
+                    reporter('children {} do not match: {}'.format(i + 1,
+                                                                   tag))
+                if diff is not None:
+                    diff['changed'].append('{} (#{})'.format(tag, i + 1))
+    return equal
+
+
 def text_compare(t1, t2):
     if not t1 and not t2:
         return True
@@ -118,7 +302,16 @@ class Reporter(object):
         self.msg.append(msg)
 
 
-def compare_config(wlc1, wlc2):
+def compare_config(wlc1, wlc2, workers=6, timeout=None,
+                   keys=DEFAULT_MATCH_KEYS):
+    """Compare configuration of two WLCs.
+
+    All configuration parts are fetched from both WLCs concurrently,
+    time spent on every fetch is stored in element1_time and
+    element2_time, age of cached responses in element1_age and
+    element2_age (seconds). Entries are matched by keys (see
+    xml_compare), pass None to compare them by position.
+    """
     configuration_parts = [{
         'name': 'Radio Profiles',
         'fn': 'radio_profile',
@@ -129,19 +322,41 @@ def compare_config(wlc1, wlc2):
         'name': 'Access Points',
         'fn': 'dap',
     }]
-    for conf in configuration_parts:
-        f = getattr(wlc1.connection.rpc, 'get_{}'.format(conf['fn']))
-        conf['element1'] = f(wlc1.connection.rpc)
-        f = getattr(wlc2.connection.rpc, 'get_{}'.format(conf['fn']))
-        conf['element2'] = f(wlc2.connection.rpc)
 
+    def fetch(job):
+        conf, wlc = job
+        name = 'get_{}'.format(conf['fn'])
+
+        def rpc_fetch():
+            f = getattr(wlc.connection.rpc, name)
+            return f(wlc.connection.rpc)
+
+        start = time.time()
+        element, age = cached_call(wlc.pk, name, rpc_fetch)
+        return element, time.time() - start, age
+
+    jobs = [(conf, wlc) for conf in configuration_parts
+            for wlc in (wlc1, wlc2)]
+    fetched = fan_out(fetch, jobs, workers=workers, timeout=timeout)
+    for (conf, wlc), res, error in fetched:
+        if error is not None:
+            raise error
+        suffix = '1' if wlc is wlc1 else '2'
+        (conf['element' + suffix], conf['element{}_time'.format(suffix)],
+         conf['element{}_age'.format(suffix)]) = res
+
+    for conf in configuration_parts:
         conf['element1_raw'] = ppxml(conf['element1'])
         conf['element2_raw'] = ppxml(conf['element2'])
 
         r = Reporter()
+        diff = dict(added=[], removed=[], changed=[])
         conf['is_equal'] = xml_compare(conf['element1'], conf['element2'],
-                                       r.report, str(wlc1), str(wlc2))
+                                       r.report, str(wlc1), str(wlc2),
+                                       keys=keys, diff=diff)
         conf['errors'] = r.msg
+        if keys is not None and not conf['is_equal']:
+            conf['diff'] = diff
 
     return configuration_parts
 
@@ -150,3 +365,129 @@ def run_each_context(admin_site, request):
         return admin_site.each_context(request)
     except TypeError as e: # Django 1.7
         return admin_site.each_context()
+
+
+def _fan_out(func, items, workers, timeout, poll_interval):
+    """Call func for every item on a bounded thread pool.
+
+    Every call gets its own deadline counted from the moment a worker
+    picks it up, so items waiting in the queue are not penalized.
+
+    Yields:
+        (index, item, result, exception) tuples as soon as calls finish.
+        A call which exceeded its deadline gets FanOutTimeout exception.
+    """
+    if not items:
+        return
+
+    started = {}
+    lock = threading.Lock()
+
+    def call(idx):
+        with lock:
+            started[idx] = time.time()
+        try:
+            return func(items[idx]), None
+        except Exception:
+            return None, sys.exc_info()[1]
+
+    workers = min(workers, len(items))
+    pool = ThreadPool(workers)
+    if timeout is not None:
+        # Bound for calls which never got a worker because all of them
+        # are stuck on calls that already timed out.
+        rounds = (len(items) + workers - 1) // workers
+        overall_deadline = time.time() + timeout * (rounds + 1)
+    pending = dict((idx, pool.apply_async(call, (idx,)))
+                   for idx in range(len(items)))
+    try:
+        while pending:
+            for idx, async_res in sorted(pending.items()):
+                if async_res.ready():
+                    del pending[idx]
+                    yield (idx, items[idx]) + async_res.get()
+                    continue
+                with lock:
+                    start = started.get(idx)
+                if timeout is None:
+                    continue
+                now = time.time()
+                if (start is not None and now - start > timeout) or \
+                        now > overall_deadline:
+                    del pending[idx]
+                    yield idx, items[idx], None, FanOutTimeout(
+                        'no response within {} s'.format(timeout))
+            if pending:
+                next(iter(pending.values())).wait(poll_interval)
+    finally:
+        # Do not join, threads stuck on a dead controller would block us.
+        pool.close()
+
+
+def iter_fan_out(func, items, workers=8, timeout=None, poll_interval=0.05):
+    """Call func for every item concurrently, see _fan_out().
+
+    Yields:
+        (item, result, exception) tuples in the order calls finish.
+    """
+    for idx, item, result, error in _fan_out(func, list(items), workers,
+                                             timeout, poll_interval):
+        yield item, result, error
+
+
+def fan_out(func, items, workers=8, timeout=None, poll_interval=0.05):
+    """Call func for every item concurrently, see _fan_out().
+
+    Returns:
+        List of (item, result, exception) tuples in the order of items.
+    """
+    results = sorted(_fan_out(func, list(items), workers, timeout,
+                              poll_interval))
+    return [r[1:] for r in results]
+
+
+class RpcProxy(object):
+    """Stand-in for the rpc attribute of a WLC connection.
+
+    Connection wrappers (pooling, metrics) run their code around RPCs,
+    every RPC is passed to call(name, args, kwargs).
+    """
+
+    def __init__(self, call):
+        self._call = call
+
+    def __getattr__(self, name):
+        def rpc(*args, **kwargs):
+            return self._call(name, args, kwargs)
+        return rpc
+
+
+class RpcMakerProxy(object):
+    """Stand-in for an RpcMaker of a WLC connection.
+
+    Attributes (e.g. data) are recorded and the call is passed to
+    call(proxy, args, kwargs), which gets the real RpcMaker from
+    make(connection).
+    """
+
+    def __init__(self, call, trans, *args, **kwargs):
+        self.__dict__.update(_call=call, _attrs={}, trans=trans,
+                             _args=args, _kwargs=kwargs)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_attrs'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self._attrs[name] = value
+
+    def make(self, connection):
+        maker = connection.RpcMaker(self.trans, *self._args, **self._kwargs)
+        for name, value in self._attrs.items():
+            setattr(maker, name, value)
+        return maker
+
+    def __call__(self, *args, **kwargs):
+        return self._call(self, args, kwargs)
@@ -0,0 +1,15 @@
+# coding: utf-8
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+from django.http import HttpResponse
+
+from .metrics import metrics
+
+
+def prometheus_metrics(request):
+    """RPC metrics for Prometheus, restrict access in the web server"""
+    return HttpResponse(metrics.render_prometheus(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')